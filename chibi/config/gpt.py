@@ -35,7 +35,29 @@ class GPTSettings(BaseSettings):
 
     backoff_factor: float = Field(default=0.5)
     retries: int = Field(default=3)
+    retry_max_delay: float = Field(default=20)
+    circuit_breaker_failure_threshold: int = Field(default=5, ge=1)
+    circuit_breaker_recovery_timeout: float = Field(default=30)
+
+    models_cache_ttl: int = Field(default=3600)
+    models_cache_max_stale: int = Field(default=86400)
+
+    hedge_fallback_provider: str | None = Field(default=None)
+    hedge_fallback_model: str | None = Field(default=None)
+    hedge_percentile: float = Field(default=0.95, gt=0, le=1)
+    hedge_min_samples: int = Field(default=20, ge=1)
+    hedge_default_delay: float = Field(default=30)
     timeout: int = Field(default=180)
+    adaptive_timeouts: bool = Field(default=True)
+    adaptive_timeout_factor: float = Field(default=2.0, ge=1)
+    adaptive_timeout_min: float = Field(default=20.0, gt=0)
+    adaptive_timeout_min_samples: int = Field(default=20, ge=1)
+    timeout_overrides_raw: str | None = Field(alias="TIMEOUT_OVERRIDES", default=None)
+    latency_persist_interval: int = Field(default=300)
+
+    rate_limit_rpm: int | None = Field(default=None)
+    rate_limit_tpm: int | None = Field(default=None)
+    rate_limit_max_concurrency: int = Field(default=16, ge=1)
 
     image_generations_monthly_limit: int = Field(alias="IMAGE_GENERATIONS_LIMIT", default=0)
     image_n_choices: int = Field(default=1, ge=1, le=4)
@@ -62,9 +84,25 @@ class GPTSettings(BaseSettings):
 
     moderation_provider: str | None = Field(default=None)
     moderation_model: str | None = Field(default=None)
+    moderation_fast_path: bool = Field(default=True)
+    moderation_allowlist_raw: str | None = Field(alias="MODERATION_ALLOWLIST", default=None)
+    moderation_denylist_raw: str | None = Field(alias="MODERATION_DENYLIST", default=None)
+    moderation_denied_paths_raw: str | None = Field(alias="MODERATION_DENIED_PATHS", default=None)
+    moderation_cache_ttl: int = Field(default=3600)
+    moderation_batch_window: float = Field(default=0.02)
+    moderation_batch_max_size: int = Field(default=10, ge=1)
 
     max_conversation_age_minutes: int = Field(default=360)
     max_history_tokens: int = Field(default=64000)
+    tokenizer_file: str | None = Field(default=None)
+    context_trimming: bool = Field(default=True)
+    context_reserve_tokens: int = Field(default=16000)
+    context_budgets_raw: str | None = Field(alias="CONTEXT_BUDGETS", default=None)
+    summarization_provider: str | None = Field(default=None)
+    summarization_model: str | None = Field(default=None)
+    summarization_threshold: float = Field(default=0.8, gt=0, le=1)
+    summarization_chunk_tokens: int = Field(default=16000, ge=1000)
+    summarization_keep_turns: int = Field(default=2, ge=0)
 
     image_generations_whitelist_raw: str | None = Field(alias="IMAGE_GENERATIONS_WHITELIST", default=None)
     models_whitelist_raw: str | None = Field(alias="MODELS_WHITELIST", default=None)
@@ -75,7 +113,24 @@ class GPTSettings(BaseSettings):
     filesystem_access: bool = Field(default=False)
     allow_delegation: bool = Field(default=True)
     delegate_task_timeout: int | None = Field(default=None)
+    delegate_many_max_concurrency: int = Field(default=4, ge=1)
+    sub_agent_cache: bool = Field(default=False)
+    sub_agent_cache_ttl: int = Field(default=900)
+    sub_agent_cache_size: int = Field(default=256, ge=1)
+    model_routing: bool = Field(default=True)
     tools_whitelist_raw: str | None = Field(alias="TOOLS_WHITELIST", default=None)
+    tool_selection: bool = Field(default=True)
+    tool_selection_max_tools: int = Field(default=10, ge=1)
+    tool_selection_search_limit: int = Field(default=5, ge=1)
+    tool_selection_context_messages: int = Field(default=6, ge=1)
+    tool_selection_idle_turns: int = Field(default=20, ge=0)
+    tool_selection_core_raw: str | None = Field(alias="TOOL_SELECTION_CORE", default=None)
+    tool_result_spill_threshold: int = Field(default=16384, ge=0)
+    tool_result_preview_chars: int = Field(default=1500, ge=0)
+    fetch_tool_result_max_chars: int = Field(default=12000, ge=1)
+    tool_history_pruning: bool = Field(default=True)
+    tool_history_keep_turns: int = Field(default=8, ge=1)
+    tool_history_max_bytes: int = Field(default=262144, ge=0)
 
     google_search_api_key: str | None = Field(default=None)
     google_search_cx: str | None = Field(default=None)
@@ -104,6 +159,32 @@ class GPTSettings(BaseSettings):
     def tools_whitelist(self) -> list[str]:
         return [x.strip() for x in self.tools_whitelist_raw.split(",")] if self.tools_whitelist_raw else []
 
+    @property
+    def tool_selection_core(self) -> list[str]:
+        return [x.strip() for x in self.tool_selection_core_raw.split(",")] if self.tool_selection_core_raw else []
+
+    @property
+    def moderation_allowlist(self) -> list[str]:
+        return [x.strip() for x in self.moderation_allowlist_raw.split(",")] if self.moderation_allowlist_raw else []
+
+    @property
+    def moderation_denylist(self) -> list[str]:
+        return [x.strip() for x in self.moderation_denylist_raw.split(",")] if self.moderation_denylist_raw else []
+
+    @property
+    def moderation_denied_paths(self) -> list[str]:
+        return (
+            [x.strip() for x in self.moderation_denied_paths_raw.split(",")] if self.moderation_denied_paths_raw else []
+        )
+
+    @property
+    def context_budgets(self) -> list[str]:
+        return [x.strip() for x in self.context_budgets_raw.split(",")] if self.context_budgets_raw else []
+
+    @property
+    def timeout_overrides(self) -> list[str]:
+        return [x.strip() for x in self.timeout_overrides_raw.split(",")] if self.timeout_overrides_raw else []
+
     @property
     def messages_ttl(self) -> int:
         return self.max_conversation_age_minutes * 60
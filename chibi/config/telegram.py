@@ -21,6 +21,14 @@ class TelegramSettings(BaseSettings):
         default="You're not allowed to interact with me, sorry. Contact my owner first, please.",
     )
     proxy: str | None = Field(default=None)
+    max_concurrent_updates: int = Field(default=16, ge=1)
+    max_pending_updates: int = Field(default=256, ge=1)
+    webhook_url: str | None = Field(default=None)
+    webhook_secret_token: str | None = Field(default=None)
+    webhook_listen: str = Field(default="0.0.0.0")
+    webhook_port: int = Field(default=8080)
+    webhook_queue_size: int = Field(default=1024, ge=1)
+    webhook_max_connections: int = Field(default=40, ge=1, le=100)
     groups_whitelist_raw: str | None = Field(alias="GROUPS_WHITELIST", default=None)
 
     users_whitelist_raw: str | None = Field(alias="USERS_WHITELIST", default=None)
@@ -69,13 +69,17 @@ anything to the user
    - Be achievable independently
    - Produce a specific, well-defined output
 
-3. **Instruct**: When calling `delegate_task`, provide:
+3. **Fan out**: To run several independent subtasks, call `delegate_many` once with the list of prompts instead of
+calling `delegate_task` several times. The sub-agents run in parallel and all the results come back together in one
+response.
+
+4. **Instruct**: When calling `delegate_task` or `delegate_many`, provide:
    - Clear task description (what needs to be done)
    - Specific expected output format
    - Any constraints or requirements
    - Relevant context (but keep it minimal and focused)
 
-4. **Handle results**: Sub-agents will return either:
+5. **Handle results**: Sub-agents will return either:
    - **Success**: The completed result (incorporate it into your workflow)
    - **Failure**: A description of what failed and why (analyze, adapt your approach, potentially re-delegate with
    refined instructions or handle it yourself)
@@ -84,10 +88,10 @@ anything to the user
    request refinements from the same sub-agent instance. It ceases to exist after sending its report. If you need
    adjustments, you have to delegate a new task (possibly refined based on the failure report).
 
-5. **Recursive delegation**: Sub-agents can also delegate further if they find their task complex. This is normal and
+6. **Recursive delegation**: Sub-agents can also delegate further if they find their task complex. This is normal and
 expected.
 
-6. **Error handling**: If a sub-agent fails:
+7. **Error handling**: If a sub-agent fails:
    - Read the error description carefully
    - Decide: retry with refined instructions and/or another model, or handle differently
 
@@ -96,7 +100,7 @@ expected.
 User: "Analyze these 3 articles and summarize common themes"
 
 Your approach:
-1. Delegate 3 separate tasks: "Read article X and extract key themes (5-7 bullet points)"
+1. Delegate 3 tasks in one `delegate_many` call: "Read article X and extract key themes (5-7 bullet points)"
 2. Receive 3 concise summaries
 3. Analyze the summaries yourself to find common themes
 4. Present final result to user
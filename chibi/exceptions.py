@@ -35,6 +35,9 @@ class NoResponseError(GptException): ...
 class ServiceConnectionError(GptException): ...
 
 
+class ServiceUnavailableError(GptException): ...
+
+
 class NoModelSelectedError(GptException): ...
 
 
@@ -1,38 +1,11 @@
-import asyncio
 import base64
 import binascii
-import itertools
 import json
 import time
 from datetime import datetime
 from typing import TYPE_CHECKING, Any, Literal, Optional, cast
 
-from anthropic.types import (
-    MessageParam,
-    TextBlockParam,
-    ToolResultBlockParam,
-    ToolUseBlockParam,
-)
-from google.genai.types import ContentDict, FunctionCallDict, PartDict
 from loguru import logger
-from mistralai.models import (
-    AssistantMessage as MistralAssistantMessage,
-)
-from mistralai.models import (
-    FunctionCall as MistralFunctionCall,
-)
-from mistralai.models import (
-    SystemMessage as MistralSystemMessage,
-)
-from mistralai.models import (
-    ToolCall as MistralToolCall,
-)
-from mistralai.models import (
-    ToolMessage as MistralToolMessage,
-)
-from mistralai.models import (
-    UserMessage as MistralUserMessage,
-)
 from openai.types.chat import (
     ChatCompletionAssistantMessageParam,
     ChatCompletionFunctionMessageParam,
@@ -47,8 +20,17 @@ from chibi.exceptions import (
     NoProviderSelectedError,
 )
 from chibi.schemas.app import ModelChangeSchema
+from chibi.utils.conversion import message_conversion_cache
+from chibi.utils.tokens import get_token_counter, message_tokens_cache
 
 if TYPE_CHECKING:
+    from anthropic.types import MessageParam
+    from google.genai.types import ContentDict
+    from mistralai.models import AssistantMessage as MistralAssistantMessage
+    from mistralai.models import SystemMessage as MistralSystemMessage
+    from mistralai.models import ToolMessage as MistralToolMessage
+    from mistralai.models import UserMessage as MistralUserMessage
+
     from chibi.services.providers import RegisteredProviders
     from chibi.services.providers.provider import Provider
 
@@ -59,6 +41,9 @@ CHAT_COMPLETION_CLASSES = {
     "user": ChatCompletionUserMessageParam,
 }
 
+# Message fields used by the bot only, never sent to the LLMs.
+MESSAGE_LOCAL_FIELDS = {"expire_at", "pinned", "token_count", "token_counter"}
+
 
 class FunctionSchema(BaseModel):
     id: str | None = None
@@ -105,17 +90,57 @@ class Message(BaseModel):
     tool_call_id: str | None = None
     tool_name: str | None = None
     source: str | None = None
+    pinned: bool = False
+    token_count: int | None = None
+    token_counter: str | None = None
 
     @property
     def estimate_tokens(self) -> int:
-        return (len(self.content) + len(self.role)) // 4
+        """Number of tokens the message takes in the context.
+
+        Counted once by the configured token counter, then memoized per message id and persisted with the message.
+        """
+        counter = get_token_counter()
+        if self.token_count is not None and self.token_counter == counter.name:
+            return self.token_count
+
+        count = message_tokens_cache.get(message_id=self.id, counter=counter.name)
+        if count is None:
+            tool_calls = (
+                json.dumps(
+                    [{"name": tool.function.name, "arguments": tool.function.arguments} for tool in self.tool_calls]
+                )
+                if self.tool_calls
+                else None
+            )
+            count = counter.count_message(role=self.role, content=self.content, tool_calls=tool_calls)
+            message_tokens_cache.set(message_id=self.id, counter=counter.name, count=count)
+        self.token_count, self.token_counter = count, counter.name
+        return count
+
+    def fill_token_count(self) -> None:
+        """Count the tokens (unless already counted by the configured counter), so they are saved with the message."""
+        self.token_count = self.estimate_tokens
+
+    @property
+    def conversion_fingerprint(self) -> tuple[Any, ...]:
+        """Fields the provider formats are built from: converted messages are cached until one of them changes.
+
+        Tool calls are compared by identity first, so they should be replaced rather than modified in place.
+        """
+        return self.role, self.content, self.tool_call_id, self.tool_name, self.source, self.tool_calls
 
     def to_openai(self) -> ChatCompletionMessageParam:
+        return message_conversion_cache.get_or_convert(
+            message_id=self.id, target="openai", fingerprint=self.conversion_fingerprint, convert=self._to_openai
+        )
+
+    def _to_openai(self) -> ChatCompletionMessageParam:
         wrapper_class = CHAT_COMPLETION_CLASSES.get(self.role)
         if not wrapper_class:
             raise ValueError(f"Role {self.role} seems not supported yet")
 
-        open_ai_message = wrapper_class(**self.model_dump(exclude={"expire_at"}))
+        open_ai_message = wrapper_class(**self.model_dump(exclude=MESSAGE_LOCAL_FIELDS))
         return open_ai_message
 
     @classmethod
@@ -126,7 +151,25 @@ class Message(BaseModel):
         msg.source = "openai"
         return msg
 
-    def to_anthropic(self) -> MessageParam:
+    def to_anthropic(self) -> "MessageParam":
+        return message_conversion_cache.get_or_convert(
+            message_id=self.id,
+            target="anthropic",
+            fingerprint=self.conversion_fingerprint,
+            convert=self._to_anthropic,
+            copy=self._copy_anthropic_message,
+        )
+
+    @staticmethod
+    def _copy_anthropic_message(message: "MessageParam") -> "MessageParam":
+        # The content of the messages gets marked with `cache_control`, see AnthropicCacheBreakpointPlanner.
+        # The blocks themselves are replaced with the marked copies, so only the list has to be copied.
+        content = message["content"]
+        return {"role": message["role"], "content": content if isinstance(content, str) else list(content)}
+
+    def _to_anthropic(self) -> "MessageParam":
+        from anthropic.types import MessageParam, TextBlockParam, ToolResultBlockParam, ToolUseBlockParam
+
         if self.role == "tool" and self.tool_call_id:
             return MessageParam(
                 role="user",
@@ -171,7 +214,7 @@ class Message(BaseModel):
         )
 
     @classmethod
-    def from_anthropic(cls, anthropic_message: MessageParam) -> "Message":
+    def from_anthropic(cls, anthropic_message: "MessageParam") -> "Message":
         message_content = anthropic_message["content"]
         role: Literal["user", "assistant", "tool"] = anthropic_message["role"]
         tool_call_id: str | None = None
@@ -214,8 +257,14 @@ class Message(BaseModel):
             source="anthropic",
         )
 
-    def to_google(self) -> ContentDict:
+    def to_google(self) -> "ContentDict":
         """Convert a Chibi Message to a Google AI ContentDict."""
+        return message_conversion_cache.get_or_convert(
+            message_id=self.id, target="google", fingerprint=self.conversion_fingerprint, convert=self._to_google
+        )
+
+    def _to_google(self) -> "ContentDict":
+        from google.genai.types import ContentDict, FunctionCallDict, PartDict
 
         # Google uses 'model' for the assistant's role
         google_role = "model" if self.role == "assistant" else "user"
@@ -266,7 +315,7 @@ class Message(BaseModel):
         return {"role": google_role, "parts": []}
 
     @classmethod
-    def from_google(cls, google_content: ContentDict | dict[str, Any]) -> "Message":
+    def from_google(cls, google_content: "ContentDict | dict[str, Any]") -> "Message":
         """Convert a Google AI ContentDict to a Chibi Message."""
 
         # Map Google role back to Chibi role
@@ -318,8 +367,20 @@ class Message(BaseModel):
             source="google",
         )
 
-    def to_mistral(self) -> MistralSystemMessage | MistralUserMessage | MistralAssistantMessage | MistralToolMessage:
+    def to_mistral(self) -> "MistralSystemMessage | MistralUserMessage | MistralAssistantMessage | MistralToolMessage":
         """Convert to MistralAI SDK format."""
+        return message_conversion_cache.get_or_convert(
+            message_id=self.id, target="mistral", fingerprint=self.conversion_fingerprint, convert=self._to_mistral
+        )
+
+    def _to_mistral(self) -> "MistralSystemMessage | MistralUserMessage | MistralAssistantMessage | MistralToolMessage":
+        from mistralai.models import AssistantMessage as MistralAssistantMessage
+        from mistralai.models import FunctionCall as MistralFunctionCall
+        from mistralai.models import SystemMessage as MistralSystemMessage
+        from mistralai.models import ToolCall as MistralToolCall
+        from mistralai.models import ToolMessage as MistralToolMessage
+        from mistralai.models import UserMessage as MistralUserMessage
+
         if self.role == "system":
             return MistralSystemMessage(content=self.content, role="system")
 
@@ -359,9 +420,12 @@ class Message(BaseModel):
     @classmethod
     def from_mistral(
         cls,
-        mistral_message: MistralUserMessage | MistralAssistantMessage | MistralToolMessage,
+        mistral_message: "MistralUserMessage | MistralAssistantMessage | MistralToolMessage",
     ) -> "Message":
         """Convert from MistralAI SDK format to Chibi Message."""
+        from mistralai.models import AssistantMessage as MistralAssistantMessage
+        from mistralai.models import ToolMessage as MistralToolMessage
+
         role: Literal["user", "assistant", "tool"] = mistral_message.role  # type: ignore
 
         # Extract content - handle different content types
@@ -437,6 +501,14 @@ class SelectedModel(BaseModel):
     provider_name: str
 
 
+class ToolPruningSettings(BaseModel):
+    """Per-thread overrides of the tool call history pruning settings (None means the global setting)."""
+
+    enabled: bool = True
+    keep_turns: int | None = Field(default=None, ge=1)
+    max_bytes: int | None = Field(default=None, ge=0)
+
+
 class User(BaseModel):
     id: int
     alibaba_token: str | None = gpt_settings.alibaba_key
@@ -461,6 +533,7 @@ class User(BaseModel):
     thread_selected_llm: dict[int, SelectedModel] = Field(default_factory=dict)
     thread_selected_image_model: dict[int, SelectedModel] = Field(default_factory=dict)
     thread_names: dict[int, str] = Field(default_factory=dict)
+    thread_tool_pruning: dict[int, ToolPruningSettings] = Field(default_factory=dict)
 
     def __init__(self, **kwargs: Any) -> None:
         if kwargs.get("gpt_model", None) and not kwargs.get("selected_gpt_model_name", None):
@@ -471,7 +544,7 @@ class User(BaseModel):
     def providers(self) -> "RegisteredProviders":
         from chibi.services.providers import RegisteredProviders
 
-        return RegisteredProviders(user_api_keys={name.lower(): key for name, key in self.tokens.items()})
+        return RegisteredProviders.for_user_keys(user_api_keys={name.lower(): key for name, key in self.tokens.items()})
 
     def get_active_image_provider(self, thread_id: int) -> "Provider":
         provider_name: str | None = None
@@ -591,11 +664,11 @@ class User(BaseModel):
         return None
 
     async def get_available_models(self, image_generation: bool = False) -> list[ModelChangeSchema]:
-        providers = self.providers.available_instances
-        tasks = [provider.get_available_models(image_generation=image_generation) for provider in providers]
-        results = await asyncio.gather(*tasks)
+        from chibi.services.providers.catalogue import ModelCatalogue
 
-        return list(itertools.chain.from_iterable(results))
+        return await ModelCatalogue().get_models(
+            providers=self.providers.available_instances, image_generation=image_generation
+        )
 
     @property
     def has_reached_image_limits(self) -> bool:
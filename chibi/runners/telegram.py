@@ -1,3 +1,4 @@
+import asyncio
 import json
 from typing import TypeVar
 
@@ -43,7 +44,9 @@ from chibi.services.bot import (
 )
 from chibi.services.interface import TelegramInterface
 from chibi.services.providers import RegisteredProviders
+from chibi.services.providers.latency import LatencyRegistry
 from chibi.services.task_manager import task_manager
+from chibi.services.update_processor import ChatOrderedUpdateProcessor
 from chibi.storage.files.telegram_storage import TelegramFileStorage
 from chibi.utils.app import log_application_settings, run_heartbeat
 from chibi.utils.telegram import (
@@ -233,25 +236,19 @@ class ChibiBot:
             photo_meta_dict["file_name"] = file_name
             photo_meta_dict["mime_type"] = "image/jpeg"
             file_id = await storage.save(file_metadata=photo_meta_dict)
-            if vision_result := await handle_image_understanding(
-                interface=interface,
-                storage=storage,
-                file_id=file_id,
-                mime_type="image/jpeg",
-            ):
-                photo_meta_dict["full_description"] = vision_result.full_description
-                photo_meta_dict["short_description"] = vision_result.short_description
-                photo_meta_dict["text"] = vision_result.text
-                await storage.save(file_metadata=photo_meta_dict)
-
-                caption = {
-                    "user_caption": message.caption or "no data",
-                    "photo_short_desc": vision_result.short_description,
-                    "file_id": file_id,
-                }
-                interface.set_caption(json.dumps(caption))
-
             logger.info(f"{interface.user_data}-{interface.chat_data}: Photo '{file_name}' successfully uploaded.")
+            # The vision call is slow: the update processing must not wait for it.
+            task_manager.run_task(
+                coro=self._describe_photo(
+                    interface=interface,
+                    storage=storage,
+                    photo_meta=photo_meta_dict,
+                    file_id=file_id,
+                    user_caption=message.caption,
+                ),
+                user_id=interface.user_id,
+            )
+            return None
 
         if await interface.get_caption():
             task_manager.run_task(
@@ -260,6 +257,36 @@ class ChibiBot:
             )
         return None
 
+    async def _describe_photo(
+        self,
+        interface: TelegramInterface,
+        storage: TelegramFileStorage,
+        photo_meta: dict,
+        file_id: str,
+        user_caption: str | None,
+    ) -> None:
+        """Describe the uploaded photo with the vision model, then pass it to the LLM along with the user caption."""
+        if vision_result := await handle_image_understanding(
+            interface=interface,
+            storage=storage,
+            file_id=file_id,
+            mime_type="image/jpeg",
+        ):
+            photo_meta["full_description"] = vision_result.full_description
+            photo_meta["short_description"] = vision_result.short_description
+            photo_meta["text"] = vision_result.text
+            await storage.save(file_metadata=photo_meta)
+
+            caption = {
+                "user_caption": user_caption or "no data",
+                "photo_short_desc": vision_result.short_description,
+                "file_id": file_id,
+            }
+            interface.set_caption(json.dumps(caption))
+
+        if await interface.get_caption():
+            await handle_user_prompt(interface=interface)
+
     @check_user_allowance
     async def document_uploaded(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None: ...
 
@@ -711,6 +738,11 @@ class ChibiBot:
                 ]
             )
         await application.bot.set_my_commands(self.commands)
+        await LatencyRegistry().load()
+
+    async def post_shutdown(self, application: Application) -> None:
+        await LatencyRegistry().persist()
+        await task_manager.shutdown()
 
     def run(self) -> None:
         builder = (
@@ -719,11 +751,19 @@ class ChibiBot:
             .base_file_url(telegram_settings.telegram_base_file_url)
             .token(self.telegram_token)
             .post_init(self.post_init)
-            .post_shutdown(task_manager.shutdown)
+            .post_shutdown(self.post_shutdown)
+            .concurrent_updates(
+                ChatOrderedUpdateProcessor(
+                    max_concurrent_updates=telegram_settings.max_concurrent_updates,
+                    max_pending_updates=telegram_settings.max_pending_updates,
+                )
+            )
         )
 
         if telegram_settings.proxy:
             builder = builder.proxy(telegram_settings.proxy).get_updates_proxy(telegram_settings.proxy)
+        if telegram_settings.webhook_url:
+            builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=telegram_settings.webhook_queue_size))
         app = builder.build()
 
         if not application_settings.hide_imagine:
@@ -787,7 +827,13 @@ class ChibiBot:
                     interval=application_settings.heartbeat_frequency_call,
                     first=0.0,
                 )
-        app.run_polling()
+
+        if telegram_settings.webhook_url:
+            from chibi.services.webhook import run_webhook
+
+            asyncio.run(run_webhook(application=app))
+        else:
+            app.run_polling()
 
 
 def run_chibi():
@@ -14,6 +14,7 @@ from prompt_toolkit.key_binding import KeyBindings
 from rich.console import Console
 
 from chibi.services.bot import handle_image_generation, handle_user_prompt
+from chibi.services.providers.latency import LatencyRegistry
 from chibi.services.task_manager import task_manager
 from chibi.services.terminal_interface import TerminalInterface
 from chibi.services.user import get_info, get_models_available, reset_chat_history, set_active_model
@@ -311,8 +312,12 @@ async def run_chibi(user_id: int = 1) -> None:
     except Exception as e:
         logger.warning(f"Could not log application settings: {e}")
 
+    await LatencyRegistry().load()
     runner = TerminalRunner(user_id=user_id)
-    await runner.run()
+    try:
+        await runner.run()
+    finally:
+        await LatencyRegistry().persist()
 
 
 def main() -> None:
@@ -54,6 +54,14 @@ class ModeratorsAnswer(BaseModel):
     reason: str | None = None
 
 
+class ModeratorsBatchVerdict(ModeratorsAnswer):
+    id: int
+
+
+class ModeratorsBatchAnswer(BaseModel):
+    verdicts: list[ModeratorsBatchVerdict]
+
+
 class VisionResultSchema(BaseModel):
     short_description: str = Field(description="Image short description, up to 100 characters")
     full_description: str = Field(description="Image full description")
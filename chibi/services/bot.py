@@ -153,9 +153,11 @@ async def handle_user_prompt(interface: UserInterface) -> None:
         f"the {interface.chat_data}. {logged_answer} {usage_message}"
     )
     await interface.send_message(message=chat_response.answer)
-    history_is_summarized = await check_history_and_summarize(user_id=interface.user_id, thread_id=interface.thread_id)
-    if history_is_summarized:
-        logger.info(f"{interface.user_data}: history successfully summarized.")
+    summarization_scheduled = await check_history_and_summarize(
+        user_id=interface.user_id, thread_id=interface.thread_id
+    )
+    if summarization_scheduled:
+        logger.info(f"{interface.user_data}: history summarization scheduled.")
     return None
 
 
@@ -1,15 +1,17 @@
+from __future__ import annotations
+
 import asyncio
 from contextlib import AsyncExitStack
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable
 
 from loguru import logger
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.types import CallToolResult
 
 from chibi.services.task_manager import task_manager
 
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from mcp.types import CallToolResult
+
 
 class MCPManager:
     """Manages the lifecycle of MCP server connections and sessions.
@@ -34,6 +36,8 @@ class MCPManager:
         init_timeout: float,
     ) -> None:
         """Lifecycle manager for an MCP session running in a background task."""
+        from mcp import ClientSession
+
         async with AsyncExitStack() as stack:
             try:
                 # Initialize transport
@@ -92,6 +96,9 @@ class MCPManager:
 
             logger.log("TOOL", f"Connecting to MCP server '{name}' via stdio: {command} {' '.join(args)}")
 
+            from mcp import StdioServerParameters
+            from mcp.client.stdio import stdio_client
+
             async def stdio_factory(stack: AsyncExitStack):
                 server_params = StdioServerParameters(command=command, args=args, env=env)
                 return await stack.enter_async_context(stdio_client(server_params))
@@ -142,6 +149,8 @@ class MCPManager:
 
             logger.log("TOOL", f"Connecting to MCP server '{name}' via SSE: {url}")
 
+            from mcp.client.sse import sse_client
+
             async def sse_factory(stack: AsyncExitStack):
                 return await stack.enter_async_context(sse_client(url))
 
@@ -1,3 +1,5 @@
+from typing import TYPE_CHECKING, Any
+
 from influxdb_client import Point
 from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 from loguru import logger
@@ -7,6 +9,9 @@ from chibi.models import User
 from chibi.schemas.app import MetricTagsSchema, UsageSchema
 from chibi.services.task_manager import task_manager
 
+if TYPE_CHECKING:
+    from chibi.services.providers.tools.moderation import ModerationDecision
+
 
 class MetricsService:
     @classmethod
@@ -24,7 +29,10 @@ class MetricsService:
     @classmethod
     async def _send_to_influx(cls, metric: UsageSchema, tags: MetricTagsSchema) -> None:
         point = cls._prepare_point(metric=metric, tags=tags)
+        await cls._write_point(point=point)
 
+    @classmethod
+    async def _write_point(cls, point: Point) -> None:
         try:
             assert application_settings.influxdb_url
             assert application_settings.influxdb_token
@@ -52,3 +60,44 @@ class MetricsService:
             model=model,
         )
         task_manager.run_task(coro=cls._send_to_influx(metric=metric, tags=tags), user_id=-1)
+
+    @classmethod
+    def send_rate_limiter_metrics(cls, limiter: str, wait_time: float, queue_depth: int, stats: dict[str, Any]) -> None:
+        if not application_settings.is_influx_configured:
+            return None
+        point = Point("rate_limiter").tag("limiter", limiter)
+        point.field("wait_time", float(wait_time))
+        point.field("queue_depth", int(queue_depth))
+        point.field("in_flight", int(stats.get("in_flight", 0)))
+        point.field("concurrency_limit", float(stats.get("concurrency_limit", 0)))
+        task_manager.run_task(coro=cls._write_point(point=point), user_id=-1)
+
+    @classmethod
+    def send_circuit_breaker_metrics(cls, stats: dict[str, Any]) -> None:
+        if not application_settings.is_influx_configured:
+            return None
+        point = Point("circuit_breaker").tag("provider", stats["provider"]).tag("model", stats["model"])
+        point.tag("state", stats["state"])
+        point.field("consecutive_failures", int(stats["consecutive_failures"]))
+        point.field("retries_count", int(stats["retries_count"]))
+        point.field("rejected_count", int(stats["rejected_count"]))
+        task_manager.run_task(coro=cls._write_point(point=point), user_id=-1)
+
+    @classmethod
+    def send_moderation_metrics(cls, decision: "ModerationDecision", stats: dict[str, Any]) -> None:
+        if not application_settings.is_influx_configured:
+            return None
+        point = Point("moderation").tag("source", decision.source).tag("moderator", decision.moderator)
+        point.tag("verdict", decision.answer.verdict)
+        point.field("latency", float(decision.latency))
+        point.field("cache_hit_rate", float(stats["cache_hit_rate"]))
+        task_manager.run_task(coro=cls._write_point(point=point), user_id=-1)
+
+    @classmethod
+    def send_tool_metrics(cls, tool_name: str, wait_time: float, run_time: float, status: str) -> None:
+        if not application_settings.is_influx_configured:
+            return None
+        point = Point("tool_call").tag("tool", tool_name).tag("status", status)
+        point.field("wait_time", float(wait_time))
+        point.field("run_time", float(run_time))
+        task_manager.run_task(coro=cls._write_point(point=point), user_id=-1)
@@ -1,18 +1,34 @@
 # flake8: noqa: F401
 
-from chibi.services.providers.alibaba import Alibaba
-from chibi.services.providers.anthropic import Anthropic
-from chibi.services.providers.cloudflare import Cloudflare
-from chibi.services.providers.customopenai import CustomOpenAI
-from chibi.services.providers.deepseek import DeepSeek
-from chibi.services.providers.eleven_labs import ElevenLabs
-from chibi.services.providers.gemini_native import Gemini
-from chibi.services.providers.grok import Grok
-from chibi.services.providers.minimax import Minimax
-from chibi.services.providers.mistralai_native import MistralAI
-from chibi.services.providers.moonshotai import MoonshotAI
-from chibi.services.providers.open_router import OpenRouter
-from chibi.services.providers.openai import OpenAI
-from chibi.services.providers.provider import RegisteredProviders
-from chibi.services.providers.suno import Suno
-from chibi.services.providers.zhipuai import ZhipuAI
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from chibi.services.providers.provider import PROVIDER_MODULES, Provider, RegisteredProviders
+
+if TYPE_CHECKING:
+    from chibi.services.providers.alibaba import Alibaba
+    from chibi.services.providers.anthropic import Anthropic
+    from chibi.services.providers.cloudflare import Cloudflare
+    from chibi.services.providers.customopenai import CustomOpenAI
+    from chibi.services.providers.deepseek import DeepSeek
+    from chibi.services.providers.eleven_labs import ElevenLabs
+    from chibi.services.providers.gemini_native import Gemini
+    from chibi.services.providers.grok import Grok
+    from chibi.services.providers.minimax import Minimax
+    from chibi.services.providers.mistralai_native import MistralAI
+    from chibi.services.providers.moonshotai import MoonshotAI
+    from chibi.services.providers.open_router import OpenRouter
+    from chibi.services.providers.openai import OpenAI
+    from chibi.services.providers.suno import Suno
+    from chibi.services.providers.zhipuai import ZhipuAI
+
+RegisteredProviders.load()
+
+
+def __getattr__(name: str) -> type[Provider]:
+    """Import the provider module on the first access to its class, i.e. `from chibi.services.providers import Suno`."""
+    if name not in PROVIDER_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, _ = PROVIDER_MODULES[name]
+    provider: type[Provider] = getattr(import_module(module), name)
+    return provider
@@ -1,7 +1,7 @@
 import base64
 from typing import Literal, cast
 
-from anthropic import AsyncClient
+from anthropic import AsyncClient, DefaultAsyncHttpxClient
 from anthropic.types import (
     Base64ImageSourceParam,
     Base64PDFSourceParam,
@@ -47,7 +47,10 @@ class Anthropic(AnthropicFriendlyProvider):
         if not self.token:
             raise NoApiKeyProvidedError(provider=self.name)
 
-        self._client = AsyncClient(api_key=self.token)
+        self._client = AsyncClient(
+            api_key=self.token,
+            http_client=DefaultAsyncHttpxClient(event_hooks=self.httpx_event_hooks),
+        )
         return self._client
 
     @client.setter
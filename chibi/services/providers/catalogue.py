@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from chibi.config import application_settings, gpt_settings
+from chibi.schemas.app import ModelChangeSchema
+from chibi.services.task_manager import task_manager
+from chibi.utils.app import SingletonMeta, hash_api_key
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+    from chibi.services.providers.provider import Provider
+
+CatalogueKey = tuple[str, str, bool]
+
+# Empty lists are usually caused by a provider error, so they are not trusted for long.
+EMPTY_RESULT_TTL = 60
+# The entry is refreshed in the background once it is older than this share of the TTL.
+REFRESH_AHEAD_RATIO = 0.8
+
+
+@dataclass
+class CatalogueEntry:
+    models: list[ModelChangeSchema]
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    @property
+    def ttl(self) -> float:
+        return gpt_settings.models_cache_ttl if self.models else EMPTY_RESULT_TTL
+
+
+class ModelCatalogue(metaclass=SingletonMeta):
+    """Process-wide cache of the provider model lists, keyed by (provider, API key hash, image generation).
+
+    Users sharing the same API key (or the bot-wide keys) share the same entry, so the providers are called once per
+    key instead of once per user. The entries are served stale-while-revalidate: an entry older than
+    `REFRESH_AHEAD_RATIO * models_cache_ttl` is returned as is while a background task refreshes it, and
+    only an entry older than `models_cache_max_stale` (or a missing one) blocks the caller. If Redis is configured,
+    the catalogue is persisted there, so restarts and other replicas start warm.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[CatalogueKey, CatalogueEntry] = {}
+        self._inflight: dict[CatalogueKey, asyncio.Future[CatalogueEntry]] = {}
+        self._redis: "Redis | None" = None
+
+    @staticmethod
+    def _get_key(provider: "Provider", image_generation: bool) -> CatalogueKey:
+        return provider.name, hash_api_key(provider.token), image_generation
+
+    @staticmethod
+    def _get_redis_key(key: CatalogueKey) -> str:
+        provider_name, key_hash, image_generation = key
+        return f"chibi:models:{provider_name}:{key_hash}:{'image' if image_generation else 'chat'}"
+
+    async def _get_redis(self) -> "Redis | None":
+        if not application_settings.redis:
+            return None
+        if self._redis is None:
+            from redis.asyncio import from_url
+
+            self._redis = from_url(application_settings.redis)
+        return self._redis
+
+    async def _load_persisted(self, key: CatalogueKey) -> CatalogueEntry | None:
+        try:
+            if not (redis := await self._get_redis()):
+                return None
+            if not (raw := await redis.get(self._get_redis_key(key))):
+                return None
+            data = json.loads(raw)
+            return CatalogueEntry(
+                models=[ModelChangeSchema.model_validate(model) for model in data["models"]],
+                fetched_at=data["fetched_at"],
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load the model catalogue entry {key[0]} from Redis: {e!r}")
+            return None
+
+    async def _persist(self, key: CatalogueKey, entry: CatalogueEntry) -> None:
+        try:
+            if not (redis := await self._get_redis()):
+                return None
+            data: dict[str, Any] = {
+                "models": [model.model_dump() for model in entry.models],
+                "fetched_at": entry.fetched_at,
+            }
+            await redis.set(self._get_redis_key(key), json.dumps(data), ex=gpt_settings.models_cache_max_stale)
+        except Exception as e:
+            logger.warning(f"Failed to persist the model catalogue entry {key[0]} to Redis: {e!r}")
+
+    async def _fetch(self, key: CatalogueKey, provider: "Provider") -> CatalogueEntry:
+        models = await provider.get_available_models(image_generation=key[2])
+        previous = self._entries.get(key)
+        if not models and previous and previous.models:
+            # Keep serving the last known list, but retry soon.
+            logger.warning(f"[{provider.name}] Got no models, keeping the cached list for a while.")
+            entry = CatalogueEntry(
+                models=previous.models, fetched_at=time.time() - gpt_settings.models_cache_ttl + EMPTY_RESULT_TTL
+            )
+        else:
+            entry = CatalogueEntry(models=models)
+        self._entries[key] = entry
+        if entry.models:
+            await self._persist(key=key, entry=entry)
+        return entry
+
+    def _refresh(self, key: CatalogueKey, provider: "Provider") -> "asyncio.Future[CatalogueEntry]":
+        """Start fetching the entry unless it is already being fetched (concurrent callers share the request)."""
+        if future := self._inflight.get(key):
+            return future
+        future = asyncio.ensure_future(self._fetch(key=key, provider=provider))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+
+    async def _refresh_in_background(self, key: CatalogueKey, provider: "Provider") -> None:
+        try:
+            await self._refresh(key=key, provider=provider)
+        except Exception as e:
+            logger.error(f"[{provider.name}] Failed to refresh the model catalogue in the background: {e!r}")
+
+    async def get_provider_models(
+        self, provider: "Provider", image_generation: bool = False
+    ) -> list[ModelChangeSchema]:
+        """Get the provider models from the catalogue.
+
+        Args:
+            provider: Provider instance (its API key is a part of the cache key).
+            image_generation: Whether to get image generation models.
+
+        Returns:
+            Models list.
+        """
+        key = self._get_key(provider=provider, image_generation=image_generation)
+        entry = self._entries.get(key)
+        if entry is None and (entry := await self._load_persisted(key)):
+            self._entries[key] = entry
+
+        if entry is None or entry.age >= max(gpt_settings.models_cache_max_stale, entry.ttl):
+            return (await self._refresh(key=key, provider=provider)).models
+
+        if entry.age >= entry.ttl * REFRESH_AHEAD_RATIO and key not in self._inflight:
+            task_manager.run_task(coro=self._refresh_in_background(key=key, provider=provider), user_id=-1)
+        return entry.models
+
+    async def get_models(self, providers: list["Provider"], image_generation: bool = False) -> list[ModelChangeSchema]:
+        """Get the models of all the given providers.
+
+        Args:
+            providers: Provider instances.
+            image_generation: Whether to get image generation models.
+
+        Returns:
+            Models list (in the order of the providers).
+        """
+        results = await asyncio.gather(
+            *(self.get_provider_models(provider=provider, image_generation=image_generation) for provider in providers)
+        )
+        return list(itertools.chain.from_iterable(results))
+
+    def invalidate(self, provider_name: str | None = None) -> None:
+        """Drop the in-memory entries (of the given provider or all of them)."""
+        for key in list(self._entries):
+            if provider_name is None or key[0] == provider_name:
+                del self._entries[key]
@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.models import Message
+
+
+@dataclass(frozen=True)
+class ModelBudget:
+    """Context budget of a model.
+
+    Attributes:
+        context_window: Total context window size, tokens.
+        max_output: Maximal answer size, tokens.
+    """
+
+    context_window: int
+    max_output: int
+
+    @property
+    def input_budget(self) -> int:
+        """Tokens available for the conversation history (the rest is reserved for the answer, the system prompt
+        and the tool definitions)."""
+        reserved = min(self.max_output, gpt_settings.max_tokens) + gpt_settings.context_reserve_tokens
+        return max(self.context_window - reserved, self.context_window // 4)
+
+
+# Model name fragments and their budgets. The first matching fragment wins, so more specific ones go first.
+MODEL_BUDGETS: tuple[tuple[str, ModelBudget], ...] = (
+    ("gpt-4.1", ModelBudget(context_window=1_047_576, max_output=32_768)),
+    ("gpt-5", ModelBudget(context_window=400_000, max_output=128_000)),
+    ("gpt-4o", ModelBudget(context_window=128_000, max_output=16_384)),
+    ("o1", ModelBudget(context_window=200_000, max_output=100_000)),
+    ("o3", ModelBudget(context_window=200_000, max_output=100_000)),
+    ("o4", ModelBudget(context_window=200_000, max_output=100_000)),
+    ("claude", ModelBudget(context_window=200_000, max_output=64_000)),
+    ("gemini", ModelBudget(context_window=1_048_576, max_output=65_536)),
+    ("grok-4", ModelBudget(context_window=256_000, max_output=64_000)),
+    ("grok", ModelBudget(context_window=131_072, max_output=32_768)),
+    ("deepseek", ModelBudget(context_window=128_000, max_output=8_192)),
+    ("kimi", ModelBudget(context_window=256_000, max_output=32_768)),
+    ("moonshot", ModelBudget(context_window=128_000, max_output=32_768)),
+    ("qwen", ModelBudget(context_window=128_000, max_output=8_192)),
+    ("glm", ModelBudget(context_window=128_000, max_output=16_384)),
+    ("minimax", ModelBudget(context_window=1_000_000, max_output=40_000)),
+    ("codestral", ModelBudget(context_window=256_000, max_output=32_768)),
+    ("mistral", ModelBudget(context_window=128_000, max_output=32_768)),
+    ("magistral", ModelBudget(context_window=128_000, max_output=32_768)),
+)
+# Max answer size of the CONTEXT_BUDGETS items given without one, tokens.
+DEFAULT_MAX_OUTPUT = 4_096
+# Compacted tool results get the ID of the original message with this bit flipped: the ID is stable across requests
+# (so the token count and conversion caches stay warm) and apart from the real IDs (time_ns) and their negations (the
+# pruned copies).
+COMPACTED_ID_BIT = 1 << 62
+
+# Tool results longer than this are compacted before whole turns are dropped.
+COMPACT_TOOL_RESULT_TOKENS = 1000
+COMPACTED_TOOL_RESULT_CHARS = 1500
+# The most recent turns are never compacted.
+KEEP_RECENT_TURNS = 2
+
+
+def _get_configured_budgets() -> list[tuple[str, ModelBudget]]:
+    """Parse the `CONTEXT_BUDGETS` setting: `model_fragment=context_window[:max_output],...`."""
+    budgets: list[tuple[str, ModelBudget]] = []
+    for item in gpt_settings.context_budgets:
+        try:
+            fragment, value = item.split("=", 1)
+            context_window, _, max_output = value.partition(":")
+            budgets.append(
+                (
+                    fragment.strip().lower(),
+                    ModelBudget(
+                        context_window=int(context_window),
+                        max_output=int(max_output) if max_output else DEFAULT_MAX_OUTPUT,
+                    ),
+                )
+            )
+        except ValueError:
+            logger.error(f"Invalid CONTEXT_BUDGETS item: '{item}'. Expected 'model=context_window[:max_output]'.")
+    return budgets
+
+
+def get_model_budget(model: str) -> ModelBudget | None:
+    """Get the context budget of the model (the `CONTEXT_BUDGETS` setting takes precedence over the built-in table).
+
+    Args:
+        model: Model name.
+
+    Returns:
+        Model budget, or None if the model is unknown: its history is not trimmed, as guessing too small a window
+        would silently drop the history (set its budget with `CONTEXT_BUDGETS`).
+    """
+    model_name = model.lower()
+    for fragment, budget in [*_get_configured_budgets(), *MODEL_BUDGETS]:
+        if fragment in model_name:
+            return budget
+    return None
+
+
+def split_into_turns(messages: list[Message]) -> list[list[Message]]:
+    """Split the conversation into turns: a user message and everything the assistant (and tools) answered.
+
+    A turn is always kept or dropped as a whole, so the tool calls never lose their results (and vice versa).
+    """
+    turns: list[list[Message]] = []
+    for message in messages:
+        if message.role == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _compact_tool_result(message: Message) -> Message:
+    content = message.content[:COMPACTED_TOOL_RESULT_CHARS]
+    return message.model_copy(
+        update={
+            "id": message.id ^ COMPACTED_ID_BIT,
+            "content": f"{content}\n...[the rest of the tool result ({message.estimate_tokens} tokens) was trimmed]",
+            "token_count": None,
+            "token_counter": None,
+        }
+    )
+
+
+def fit_messages(messages: list[Message], budget: ModelBudget) -> list[Message]:
+    """Fit the conversation into the model context window.
+
+    The oldest tool results are compacted first, then the oldest turns are dropped, until the history fits the
+    input budget. Turns containing pinned messages and the latest turn are always kept. The messages themselves are
+    not modified (compacted messages are copies), so the stored history stays intact.
+
+    Args:
+        messages: Conversation messages (the latest one is the new user message).
+        budget: Context budget of the model.
+
+    Returns:
+        Messages to send to the model.
+    """
+    limit = budget.input_budget
+    total = sum(message.estimate_tokens for message in messages)
+    if total <= limit:
+        return messages
+
+    turns = split_into_turns(messages)
+    original_total = total
+
+    for turn in turns[:-KEEP_RECENT_TURNS]:
+        if total <= limit:
+            break
+        for i, message in enumerate(turn):
+            if message.role == "tool" and not message.pinned and message.estimate_tokens > COMPACT_TOOL_RESULT_TOKENS:
+                compacted = _compact_tool_result(message)
+                total -= message.estimate_tokens - compacted.estimate_tokens
+                turn[i] = compacted
+
+    dropped = 0
+    for i, turn in enumerate(turns[:-1]):
+        if total <= limit:
+            break
+        if any(message.pinned for message in turn):
+            continue
+        total -= sum(message.estimate_tokens for message in turn)
+        turns[i] = []
+        dropped += 1
+
+    logger.info(
+        f"Conversation trimmed from {original_total} to {total} tokens ({dropped} turns dropped) "
+        f"to fit the {limit} tokens budget."
+    )
+    if total > limit:
+        logger.warning(f"Conversation still exceeds the context budget: {total} > {limit} tokens.")
+    return [message for turn in turns for message in turn]
@@ -1,9 +1,7 @@
-import asyncio
 import io
 import math
 import random
 import wave
-from asyncio import sleep
 from copy import copy
 from io import BytesIO
 from typing import Any
@@ -33,20 +31,32 @@ from google.genai.types import (
     VoiceConfig,
 )
 from loguru import logger
+from openai.types.chat import ChatCompletionToolParam
+from pydantic import BaseModel
 
 from chibi.config import application_settings, gpt_settings
 from chibi.exceptions import NoResponseError, NotAuthorizedError, ServiceRateLimitError, ServiceResponseError
 from chibi.models import Message, User
-from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema, ModeratorsAnswer, VisionResultSchema
+from chibi.schemas.app import (
+    ChatResponseSchema,
+    ModelChangeSchema,
+    ModeratorsAnswer,
+    ModeratorsBatchAnswer,
+    VisionResultSchema,
+)
 from chibi.services.interface import UserInterface
 from chibi.services.metrics import MetricsService
+from chibi.services.providers.prompt_cache import estimate_payload_tokens
 from chibi.services.providers.provider import RestApiFriendlyProvider
 from chibi.services.providers.tools import RegisteredChibiTools
-from chibi.services.providers.tools.constants import MODERATOR_PROMPT
+from chibi.services.providers.tools.constants import MODERATOR_BATCH_PROMPT, MODERATOR_PROMPT
 from chibi.services.providers.tools.schemas import ToolCallSchema
+from chibi.services.providers.tools.selection import select_tools
 from chibi.services.providers.utils import (
+    get_moderation_batch_content,
     get_usage_from_google_response,
     get_usage_msg,
+    parse_moderation_batch_answer,
     prepare_system_prompt,
     send_llm_thoughts,
 )
@@ -94,33 +104,37 @@ class Gemini(RestApiFriendlyProvider):
     def __init__(self, token: str) -> None:
         super().__init__(token=token)
 
+    @staticmethod
+    def _convert_tool_definition(tool: ChatCompletionToolParam) -> Tool:
+        try:
+            return Tool(
+                function_declarations=[
+                    FunctionDeclaration(
+                        name=str(tool["function"]["name"]),
+                        description=str(tool["function"]["description"]),
+                        parameters=tool["function"]["parameters"],
+                    )
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Failed to register tool {tool['function']['name']} due to exception: {e}")
+            import pprint
+
+            pprint.pprint(tool)
+            raise
+
     @property
     def tools_list(self) -> list[Tool]:
         """Convert our tools format to Google's Tool format.
 
+        The converted list is memoized in the tools registry and rebuilt only when the registry changes.
+
         Returns:
             Tools list in Google's Tool format.
         """
-        google_tools = []
-        for tool in RegisteredChibiTools.get_tool_definitions():
-            try:
-                google_tool = Tool(
-                    function_declarations=[
-                        FunctionDeclaration(
-                            name=str(tool["function"]["name"]),
-                            description=str(tool["function"]["description"]),
-                            parameters=tool["function"]["parameters"],
-                        )
-                    ]
-                )
-            except Exception as e:
-                logger.error(f"Failed to register tool {tool['function']['name']} due to exception: {e}")
-                import pprint
-
-                pprint.pprint(tool)
-                raise
-            google_tools.append(google_tool)
-        return google_tools
+        return RegisteredChibiTools.get_tool_definitions_snapshot(
+            format_name="google", converter=self._convert_tool_definition
+        ).definitions
 
     def _get_text(self, response: GenerateContentResponse) -> str | None:
         if not response.candidates or not response.candidates[0].content or not response.candidates[0].content.parts:
@@ -182,47 +196,45 @@ class Gemini(RestApiFriendlyProvider):
             return None
         return retry_delay
 
+    def _get_retry_after(self, error: BaseException) -> float | None:
+        if isinstance(error, APIError) and (retry_delay := self._get_retry_delay(error.details)):
+            return retry_delay + random.uniform(0.5, 2.5)
+        return super()._get_retry_after(error)
+
     async def _generate_content(
         self, model: str, contents: ContentListUnion | ContentListUnionDict, config: GenerateContentConfig
     ) -> GenerateContentResponse:
-        for attempt in range(gpt_settings.retries):
+        async def send_request() -> GenerateContentResponse:
+            http_options = HttpOptions(httpx_async_client=self.get_async_httpx_client())
             try:
-                async with Client(api_key=gpt_settings.gemini_key).aio as client:
+                async with Client(api_key=gpt_settings.gemini_key, http_options=http_options).aio as client:
                     response: GenerateContentResponse = await client.models.generate_content(
                         model=model,
                         contents=contents,
                         config=config,
                     )
-                answer = self._get_text(response)
-                if answer is not None or response.function_calls:
-                    return response
-                if answer is None and response.model_version == self.default_tts_model:
-                    return response
             except APIError as err:
                 logger.error(f"Gemini API error: {err.message}")
+                if err.code == 429 and not self._get_retry_delay(err.details):
+                    raise ServiceRateLimitError(provider=self.name, model=model, detail=err.details)
+                raise
 
-                if err.code == 429:
-                    retry_delay = self._get_retry_delay(err.details)
-                    if not retry_delay:
-                        raise ServiceRateLimitError(provider=self.name, model=model, detail=err.details)
-                    await asyncio.sleep(retry_delay + random.uniform(0.5, 2.5))
-                    continue
-
-                elif err.code == 403:
-                    raise NotAuthorizedError(provider=self.name, model=model, detail=err.details)
-
-                else:
-                    raise ServiceResponseError(provider=self.name, model=model, detail=err.details)
-
-            delay = gpt_settings.backoff_factor * (2**attempt)
-            jitter = delay * random.uniform(0.1, 0.5)
-            total_delay = delay + jitter
+            answer = self._get_text(response)
+            if answer is not None or response.function_calls:
+                return response
+            if answer is None and response.model_version == self.default_tts_model:
+                return response
+            raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
 
-            logger.warning(
-                f"Attempt #{attempt + 1}. Unexpected (empty) response received. Retrying in {total_delay} seconds..."
-            )
-            await sleep(total_delay)
-        raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
+        try:
+            return await self._call_resilient(send_request, model=model, tokens=estimate_payload_tokens(contents))
+        except APIError as err:
+            if err.code == 429:
+                raise ServiceRateLimitError(provider=self.name, model=model, detail=err.details)
+            elif err.code == 403:
+                raise NotAuthorizedError(provider=self.name, model=model, detail=err.details)
+            else:
+                raise ServiceResponseError(provider=self.name, model=model, detail=err.details)
 
     async def _get_chat_completion_response(
         self,
@@ -348,9 +360,14 @@ class Gemini(RestApiFriendlyProvider):
         model = model or self.default_model
         initial_messages = [msg.to_google() for msg in messages]
 
-        chat_response, updated_messages = await self._get_chat_completion_response(
-            messages=initial_messages.copy(), user=user, model=model, system_prompt=system_prompt, interface=interface
-        )
+        with select_tools(messages=messages, user=user, interface=interface):
+            chat_response, updated_messages = await self._get_chat_completion_response(
+                messages=initial_messages.copy(),
+                user=user,
+                model=model,
+                system_prompt=system_prompt,
+                interface=interface,
+            )
 
         new_messages = [msg for msg in updated_messages if msg not in initial_messages]
         return chat_response, [Message.from_google(msg) for msg in new_messages]
@@ -400,10 +417,9 @@ class Gemini(RestApiFriendlyProvider):
         generation_config = GenerateImagesConfig(
             aspect_ratio=gpt_settings.image_aspect_ratio,
             number_of_images=gpt_settings.image_n_choices,
-            http_options=http_options,
             image_size=image_size,
         )
-        async with Client(api_key=gpt_settings.gemini_key).aio as client:
+        async with Client(api_key=gpt_settings.gemini_key, http_options=http_options).aio as client:
             response: GenerateImagesResponse = await client.models.generate_images(
                 model=model,
                 prompt=prompt,
@@ -413,35 +429,47 @@ class Gemini(RestApiFriendlyProvider):
 
             return [image for image in images_in_response if image]
 
-    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
-        moderator_model = model or self.default_moderation_model or self.default_model
-
+    async def _get_moderator_response(
+        self, system_prompt: str, content: str, model: str, response_schema: type[BaseModel], max_tokens: int
+    ) -> str | None:
         http_options = HttpOptions(httpx_async_client=self.get_async_httpx_client())
         generation_config = GenerateContentConfig(
-            system_instruction=MODERATOR_PROMPT,
+            system_instruction=system_prompt,
             temperature=0.1,
-            max_output_tokens=1024,
+            max_output_tokens=max_tokens,
             presence_penalty=self.presence_penalty,
             frequency_penalty=self.frequency_penalty,
             http_options=http_options,
-            response_schema=ModeratorsAnswer,
+            response_schema=response_schema,
         )
         messages = [
-            Message(role="user", content=cmd).to_google(),
+            Message(role="user", content=content).to_google(),
         ]
         response: GenerateContentResponse = await self._generate_content(
-            model=moderator_model,
+            model=model,
             contents=messages,
             config=generation_config,
         )
         answer = self._get_text(response)
         if not answer:
-            return ModeratorsAnswer(verdict="declined", reason="no moderator answer received", status="error")
+            return None
 
-        answer = answer.strip("```").strip("json").strip()
         usage = get_usage_from_google_response(response_message=response)
         if application_settings.is_influx_configured:
-            MetricsService.send_usage_metrics(metric=usage, model=moderator_model, provider=self.name)
+            MetricsService.send_usage_metrics(metric=usage, model=model, provider=self.name)
+        return answer.strip("```").strip("json").strip()
+
+    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_PROMPT,
+            content=cmd,
+            model=moderator_model,
+            response_schema=ModeratorsAnswer,
+            max_tokens=1024,
+        )
+        if not answer:
+            return ModeratorsAnswer(verdict="declined", reason="no moderator answer received", status="error")
 
         try:
             return ModeratorsAnswer.model_validate_json(answer)
@@ -449,6 +477,19 @@ class Gemini(RestApiFriendlyProvider):
             logger.error(f"Error parsing moderator's response: {answer}. Error: {e}")
             return ModeratorsAnswer(verdict="declined", reason=answer, status="error")
 
+    async def moderate_commands(self, cmds: list[str], model: str | None = None) -> list[ModeratorsAnswer]:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_BATCH_PROMPT,
+            content=get_moderation_batch_content(cmds),
+            model=moderator_model,
+            response_schema=ModeratorsBatchAnswer,
+            max_tokens=1024 + 256 * len(cmds),
+        )
+        if not answer:
+            raise ValueError("No moderator's batch response received")
+        return parse_moderation_batch_answer(answer=answer, count=len(cmds))
+
     async def get_images(self, prompt: str, model: str | None = None) -> list[BytesIO]:
         selected_model = model or self.default_image_model
 
@@ -483,8 +524,9 @@ class Gemini(RestApiFriendlyProvider):
         return super().get_model_display_name(model_name=model_name[7:])
 
     async def get_available_models(self, image_generation: bool = False) -> list[ModelChangeSchema]:
+        http_options = HttpOptions(httpx_async_client=self.get_async_httpx_client())
         try:
-            async with Client(api_key=gpt_settings.gemini_key).aio as aclient:
+            async with Client(api_key=gpt_settings.gemini_key, http_options=http_options).aio as aclient:
                 models = await aclient.models.list()
         except Exception as e:
             logger.error(f"Failed to get available models for provider {self.name} due to exception: {e}")
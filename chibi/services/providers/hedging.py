@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Coroutine, TypeVar
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.services.providers.latency import LatencyRegistry
+
+if TYPE_CHECKING:
+    from chibi.services.providers.provider import Provider
+
+T = TypeVar("T")
+
+
+class HedgeRace:
+    """A race between the primary and the hedged (fallback) chat requests.
+
+    Both contenders may talk to their LLMs concurrently, but only one of them may cause side effects (tool calls,
+    messages sent to the user). The first contender claiming the race wins it, the rest are cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.winner: str | None = None
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    def start(self, contender: str, coro: Coroutine[Any, Any, T]) -> "asyncio.Task[T]":
+        context = contextvars.copy_context()
+        context.run(_current_contender.set, (self, contender))
+        task = asyncio.create_task(coro, context=context)
+        self.tasks[contender] = task
+        return task
+
+    def claim(self, contender: str) -> None:
+        """Make the contender the winner (or make sure it already is).
+
+        Args:
+            contender: Contender name.
+
+        Raises:
+            asyncio.CancelledError: if another contender has already won the race.
+        """
+        if self.winner is None:
+            self.winner = contender
+            for name, task in self.tasks.items():
+                if name != contender:
+                    task.cancel()
+            return None
+        if self.winner != contender:
+            raise asyncio.CancelledError()
+
+
+_current_contender: ContextVar[tuple[HedgeRace, str] | None] = ContextVar("hedge_contender", default=None)
+
+
+def claim_hedged_request() -> None:
+    """Claim the hedge race before causing any side effect. No-op outside of a hedged request.
+
+    Raises:
+        asyncio.CancelledError: if the current request has lost the race.
+    """
+    if current := _current_contender.get():
+        race, contender = current
+        race.claim(contender)
+
+
+def get_hedge_delay(provider: str, model: str) -> float:
+    """Get the time to wait for the primary provider before firing the hedged request.
+
+    Args:
+        provider: Primary provider name.
+        model: Primary model name.
+
+    Returns:
+        Observed latency percentile (p95 by default) or the default delay if there are not enough samples yet.
+    """
+    histogram = LatencyRegistry().get(provider=provider, model=model)
+    if histogram.count < gpt_settings.hedge_min_samples:
+        return gpt_settings.hedge_default_delay
+    return histogram.percentile(gpt_settings.hedge_percentile) or gpt_settings.hedge_default_delay
+
+
+async def get_hedged_chat_response(
+    primary: "Provider",
+    primary_model: str,
+    fallback: "Provider",
+    fallback_model: str,
+    **kwargs: Any,
+) -> Any:
+    """Get the chat response, hedging the request with the fallback provider if the primary one is slow.
+
+    If the primary provider has not answered within its observed latency percentile, the same request is sent to
+    the fallback provider, and the first successful answer wins. Only the first round is hedged: as soon as one of
+    the contenders is about to call tools (or to send its thoughts to the user), it claims the race and the other
+    one is cancelled, so side effects never happen twice.
+
+    Args:
+        primary: Primary provider.
+        primary_model: Primary model name.
+        fallback: Fallback provider.
+        fallback_model: Fallback model name.
+        **kwargs: `get_chat_response` arguments.
+
+    Returns:
+        The `get_chat_response` result of the winner.
+    """
+    race = HedgeRace()
+    primary_task = race.start("primary", primary.get_chat_response(model=primary_model, **kwargs))
+    delay = get_hedge_delay(provider=primary.name, model=primary_model)
+
+    done, _ = await asyncio.wait({primary_task}, timeout=delay)
+    if done or race.winner:
+        return await primary_task
+
+    logger.warning(
+        f"{primary.name} ({primary_model}) has not answered in {delay:.1f}s. "
+        f"Hedging the request with {fallback.name} ({fallback_model})..."
+    )
+    fallback_task = race.start("fallback", fallback.get_chat_response(model=fallback_model, **kwargs))
+    contenders = {primary_task: "primary", fallback_task: "fallback"}
+
+    pending: set[asyncio.Task] = {primary_task, fallback_task}
+    first_error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if error := task.exception():
+                    logger.error(f"Hedged request to the {contenders[task]} provider failed: {error!r}")
+                    first_error = first_error or error
+                    continue
+                if race.winner is None:
+                    race.claim(contenders[task])
+                logger.info(f"The {contenders[task]} provider won the hedged request.")
+                return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    assert first_error is not None
+    raise first_error
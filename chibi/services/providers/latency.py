@@ -0,0 +1,193 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from chibi.config import application_settings, gpt_settings
+from chibi.services.task_manager import task_manager
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+LATENCY_REDIS_KEY = "chibi:latency_histograms"
+LATENCY_FILE_NAME = "latency_histograms.json"
+
+
+class LatencyHistogram:
+    """Sliding window of the latest request latencies."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    @property
+    def samples(self) -> list[float]:
+        return list(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def restore(self, samples: list[float]) -> None:
+        """Put the persisted samples before the recorded ones (the oldest are dropped if the window is full)."""
+        recorded = list(self._samples)
+        self._samples.clear()
+        self._samples.extend([*samples, *recorded])
+
+    def percentile(self, q: float) -> float | None:
+        """Get the latency percentile (nearest-rank method).
+
+        Args:
+            q: Percentile in the 0..1 range, i.e. 0.95 for p95.
+
+        Returns:
+            Latency in seconds or None if there are no samples yet.
+        """
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        rank = max(math.ceil(q * len(samples)) - 1, 0)
+        return samples[min(rank, len(samples) - 1)]
+
+
+def _get_timeout_overrides() -> list[tuple[str, str | None, float]]:
+    """Parse the `TIMEOUT_OVERRIDES` setting: `model_fragment[:operation]=seconds,...`."""
+    overrides: list[tuple[str, str | None, float]] = []
+    for item in gpt_settings.timeout_overrides:
+        try:
+            target, value = item.split("=", 1)
+            fragment, _, operation = target.partition(":")
+            overrides.append((fragment.strip().lower(), operation.strip() or None, float(value)))
+        except ValueError:
+            logger.error(f"Invalid TIMEOUT_OVERRIDES item: '{item}'. Expected 'model[:operation]=seconds'.")
+    return overrides
+
+
+class LatencyRegistry(metaclass=SingletonMeta):
+    """Process-wide latency histograms, one per (provider, model, operation).
+
+    The histograms define the adaptive request timeouts and are persisted (to Redis if configured, to the local data
+    directory otherwise), so the timeouts survive restarts.
+    """
+
+    def __init__(self) -> None:
+        self._histograms: dict[tuple[str, str, str], LatencyHistogram] = {}
+        self._persisted_at = time.monotonic()
+        self._redis: "Redis | None" = None
+
+    def get(self, provider: str, model: str, operation: str = "chat") -> LatencyHistogram:
+        key = (provider, model, operation)
+        if histogram := self._histograms.get(key):
+            return histogram
+        histogram = LatencyHistogram()
+        self._histograms[key] = histogram
+        return histogram
+
+    def record(self, provider: str, model: str, seconds: float, operation: str = "chat") -> None:
+        self.get(provider=provider, model=model, operation=operation).record(seconds)
+        if time.monotonic() - self._persisted_at >= gpt_settings.latency_persist_interval:
+            self._persisted_at = time.monotonic()
+            task_manager.run_task(self.persist(), user_id=-1)
+
+    def get_timeout(self, provider: str, model: str, default: float, operation: str = "chat") -> float:
+        """Get the request timeout for the model.
+
+        The `TIMEOUT_OVERRIDES` setting takes precedence. Otherwise, once there are enough samples, the timeout is the
+        observed p99 latency multiplied by `ADAPTIVE_TIMEOUT_FACTOR`, but not lower than `ADAPTIVE_TIMEOUT_MIN` and
+        not higher than the default one.
+
+        Args:
+            provider: Provider name.
+            model: Model name.
+            default: Default (and maximal) timeout, seconds.
+            operation: Operation name.
+
+        Returns:
+            Timeout, seconds.
+        """
+        model_name = model.lower()
+        for fragment, override_operation, seconds in _get_timeout_overrides():
+            if fragment in model_name and override_operation in (None, operation):
+                return seconds
+
+        if not gpt_settings.adaptive_timeouts:
+            return default
+        histogram = self._histograms.get((provider, model, operation))
+        if not histogram or histogram.count < gpt_settings.adaptive_timeout_min_samples:
+            return default
+        p99 = histogram.percentile(0.99) or default
+        return min(max(p99 * gpt_settings.adaptive_timeout_factor, gpt_settings.adaptive_timeout_min), default)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                "operation": operation,
+                "count": histogram.count,
+                "p50": histogram.percentile(0.5),
+                "p95": histogram.percentile(0.95),
+            }
+            for (provider, model, operation), histogram in self._histograms.items()
+        ]
+
+    def dump(self) -> list[dict[str, Any]]:
+        return [
+            {"provider": provider, "model": model, "operation": operation, "samples": histogram.samples}
+            for (provider, model, operation), histogram in self._histograms.items()
+            if histogram.count
+        ]
+
+    def restore(self, data: list[dict[str, Any]]) -> None:
+        """Restore the persisted histograms (the samples recorded since the start are kept as the latest ones)."""
+        for item in data:
+            histogram = self.get(provider=item["provider"], model=item["model"], operation=item["operation"])
+            histogram.restore([float(seconds) for seconds in item["samples"]])
+
+    async def _get_redis(self) -> "Redis | None":
+        if not application_settings.redis:
+            return None
+        if self._redis is None:
+            from redis.asyncio import from_url
+
+            self._redis = from_url(application_settings.redis)
+        return self._redis
+
+    @staticmethod
+    def _get_file_path() -> Path:
+        return Path(application_settings.local_data_path) / LATENCY_FILE_NAME
+
+    async def load(self) -> None:
+        """Load the persisted histograms."""
+        try:
+            if redis := await self._get_redis():
+                raw = await redis.get(LATENCY_REDIS_KEY)
+            else:
+                path = self._get_file_path()
+                raw = await asyncio.to_thread(path.read_text) if path.exists() else None
+            if raw:
+                self.restore(json.loads(raw))
+                logger.info(f"Latency histograms loaded: {len(self._histograms)} models.")
+        except Exception as e:
+            logger.warning(f"Failed to load the latency histograms: {e!r}")
+
+    async def persist(self) -> None:
+        """Persist the histograms."""
+        try:
+            raw = json.dumps(self.dump())
+            if redis := await self._get_redis():
+                await redis.set(LATENCY_REDIS_KEY, raw)
+            else:
+                path = self._get_file_path()
+                await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+                await asyncio.to_thread(path.write_text, raw)
+        except Exception as e:
+            logger.warning(f"Failed to persist the latency histograms: {e!r}")
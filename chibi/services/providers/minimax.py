@@ -1,4 +1,4 @@
-from anthropic import AsyncClient
+from anthropic import AsyncClient, DefaultAsyncHttpxClient
 from loguru import logger
 
 from chibi.config import gpt_settings
@@ -44,7 +44,11 @@ class Minimax(AnthropicFriendlyProvider):
         if not self.token:
             raise NoApiKeyProvidedError(provider=self.name)
 
-        self._client = AsyncClient(api_key=self.token, base_url=self.base_url)
+        self._client = AsyncClient(
+            api_key=self.token,
+            base_url=self.base_url,
+            http_client=DefaultAsyncHttpxClient(event_hooks=self.httpx_event_hooks),
+        )
         return self._client
 
     async def get_available_models(self, image_generation: bool = False) -> list[ModelChangeSchema]:
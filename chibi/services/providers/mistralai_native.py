@@ -1,9 +1,8 @@
 import base64
 import json
-import random
-from asyncio import sleep
-from typing import Union
+from typing import Any, Union
 
+import httpx
 from loguru import logger
 from mistralai import ChatCompletionResponse, JSONSchemaTypedDict, Mistral, ResponseFormatTypedDict, TextChunk
 from mistralai.models import (
@@ -23,13 +22,17 @@ from chibi.models import Message, User
 from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema, ModeratorsAnswer, VisionResultSchema
 from chibi.services.interface import UserInterface
 from chibi.services.metrics import MetricsService
+from chibi.services.providers.prompt_cache import estimate_payload_tokens
 from chibi.services.providers.provider import RestApiFriendlyProvider, ServiceResponseError
 from chibi.services.providers.tools import RegisteredChibiTools
-from chibi.services.providers.tools.constants import MODERATOR_PROMPT
+from chibi.services.providers.tools.constants import MODERATOR_BATCH_PROMPT, MODERATOR_PROMPT
 from chibi.services.providers.tools.schemas import ToolCallSchema
+from chibi.services.providers.tools.selection import select_tools
 from chibi.services.providers.utils import (
+    get_moderation_batch_content,
     get_usage_from_mistral_response,
     get_usage_msg,
+    parse_moderation_batch_answer,
     prepare_system_prompt,
     send_llm_thoughts,
 )
@@ -62,7 +65,7 @@ class MistralAI(RestApiFriendlyProvider):
 
     @property
     def tools_list(self) -> list[ChatCompletionToolParam]:
-        """Return tools in OpenAI-compatible format (which Mistral uses)."""
+        """Return tools in OpenAI-compatible format (which Mistral uses), memoized in the tools registry."""
         return RegisteredChibiTools.get_tool_definitions()
 
     @property
@@ -73,7 +76,10 @@ class MistralAI(RestApiFriendlyProvider):
         if not self.token:
             raise NoApiKeyProvidedError(provider=self.name)
 
-        self._client = Mistral(api_key=self.token)
+        self._client = Mistral(
+            api_key=self.token,
+            async_client=httpx.AsyncClient(follow_redirects=True, event_hooks=self.httpx_event_hooks),
+        )
         return self._client
 
     def get_thoughts(self, assistant_message: AssistantMessage) -> str | None:
@@ -96,9 +102,11 @@ class MistralAI(RestApiFriendlyProvider):
         model: str,
         messages: list[MistralMessageParam],
     ) -> ChatCompletionResponse:
-        """Generate content with retry logic."""
-        for attempt in range(gpt_settings.retries):
-            response = await self.client.chat.complete_async(
+        """Generate content through the shared retry policy and circuit breaker."""
+        client = self.client
+
+        async def send_request() -> ChatCompletionResponse:
+            response = await client.chat.complete_async(
                 model=model,
                 messages=messages,
                 max_tokens=self.max_tokens,
@@ -107,19 +115,11 @@ class MistralAI(RestApiFriendlyProvider):
                 tool_choice="auto",
                 http_headers={"Cache-Control": "max-age=86400"},
             )
+            if not response or not response.choices:
+                raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
+            return response
 
-            if response.choices and len(response.choices) > 0:
-                return response
-
-            delay = gpt_settings.backoff_factor * (2**attempt)
-            jitter = delay * random.uniform(0.1, 0.5)
-            total_delay = delay + jitter
-
-            logger.warning(
-                f"Attempt #{attempt + 1}. Unexpected (empty) response received. Retrying in {total_delay} seconds..."
-            )
-            await sleep(total_delay)
-        raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
+        return await self._call_resilient(send_request, model=model, tokens=estimate_payload_tokens(messages))
 
     async def get_chat_response(
         self,
@@ -131,9 +131,14 @@ class MistralAI(RestApiFriendlyProvider):
     ) -> tuple[ChatResponseSchema, list[Message]]:
         model = model or self.default_model
         initial_messages = [msg.to_mistral() for msg in messages]
-        chat_response, updated_messages = await self._get_chat_completion_response(
-            messages=initial_messages.copy(), user=user, model=model, system_prompt=system_prompt, interface=interface
-        )
+        with select_tools(messages=messages, user=user, interface=interface):
+            chat_response, updated_messages = await self._get_chat_completion_response(
+                messages=initial_messages.copy(),
+                user=user,
+                model=model,
+                system_prompt=system_prompt,
+                interface=interface,
+            )
         new_messages = [msg for msg in updated_messages if msg not in initial_messages]
         return (
             chat_response,
@@ -232,54 +237,93 @@ class MistralAI(RestApiFriendlyProvider):
             interface=interface,
         )
 
-    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
-        moderator_model = model or self.default_moderation_model or self.default_model
+    async def _get_moderator_response(
+        self, system_prompt: str, content: str, model: str, schema_name: str, schema: dict[str, Any], max_tokens: int
+    ) -> str | None:
         messages = [
-            SystemMessage(content=MODERATOR_PROMPT, role="system"),
-            Message(role="user", content=cmd).to_mistral(),
+            SystemMessage(content=system_prompt, role="system"),
+            Message(role="user", content=content).to_mistral(),
         ]
         response = await self.client.chat.complete_async(
-            model=moderator_model,
+            model=model,
             messages=messages,
-            max_tokens=1024,
+            max_tokens=max_tokens,
             temperature=0.2,
             response_format=ResponseFormatTypedDict(
                 type="json_schema",
-                json_schema=JSONSchemaTypedDict(
-                    name="moderator_verdict",
-                    schema_definition={
-                        "type": "object",
-                        "properties": {
-                            "verdict": {"type": "string"},
-                            "reason": {"type": "string"},
-                            "status": {"type": "string", "default": "ok"},
-                        },
-                        "required": ["verdict"],
-                    },
-                    strict=True,
-                ),
+                json_schema=JSONSchemaTypedDict(name=schema_name, schema_definition=schema, strict=True),
             ),
         )
         if not response.choices:
-            return ModeratorsAnswer(status="error", verdict="declined", reason="no response from moderator received")
+            return None
 
         usage = get_usage_from_mistral_response(response_message=response)
 
         if application_settings.is_influx_configured:
-            MetricsService.send_usage_metrics(metric=usage, model=moderator_model, provider=self.name)
+            MetricsService.send_usage_metrics(metric=usage, model=model, provider=self.name)
 
-        message_data = response.choices[0].message
-        answer = message_data.content
+        answer = response.choices[0].message.content
+        return answer if isinstance(answer, str) else None
+
+    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_PROMPT,
+            content=cmd,
+            model=moderator_model,
+            schema_name="moderator_verdict",
+            schema={
+                "type": "object",
+                "properties": {
+                    "verdict": {"type": "string"},
+                    "reason": {"type": "string"},
+                    "status": {"type": "string", "default": "ok"},
+                },
+                "required": ["verdict"],
+            },
+            max_tokens=1024,
+        )
         if not answer:
             return ModeratorsAnswer(status="error", verdict="declined", reason="no response from moderator received")
 
         try:
-            return ModeratorsAnswer.model_validate_json(answer, extra="ignore")  # type: ignore
+            return ModeratorsAnswer.model_validate_json(answer, extra="ignore")
         except Exception as e:
             msg = f"Error parsing moderator's response: {answer}. Error: {e}"
             logger.error(msg)
             return ModeratorsAnswer(verdict="declined", reason=msg, status="error")
 
+    async def moderate_commands(self, cmds: list[str], model: str | None = None) -> list[ModeratorsAnswer]:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_BATCH_PROMPT,
+            content=get_moderation_batch_content(cmds),
+            model=moderator_model,
+            schema_name="moderator_verdicts",
+            schema={
+                "type": "object",
+                "properties": {
+                    "verdicts": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "integer"},
+                                "verdict": {"type": "string"},
+                                "reason": {"type": "string"},
+                            },
+                            "required": ["id", "verdict"],
+                        },
+                    },
+                },
+                "required": ["verdicts"],
+            },
+            max_tokens=1024 + 256 * len(cmds),
+        )
+        if not answer:
+            raise ValueError("No moderator's batch response received")
+        return parse_moderation_batch_answer(answer=answer, count=len(cmds))
+
     async def vision(
         self,
         image: bytes,
@@ -0,0 +1,228 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Literal, Sequence
+
+from anthropic.types import CacheControlEphemeralParam, MessageParam, TextBlockParam, ToolParam
+
+ANTHROPIC_MAX_CACHE_BREAKPOINTS = 4
+
+BreakpointTarget = Literal["tools", "system", "history", "tool_results"]
+
+
+def estimate_payload_tokens(payload: Any) -> int:
+    """Roughly estimate the number of tokens a request fragment will take.
+
+    Uses the cheap "4 characters per token" heuristic applied to the JSON representation of the payload: the
+    payload is rebuilt for every request, and the estimate only has to be good enough to place the breakpoints.
+
+    Args:
+        payload: Any JSON-serializable request fragment (tool definition, content block, message, etc).
+
+    Returns:
+        Estimated number of tokens.
+    """
+    if isinstance(payload, str):
+        return len(payload) // 4
+    return len(json.dumps(payload, default=str, ensure_ascii=False)) // 4
+
+
+def get_min_cacheable_tokens(model: str) -> int:
+    """Get the minimal prompt prefix length (in tokens) the Anthropic API is ready to cache for the model.
+
+    Args:
+        model: Model name.
+
+    Returns:
+        Minimal cacheable prefix length.
+    """
+    if "haiku" in model.lower():
+        return 2048
+    return 1024
+
+
+@dataclass
+class CacheBreakpointPlan:
+    """Breakpoints chosen for a single request.
+
+    Attributes:
+        tools: Whether the last tool definition should be marked.
+        system: Whether the system prompt block should be marked.
+        message_indexes: Indexes of the messages whose last content block should be marked.
+        prefix_tokens: Estimated size of the cached prefix for every placed breakpoint.
+    """
+
+    tools: bool = False
+    system: bool = False
+    message_indexes: list[int] = field(default_factory=list)
+    prefix_tokens: dict[BreakpointTarget, int] = field(default_factory=dict)
+
+    @property
+    def breakpoints_count(self) -> int:
+        return int(self.tools) + int(self.system) + len(self.message_indexes)
+
+
+class AnthropicCacheBreakpointPlanner:
+    """Distributes the Anthropic `cache_control` breakpoints over the request.
+
+    The API allows up to 4 breakpoints per request. The prompt prefix is evaluated in the order
+    tools -> system -> messages, so the planner considers the following candidates:
+
+    1. the last tool definition (tools rarely change, while the system prompt is regenerated on each round);
+    2. the system prompt;
+    3. the rolling history tail - the last message before the newest user prompt, i.e. the part of the
+       conversation that has already been sent during the previous turn;
+    4. the latest tool results - the last message of the growing tool-loop transcript, so the next round
+       of the loop reads the whole previous round from the cache.
+
+    A candidate gets a breakpoint only if the estimated prefix it closes is long enough to be cached
+    and adds a meaningful amount of tokens on top of the previous breakpoint.
+    """
+
+    def __init__(self, min_cacheable_tokens: int = 1024, min_segment_tokens: int | None = None) -> None:
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.min_segment_tokens = min_segment_tokens if min_segment_tokens is not None else min_cacheable_tokens // 4
+
+    @classmethod
+    def for_model(cls, model: str) -> "AnthropicCacheBreakpointPlanner":
+        return cls(min_cacheable_tokens=get_min_cacheable_tokens(model))
+
+    @staticmethod
+    def _is_tool_result_message(message: MessageParam) -> bool:
+        content = message.get("content")
+        if not isinstance(content, list):
+            return False
+        return any(isinstance(block, dict) and block.get("type") == "tool_result" for block in content)
+
+    @classmethod
+    def find_history_tail(cls, messages: Sequence[MessageParam]) -> int | None:
+        """Find the index of the last message sent during the previous turns.
+
+        The newest user prompt is the last `user` message that is not a tool result: everything before it
+        is the stable conversation history.
+
+        Args:
+            messages: Conversation messages in Anthropic format.
+
+        Returns:
+            Index of the history tail message or None if there is no history yet.
+        """
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            if message["role"] == "user" and not cls._is_tool_result_message(message):
+                return index - 1 if index > 0 else None
+        return None
+
+    def plan(
+        self,
+        tools: Sequence[ToolParam],
+        system: Sequence[TextBlockParam],
+        messages: Sequence[MessageParam],
+        tools_tokens: int | None = None,
+    ) -> CacheBreakpointPlan:
+        plan = CacheBreakpointPlan()
+
+        history_tail = self.find_history_tail(messages)
+        latest_tool_results: int | None = None
+        if messages and self._is_tool_result_message(messages[-1]):
+            latest_tool_results = len(messages) - 1
+
+        messages_tokens = [estimate_payload_tokens(message.get("content")) for message in messages]
+
+        def messages_prefix(index: int) -> int:
+            return sum(messages_tokens[: index + 1])
+
+        if tools_tokens is None:
+            tools_tokens = estimate_payload_tokens(list(tools)) if tools else 0
+        system_tokens = estimate_payload_tokens(list(system)) if system else 0
+
+        candidates: list[tuple[BreakpointTarget, int, int | None]] = []
+        if tools:
+            candidates.append(("tools", tools_tokens, None))
+        if system:
+            candidates.append(("system", tools_tokens + system_tokens, None))
+        if history_tail is not None and history_tail != latest_tool_results:
+            candidates.append(("history", tools_tokens + system_tokens + messages_prefix(history_tail), history_tail))
+        if latest_tool_results is not None:
+            candidates.append(
+                (
+                    "tool_results",
+                    tools_tokens + system_tokens + messages_prefix(latest_tool_results),
+                    latest_tool_results,
+                )
+            )
+
+        last_placed_prefix = 0
+        for target, prefix_tokens, message_index in candidates:
+            if plan.breakpoints_count >= ANTHROPIC_MAX_CACHE_BREAKPOINTS:
+                break
+            if prefix_tokens < self.min_cacheable_tokens:
+                continue
+            # The latest tool results are always worth a breakpoint: the next round re-sends the whole prefix.
+            if target != "tool_results" and prefix_tokens - last_placed_prefix < self.min_segment_tokens:
+                continue
+
+            if target == "tools":
+                plan.tools = True
+            elif target == "system":
+                plan.system = True
+            else:
+                assert message_index is not None
+                plan.message_indexes.append(message_index)
+            plan.prefix_tokens[target] = prefix_tokens
+            last_placed_prefix = prefix_tokens
+        return plan
+
+    @staticmethod
+    def strip(messages: Sequence[MessageParam]) -> None:
+        """Remove breakpoints left in the messages by the previous rounds of the tool loop.
+
+        Args:
+            messages: Conversation messages in Anthropic format (modified in place).
+        """
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for block in content:
+                if isinstance(block, dict):
+                    block.pop("cache_control", None)
+
+    def apply(
+        self,
+        tools: list[ToolParam],
+        system: list[TextBlockParam],
+        messages: list[MessageParam],
+        tools_tokens: int | None = None,
+    ) -> tuple[list[ToolParam], list[TextBlockParam], CacheBreakpointPlan]:
+        """Plan the breakpoints and put them into the request.
+
+        Tools and system blocks are copied before marking (tool definitions may be shared between requests).
+        Marked message content blocks are replaced with marked copies in the message content lists (the blocks
+        may be shared with the cached conversions of the messages).
+
+        Args:
+            tools: Tool definitions in Anthropic format.
+            system: System prompt blocks.
+            messages: Conversation messages in Anthropic format.
+            tools_tokens: Precomputed tools size estimation (computed from the tools if not provided).
+
+        Returns:
+            Marked tools, marked system blocks and the applied plan.
+        """
+        self.strip(messages)
+        plan = self.plan(tools=tools, system=system, messages=messages, tools_tokens=tools_tokens)
+        cache_control = CacheControlEphemeralParam(type="ephemeral")
+
+        if plan.tools:
+            tools = [*tools[:-1], ToolParam(**{**tools[-1], "cache_control": cache_control})]
+
+        if plan.system:
+            system = [*system[:-1], TextBlockParam(**{**system[-1], "cache_control": cache_control})]
+
+        for index in plan.message_indexes:
+            content = messages[index].get("content")
+            if isinstance(content, str):
+                messages[index]["content"] = [TextBlockParam(type="text", text=content, cache_control=cache_control)]
+            elif isinstance(content, list) and content and isinstance(content[-1], dict):
+                content[-1] = {**content[-1], "cache_control": cache_control}
+        return tools, system, plan
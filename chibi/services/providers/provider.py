@@ -2,10 +2,11 @@ import asyncio
 import base64
 import inspect
 import json
-import random
+import time
 from abc import ABC
-from asyncio import sleep
+from collections import OrderedDict
 from functools import wraps
+from importlib import import_module
 from io import BytesIO
 from typing import Any, Awaitable, Callable, Generic, Literal, Optional, ParamSpec, TypeVar, cast
 from urllib.parse import urljoin
@@ -13,7 +14,9 @@ from urllib.parse import urljoin
 import httpx
 from anthropic import AsyncClient, NotGiven, Omit
 from anthropic.types import (
-    CacheControlEphemeralParam,
+    Message as AnthropicMessage,
+)
+from anthropic.types import (
     MessageParam,
     TextBlock,
     TextBlockParam,
@@ -22,9 +25,6 @@ from anthropic.types import (
     ToolResultBlockParam,
     ToolUseBlock,
 )
-from anthropic.types import (
-    Message as AnthropicMessage,
-)
 from anthropic.types.tool_param import InputSchemaTyped
 from httpx import Response
 from httpx._types import QueryParamTypes, RequestData
@@ -33,6 +33,7 @@ from openai import (
     APIConnectionError,
     AsyncOpenAI,
     AuthenticationError,
+    DefaultAsyncHttpxClient,
     OpenAIError,
     RateLimitError,
     omit,
@@ -46,6 +47,7 @@ from openai.types.chat import (
     ChatCompletionMessageToolCall,
     ChatCompletionSystemMessageParam,
     ChatCompletionToolMessageParam,
+    ChatCompletionToolParam,
 )
 from openai.types.chat.chat_completion import ChatCompletion, Choice
 
@@ -64,34 +66,136 @@ from chibi.models import Message, User
 from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema, ModeratorsAnswer, VisionResultSchema
 from chibi.services.interface import UserInterface
 from chibi.services.metrics import MetricsService
+from chibi.services.providers.hedging import claim_hedged_request
+from chibi.services.providers.latency import LatencyRegistry
+from chibi.services.providers.prompt_cache import AnthropicCacheBreakpointPlanner, estimate_payload_tokens
+from chibi.services.providers.rate_limiter import (
+    AdaptiveRateLimiter,
+    RateLimiterRegistry,
+    get_retry_after_from_error,
+)
+from chibi.services.providers.resilience import (
+    RETRY_POLICIES,
+    CircuitBreakerRegistry,
+    ErrorClass,
+    classify_error,
+    sleep_before_retry,
+)
+from chibi.services.providers.routing import ModelRouter, get_output_tokens
 from chibi.services.providers.tools import RegisteredChibiTools
-from chibi.services.providers.tools.constants import MODERATOR_PROMPT
+from chibi.services.providers.tools.constants import MODERATOR_BATCH_PROMPT, MODERATOR_PROMPT
+from chibi.services.providers.tools.scheduler import ToolCallBatch, current_tool_call_batch
 from chibi.services.providers.tools.schemas import ToolCallSchema, ToolResponseSchema
+from chibi.services.providers.tools.selection import select_tools
+from chibi.services.providers.tools.tool import ToolDefinitionsSnapshot
 from chibi.services.providers.utils import (
+    get_moderation_batch_content,
     get_usage_from_anthropic_response,
     get_usage_from_openai_response,
     get_usage_msg,
+    parse_moderation_batch_answer,
     prepare_system_prompt,
     send_llm_thoughts,
 )
 
 P = ParamSpec("P")
 R = TypeVar("R")
+T = TypeVar("T")
+
+# Provider class name -> (module, API key setting). The provider modules (and their SDKs) are imported on demand: on
+# start only the configured providers are loaded (all of them in the public mode, where users bring their own keys).
+PROVIDER_MODULES: dict[str, tuple[str, str]] = {
+    "Alibaba": ("chibi.services.providers.alibaba", "alibaba_key"),
+    "Anthropic": ("chibi.services.providers.anthropic", "anthropic_key"),
+    "Cloudflare": ("chibi.services.providers.cloudflare", "cloudflare_key"),
+    "CustomOpenAI": ("chibi.services.providers.customopenai", "customopenai_key"),
+    "DeepSeek": ("chibi.services.providers.deepseek", "deepseek_key"),
+    "ElevenLabs": ("chibi.services.providers.eleven_labs", "elevenlabs_api_key"),
+    "Gemini": ("chibi.services.providers.gemini_native", "gemini_key"),
+    "Grok": ("chibi.services.providers.grok", "grok_key"),
+    "Minimax": ("chibi.services.providers.minimax", "minimax_api_key"),
+    "MistralAI": ("chibi.services.providers.mistralai_native", "mistralai_key"),
+    "MoonshotAI": ("chibi.services.providers.moonshotai", "moonshotai_key"),
+    "OpenRouter": ("chibi.services.providers.open_router", "open_router_key"),
+    "OpenAI": ("chibi.services.providers.openai", "openai_key"),
+    "Suno": ("chibi.services.providers.suno", "suno_key"),
+    "ZhipuAI": ("chibi.services.providers.zhipuai", "zhipuai_key"),
+}
 
 
 class RegisteredProviders:
     all: dict[str, type["Provider"]] = {}
     available: dict[str, type["Provider"]] = {}
 
+    # Provider instances (and their SDK clients) are reused by all the users sharing the same API key.
+    max_cached_instances: int = 256
+    _instances: OrderedDict[tuple[str, str], "Provider"] = OrderedDict()
+    _registries: OrderedDict[frozenset[tuple[str, str]], "RegisteredProviders"] = OrderedDict()
+
     def __init__(self, user_api_keys: dict[str, str] | None = None) -> None:
         self.tokens = {} if not user_api_keys else user_api_keys
         if gpt_settings.public_mode:
+            self.load(all_providers=True)
             self.available: dict[str, type["Provider"]] = {
                 provider.name.lower(): provider
                 for provider in RegisteredProviders.all.values()
                 if provider.name in self.tokens
             }
 
+    @staticmethod
+    def _get_key_set(user_api_keys: dict[str, str] | None) -> frozenset[tuple[str, str]]:
+        # Outside of the public mode the bot-wide keys are used, so all the users share the same registry.
+        if not gpt_settings.public_mode or not user_api_keys:
+            return frozenset()
+        return frozenset(user_api_keys.items())
+
+    @classmethod
+    def for_user_keys(cls, user_api_keys: dict[str, str] | None = None) -> "RegisteredProviders":
+        """Get the (cached) registry for the given set of the user API keys.
+
+        Args:
+            user_api_keys: User API keys by provider name.
+
+        Returns:
+            Providers registry.
+        """
+        key_set = cls._get_key_set(user_api_keys)
+        if registry := cls._registries.get(key_set):
+            cls._registries.move_to_end(key_set)
+            return registry
+
+        registry = cls(user_api_keys=dict(user_api_keys) if user_api_keys else None)
+        cls._registries[key_set] = registry
+        if len(cls._registries) > cls.max_cached_instances:
+            cls._registries.popitem(last=False)
+        return registry
+
+    @classmethod
+    def invalidate(cls, user_api_keys: dict[str, str] | None = None, stale_api_key: str | None = None) -> None:
+        """Forget the cached registry built for the given set of the user API keys.
+
+        Args:
+            user_api_keys: User API keys by provider name (before the change).
+            stale_api_key: The replaced API key: the provider instances (and SDK clients) using it are dropped too.
+        """
+        cls._registries.pop(cls._get_key_set(user_api_keys), None)
+        if stale_api_key:
+            for instance_key in [key for key in cls._instances if key[1] == stale_api_key]:
+                del cls._instances[instance_key]
+
+    @classmethod
+    def load(cls, all_providers: bool = False) -> None:
+        """Import the provider modules, registering the providers they define.
+
+        Args:
+            all_providers: Load all the providers, not only the configured ones.
+        """
+        for class_name, (module, api_key_setting) in PROVIDER_MODULES.items():
+            if class_name.lower() in cls.all:
+                continue
+            if all_providers or gpt_settings.public_mode or getattr(gpt_settings, api_key_setting):
+                import_module(module)
+
     @classmethod
     def register(cls, provider: type["Provider"]) -> None:
         cls.all[provider.name.lower()] = provider
@@ -111,11 +215,7 @@ class RegisteredProviders:
 
     @property
     def available_instances(self) -> list["Provider"]:
-        return [
-            provider(token=self.get_api_key(provider))  # type: ignore
-            for provider in self.available.values()
-            if self.get_api_key(provider) is not None
-        ]
+        return [instance for provider in self.available.values() if (instance := self.get_instance(provider=provider))]
 
     @property
     def chat_ready(self) -> dict[str, type["Provider"]]:
@@ -151,7 +251,17 @@ class RegisteredProviders:
         api_key = self.get_api_key(provider)
         if not api_key:
             return None
-        return provider(token=api_key)
+
+        instance_key = (provider.name, api_key)
+        if instance := self._instances.get(instance_key):
+            self._instances.move_to_end(instance_key)
+            return instance
+
+        instance = provider(token=api_key)
+        self._instances[instance_key] = instance
+        if len(self._instances) > self.max_cached_instances:
+            self._instances.popitem(last=False)
+        return instance
 
     def get(self, provider_name: str) -> Optional["Provider"]:
         if provider_name.lower() not in self.available:
@@ -161,6 +271,7 @@ class RegisteredProviders:
 
     @classmethod
     def get_class(cls, provider_name: str) -> Optional[type["Provider"]]:
+        cls.load(all_providers=True)
         return cls.all.get(provider_name)
 
     @property
@@ -235,6 +346,93 @@ class Provider(ABC):
     def __init__(self, token: str) -> None:
         self.token = token
 
+    @property
+    def rate_limiter(self) -> AdaptiveRateLimiter:
+        return RateLimiterRegistry().get(provider_name=self.name, api_key=self.token)
+
+    @property
+    def httpx_event_hooks(self) -> dict[str, list[Callable[[httpx.Response], Awaitable[None]]]]:
+        """Event hooks for the httpx clients used by the provider SDKs: every response teaches the rate limiter."""
+        return {"response": [self._learn_rate_limits]}
+
+    async def _learn_rate_limits(self, response: httpx.Response) -> None:
+        self.rate_limiter.update_from_headers(headers=response.headers, status_code=response.status_code)
+
+    def _get_retry_after(self, error: BaseException) -> float | None:
+        """Get the delay the provider asked to wait after a rate limit error (if any)."""
+        return get_retry_after_from_error(error)
+
+    async def _call_resilient(self, call: Callable[[], Awaitable[T]], model: str, tokens: int = 0) -> T:
+        """Send the request through the shared resilience layer.
+
+        The request passes the (provider, model) circuit breaker and waits for its turn in the provider's rate
+        limiter. Failed attempts are retried according to the policy of their error class (see `RETRY_POLICIES`)
+        with decorrelated jitter; rate-limited requests are queued again, honoring the Retry-After header.
+
+        Args:
+            call: Coroutine function sending the request.
+            model: Model name.
+            tokens: Estimated amount of tokens the request will consume.
+
+        Returns:
+            The request result.
+
+        Raises:
+            ServiceUnavailableError: if the circuit breaker is open.
+        """
+        limiter = self.rate_limiter
+        breaker = CircuitBreakerRegistry().get(provider=self.name, model=model)
+        latency = LatencyRegistry()
+        delay: float | None = None
+        attempt = 0
+        while True:
+            attempt += 1
+            probe_id = breaker.before_call()
+            try:
+                async with limiter.slot(tokens=tokens) as slot:
+                    started_at = time.monotonic()
+                    deadline = asyncio.timeout(
+                        latency.get_timeout(provider=self.name, model=model, default=self.timeout)
+                    )
+                    try:
+                        async with deadline:
+                            result = await call()
+                    except Exception as e:
+                        if deadline.expired():
+                            # The request has been slower than the adaptive timeout: the timeout grows with the p99.
+                            latency.record(provider=self.name, model=model, seconds=time.monotonic() - started_at)
+                            logger.warning(
+                                f"[{self.name}] {model}: request timed out after {time.monotonic() - started_at:.1f}s"
+                            )
+                        error_class = classify_error(e)
+                        breaker.record_failure(error_class)
+                        ModelRouter().record_failure(provider=self.name, model=model)
+                        if error_class == ErrorClass.RATE_LIMIT:
+                            slot.rate_limited = True
+                            limiter.on_rate_limited(retry_after=self._get_retry_after(e))
+                        policy = RETRY_POLICIES[error_class]
+                        if attempt >= policy.max_attempts:
+                            raise
+                        error = e
+                    else:
+                        breaker.record_success()
+                        seconds = time.monotonic() - started_at
+                        latency.record(provider=self.name, model=model, seconds=seconds)
+                        ModelRouter().record_success(
+                            provider=self.name, model=model, seconds=seconds, output_tokens=get_output_tokens(result)
+                        )
+                        return result
+            except asyncio.CancelledError:
+                # Cancelled while running or while queued by the limiter: the half-open probe must be released.
+                breaker.record_cancelled(probe_id=probe_id)
+                raise
+
+            # Rate-limited requests wait in the limiter queue, the rest sleep outside of the limiter slot.
+            delay = 0.0 if error_class == ErrorClass.RATE_LIMIT else policy.next_delay(delay)
+            await sleep_before_retry(
+                breaker=breaker, error=error, error_class=error_class, attempt=attempt, delay=delay
+            )
+
     def __init_subclass__(cls, **kwargs: Any) -> None:
         super().__init_subclass__(**kwargs)
 
@@ -269,6 +467,22 @@ class Provider(ABC):
     async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
         raise NotImplementedError
 
+    async def moderate_commands(self, cmds: list[str], model: str | None = None) -> list[ModeratorsAnswer]:
+        """Moderate several independent commands with a single request.
+
+        Args:
+            cmds: Commands to moderate.
+            model: Moderator model name.
+
+        Returns:
+            Answers in the order of the commands.
+
+        Raises:
+            NotImplementedError: if the provider does not support batched moderation.
+            ValueError: if the moderator's answer could not be parsed.
+        """
+        raise NotImplementedError
+
     async def vision(
         self, image: bytes, mime_type: str, model: str | None = None, prompt: str | None = None
     ) -> VisionResultSchema:
@@ -342,6 +556,7 @@ class Provider(ABC):
         user_id: int | None = None,
         interface: UserInterface | None = None,
     ) -> list[ToolResponseSchema]:
+        claim_hedged_request()
         tool_context: dict[str, Any] = {
             "user_id": user_id,
             "interface": interface,
@@ -351,7 +566,11 @@ class Provider(ABC):
         tool_coroutines = [
             RegisteredChibiTools.call(tool_name=call.tool_name, tools_args=tool_context | call.args) for call in calls
         ]
-        results = await asyncio.gather(*tool_coroutines)
+        token = current_tool_call_batch.set(ToolCallBatch())
+        try:
+            results = await asyncio.gather(*tool_coroutines)
+        finally:
+            current_tool_call_batch.reset(token)
         return results
 
 
@@ -401,9 +620,16 @@ class OpenAIFriendlyProvider(Provider, Generic[P, R]):
 
     @property
     def client(self) -> AsyncOpenAI:
+        if client := self.__dict__.get("_client"):
+            return client
         if not self.token:
             raise NoApiKeyProvidedError(provider=self.name)
-        return AsyncOpenAI(api_key=self.token, base_url=self.base_url)
+        self.__dict__["_client"] = AsyncOpenAI(
+            api_key=self.token,
+            base_url=self.base_url,
+            http_client=DefaultAsyncHttpxClient(event_hooks=self.httpx_event_hooks),
+        )
+        return self.__dict__["_client"]
 
     @client.setter
     def client(self, value: AsyncOpenAI) -> None:
@@ -428,9 +654,14 @@ class OpenAIFriendlyProvider(Provider, Generic[P, R]):
         model = model or self.default_model
 
         initial_messages = [msg.to_openai() for msg in messages]
-        chat_response, updated_messages = await self._get_chat_completion_response(
-            messages=initial_messages.copy(), model=model, system_prompt=system_prompt, user=user, interface=interface
-        )
+        with select_tools(messages=messages, user=user, interface=interface):
+            chat_response, updated_messages = await self._get_chat_completion_response(
+                messages=initial_messages.copy(),
+                model=model,
+                system_prompt=system_prompt,
+                user=user,
+                interface=interface,
+            )
         new_messages = [msg for msg in updated_messages if msg not in initial_messages]
         return (
             chat_response,
@@ -455,17 +686,23 @@ class OpenAIFriendlyProvider(Provider, Generic[P, R]):
             system_message = ChatCompletionSystemMessageParam(role="system", content=prepared_system_prompt)
             dialog = [system_message] + messages
 
-        response: ChatCompletion = await self.client.chat.completions.create(  # type: ignore
+        # Retries are handled by `_call_resilient`, not by the SDK.
+        client = self.client.with_options(max_retries=0)
+        response: ChatCompletion = await self._call_resilient(
+            lambda: client.chat.completions.create(  # type: ignore
+                model=model,
+                messages=dialog,
+                temperature=self._get_temperature_value(model_name=model),
+                max_tokens=self._get_max_tokens_value(model_name=model),
+                presence_penalty=self.presence_penalty,
+                frequency_penalty=self.frequency_penalty,
+                timeout=self.timeout,
+                tools=RegisteredChibiTools.get_tool_definitions(),
+                tool_choice="auto",
+                reasoning_effort=self.get_reasoning_effort_value(model_name=model),
+            ),
             model=model,
-            messages=dialog,
-            temperature=self._get_temperature_value(model_name=model),
-            max_tokens=self._get_max_tokens_value(model_name=model),
-            presence_penalty=self.presence_penalty,
-            frequency_penalty=self.frequency_penalty,
-            timeout=self.timeout,
-            tools=RegisteredChibiTools.get_tool_definitions(),
-            tool_choice="auto",
-            reasoning_effort=self.get_reasoning_effort_value(model_name=model),
+            tokens=estimate_payload_tokens(dialog),
         )
         choices: list[Choice] = response.choices
 
@@ -542,43 +779,41 @@ class OpenAIFriendlyProvider(Provider, Generic[P, R]):
     def get_reasoning_effort_value(self, model_name: str) -> ReasoningEffort | OpenAIOmit | None:
         return omit
 
-    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
-        moderator_model = model or self.default_moderation_model or self.default_model
-        system_message = ChatCompletionSystemMessageParam(role="system", content=MODERATOR_PROMPT)
+    async def _get_moderator_response(self, system_prompt: str, content: str, model: str, max_tokens: int) -> str:
+        system_message = ChatCompletionSystemMessageParam(role="system", content=system_prompt)
 
         messages = [
-            Message(role="user", content=cmd).to_openai(),
+            Message(role="user", content=content).to_openai(),
         ]
 
         dialog: list[ChatCompletionMessageParam] = [system_message] + messages
-        temperature = (
-            1 if moderator_model.startswith("o") or "mini" in moderator_model or "nano" in moderator_model else 0.0
-        )
+        temperature = 1 if model.startswith("o") or "mini" in model or "nano" in model else 0.0
         response: ChatCompletion = await self.client.chat.completions.create(
-            model=moderator_model,
+            model=model,
             messages=dialog,
             temperature=temperature,
-            max_completion_tokens=1024,
+            max_completion_tokens=max_tokens,
             presence_penalty=self.presence_penalty,  # type: ignore
             frequency_penalty=self.frequency_penalty,
             timeout=self.timeout,
-            reasoning_effort=self.get_reasoning_effort_value(model_name=moderator_model),
+            reasoning_effort=self.get_reasoning_effort_value(model_name=model),
         )
 
         choices: list[Choice] = response.choices
 
         if len(choices) == 0:
-            raise ServiceResponseError(
-                provider=self.name, model=moderator_model, detail="Unexpected (empty) response received"
-            )
-
-        data = choices[0]
-        answer: str = data.message.content or ""
+            raise ServiceResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
 
         usage = get_usage_from_openai_response(response_message=response)
         if application_settings.is_influx_configured:
-            MetricsService.send_usage_metrics(metric=usage, model=moderator_model, provider=self.name)
-        # usage_message = get_usage_msg(usage=usage)
+            MetricsService.send_usage_metrics(metric=usage, model=model, provider=self.name)
+        return choices[0].message.content or ""
+
+    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_PROMPT, content=cmd, model=moderator_model, max_tokens=1024
+        )
         answer = answer.strip("```")
         answer = answer.strip("json")
         answer = answer.strip()
@@ -598,6 +833,16 @@ class OpenAIFriendlyProvider(Provider, Generic[P, R]):
 
         return ModeratorsAnswer(verdict="declined", reason=reason, status="operation aborted")
 
+    async def moderate_commands(self, cmds: list[str], model: str | None = None) -> list[ModeratorsAnswer]:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_response(
+            system_prompt=MODERATOR_BATCH_PROMPT,
+            content=get_moderation_batch_content(cmds),
+            model=moderator_model,
+            max_tokens=1024 + 256 * len(cmds),
+        )
+        return parse_moderation_batch_answer(answer=answer, count=len(cmds))
+
     async def get_available_models(self, image_generation: bool = False) -> list[ModelChangeSchema]:
         try:
             models = await self.client.models.list()
@@ -706,7 +951,7 @@ class RestApiFriendlyProvider(Provider):
 
     def get_async_httpx_client(self) -> httpx.AsyncClient:
         transport = httpx.AsyncHTTPTransport(retries=gpt_settings.retries, proxy=gpt_settings.proxy)
-        return httpx.AsyncClient(transport=transport, timeout=gpt_settings.timeout)
+        return httpx.AsyncClient(transport=transport, timeout=gpt_settings.timeout, event_hooks=self.httpx_event_hooks)
 
     async def _request(
         self,
@@ -752,17 +997,23 @@ class AnthropicFriendlyProvider(RestApiFriendlyProvider):
     temperature: float | Omit = gpt_settings.temperature
     base_url: str = "https://api.anthropic.com"
 
+    @staticmethod
+    def _convert_tool_definition(tool: ChatCompletionToolParam) -> ToolParam:
+        return ToolParam(
+            name=tool["function"]["name"],
+            description=tool["function"]["description"],
+            input_schema=tool["function"]["parameters"],
+        )
+
+    @property
+    def tools_snapshot(self) -> ToolDefinitionsSnapshot[ToolParam]:
+        return RegisteredChibiTools.get_tool_definitions_snapshot(
+            format_name="anthropic", converter=self._convert_tool_definition
+        )
+
     @property
     def tools_list(self) -> list[ToolParam]:
-        anthropic_tools = [
-            ToolParam(
-                name=tool["function"]["name"],
-                description=tool["function"]["description"],
-                input_schema=tool["function"]["parameters"],
-            )
-            for tool in RegisteredChibiTools.get_tool_definitions()
-        ]
-        return anthropic_tools
+        return self.tools_snapshot.definitions
 
     @property
     def client(self) -> AsyncClient:
@@ -774,35 +1025,38 @@ class AnthropicFriendlyProvider(RestApiFriendlyProvider):
         system_prompt: str,
         messages: list[MessageParam],
     ) -> AnthropicMessage:
-        for attempt in range(gpt_settings.retries):
-            response_message: AnthropicMessage = await self.client.messages.create(
+        tools_snapshot = self.tools_snapshot
+        tools_tokens = estimate_payload_tokens(tools_snapshot.serialized)
+        tools, system, cache_plan = AnthropicCacheBreakpointPlanner.for_model(model).apply(
+            tools=tools_snapshot.definitions,
+            system=[TextBlockParam(text=system_prompt, type="text")],
+            messages=messages,
+            tools_tokens=tools_tokens,
+        )
+        logger.debug(f"[{self.name}] {model}: cache breakpoints placed: {cache_plan.prefix_tokens}")
+
+        # Retries are handled by `_call_resilient`, not by the SDK.
+        client = self.client.with_options(max_retries=0)
+
+        async def send_request() -> AnthropicMessage:
+            response_message: AnthropicMessage = await client.messages.create(
                 model=model,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature,
                 timeout=self.timeout,
-                tools=self.tools_list,
-                system=[
-                    TextBlockParam(
-                        text=system_prompt,
-                        type="text",
-                        cache_control=CacheControlEphemeralParam(type="ephemeral"),
-                    )
-                ],
+                tools=tools,
+                system=system,
                 messages=messages,
             )
+            if not response_message.content:
+                raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
+            return response_message
 
-            if response_message.content and len(response_message.content) > 0:
-                return response_message
-
-            delay = gpt_settings.backoff_factor * (2**attempt)
-            jitter = delay * random.uniform(0.1, 0.5)
-            total_delay = delay + jitter
-
-            logger.warning(
-                f"Attempt #{attempt + 1}. Unexpected (empty) response received. Retrying in {total_delay} seconds..."
-            )
-            await sleep(total_delay)
-        raise NoResponseError(provider=self.name, model=model, detail="Unexpected (empty) response received")
+        return await self._call_resilient(
+            send_request,
+            model=model,
+            tokens=tools_tokens + estimate_payload_tokens(system_prompt) + estimate_payload_tokens(messages),
+        )
 
     async def get_chat_response(
         self,
@@ -815,12 +1069,14 @@ class AnthropicFriendlyProvider(RestApiFriendlyProvider):
         model = model or self.default_model
         initial_messages = [msg.to_anthropic() for msg in messages]
 
-        if len(initial_messages) >= 2:
-            initial_messages[-2]["content"][0]["cache_control"] = {"type": "ephemeral"}  # type: ignore
-
-        chat_response, updated_messages = await self._get_chat_completion_response(
-            messages=initial_messages.copy(), user=user, model=model, system_prompt=system_prompt, interface=interface
-        )
+        with select_tools(messages=messages, user=user, interface=interface):
+            chat_response, updated_messages = await self._get_chat_completion_response(
+                messages=initial_messages.copy(),
+                user=user,
+                model=model,
+                system_prompt=system_prompt,
+                interface=interface,
+            )
         new_messages = [msg for msg in updated_messages if msg not in initial_messages]
         return (
             chat_response,
@@ -916,50 +1172,58 @@ class AnthropicFriendlyProvider(RestApiFriendlyProvider):
             messages=messages, model=model, user=user, system_prompt=system_prompt, interface=interface
         )
 
-    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
-        moderator_model = model or self.default_moderation_model or self.default_model
-        messages = [Message(role="user", content=cmd).to_anthropic()]
+    async def _get_moderator_tool_input(
+        self, system_prompt: str, content: str, model: str, tool: ToolParam, max_tokens: int
+    ) -> object | None:
         response_message: AnthropicMessage = await self.client.messages.create(
-            model=moderator_model,
-            max_tokens=1024,
+            model=model,
+            max_tokens=max_tokens,
             temperature=0.1,
             timeout=self.timeout,
             system=[
                 TextBlockParam(
-                    text=MODERATOR_PROMPT,
+                    text=system_prompt,
                     type="text",
                 )
             ],
-            tools=[
-                ToolParam(
-                    name="print_moderator_verdict",
-                    description="Provide moderator's verdict",
-                    input_schema=InputSchemaTyped(
-                        type="object",
-                        properties={
-                            "verdict": {"type": "string"},
-                            "status": {"type": "string", "default": "ok"},
-                            "reason": {"type": "string"},
-                        },
-                        required=["verdict"],
-                    ),
-                )
-            ],
-            tool_choice=ToolChoiceToolParam(type="tool", name="print_moderator_verdict"),
-            messages=messages,
+            tools=[tool],
+            tool_choice=ToolChoiceToolParam(type="tool", name=tool["name"]),
+            messages=[Message(role="user", content=content).to_anthropic()],
         )
         if not response_message.content:
-            return ModeratorsAnswer(status="error", verdict="declined", reason="no response from moderator received")
+            return None
         usage = get_usage_from_anthropic_response(response_message=response_message)
 
         if application_settings.is_influx_configured:
-            MetricsService.send_usage_metrics(metric=usage, model=moderator_model, provider=self.name)
+            MetricsService.send_usage_metrics(metric=usage, model=model, provider=self.name)
         tool_call: ToolUseBlock | None = next(
-            part for part in response_message.content if isinstance(part, ToolUseBlock)
+            (part for part in response_message.content if isinstance(part, ToolUseBlock)), None
         )
-        if not tool_call:
+        return tool_call.input if tool_call else None
+
+    async def moderate_command(self, cmd: str, model: str | None = None) -> ModeratorsAnswer:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_tool_input(
+            system_prompt=MODERATOR_PROMPT,
+            content=cmd,
+            model=moderator_model,
+            tool=ToolParam(
+                name="print_moderator_verdict",
+                description="Provide moderator's verdict",
+                input_schema=InputSchemaTyped(
+                    type="object",
+                    properties={
+                        "verdict": {"type": "string"},
+                        "status": {"type": "string", "default": "ok"},
+                        "reason": {"type": "string"},
+                    },
+                    required=["verdict"],
+                ),
+            ),
+            max_tokens=1024,
+        )
+        if not answer:
             return ModeratorsAnswer(status="error", verdict="declined", reason="no response from moderator received")
-        answer = tool_call.input
 
         try:
             return ModeratorsAnswer.model_validate(answer, extra="ignore")
@@ -968,6 +1232,40 @@ class AnthropicFriendlyProvider(RestApiFriendlyProvider):
             logger.error(msg)
             return ModeratorsAnswer(verdict="declined", reason=msg, status="error")
 
+    async def moderate_commands(self, cmds: list[str], model: str | None = None) -> list[ModeratorsAnswer]:
+        moderator_model = model or self.default_moderation_model or self.default_model
+        answer = await self._get_moderator_tool_input(
+            system_prompt=MODERATOR_BATCH_PROMPT,
+            content=get_moderation_batch_content(cmds),
+            model=moderator_model,
+            tool=ToolParam(
+                name="print_moderator_verdicts",
+                description="Provide moderator's verdict for every command",
+                input_schema=InputSchemaTyped(
+                    type="object",
+                    properties={
+                        "verdicts": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "id": {"type": "integer"},
+                                    "verdict": {"type": "string"},
+                                    "reason": {"type": "string"},
+                                },
+                                "required": ["id", "verdict"],
+                            },
+                        },
+                    },
+                    required=["verdicts"],
+                ),
+            ),
+            max_tokens=1024 + 256 * len(cmds),
+        )
+        if not isinstance(answer, dict):
+            raise ValueError(f"Unexpected moderator's batch response: {answer}")
+        return parse_moderation_batch_answer(answer=answer, count=len(cmds))
+
     async def get_available_models(self, image_generation: bool = False) -> list[ModelChangeSchema]:
         if image_generation:
             return []
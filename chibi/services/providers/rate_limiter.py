@@ -0,0 +1,377 @@
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Mapping
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.utils.app import SingletonMeta, hash_api_key
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: str) -> float | None:
+    """Parse the OpenAI-style reset duration, i.e. "1s", "6m0s", "20ms", "1h2m3.5s".
+
+    Args:
+        value: Duration string.
+
+    Returns:
+        Duration in seconds or None if the value could not be parsed.
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    multipliers = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * multipliers[unit] for number, unit in parts)
+
+
+def _parse_reset(value: str) -> float | None:
+    """Parse a reset header value: duration, amount of seconds or RFC 3339 timestamp (Anthropic)."""
+    if (duration := parse_duration(value)) is not None:
+        return duration
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """Get the delay the server asked to wait before the next request.
+
+    Args:
+        headers: Response headers.
+
+    Returns:
+        Delay in seconds or None if the server did not specify it.
+    """
+    if retry_after_ms := headers.get("retry-after-ms"):
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _get_header_int(headers: Mapping[str, str], *names: str) -> int | None:
+    for name in names:
+        if (value := headers.get(name)) is None:
+            continue
+        try:
+            return int(float(value))
+        except ValueError:
+            continue
+    return None
+
+
+def _get_header_reset(headers: Mapping[str, str], *names: str) -> float | None:
+    for name in names:
+        if (value := headers.get(name)) and (reset := _parse_reset(value)) is not None:
+            return reset
+    return None
+
+
+def _get_error_response_headers(error: BaseException) -> Mapping[str, str]:
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    headers = getattr(response, "headers", None)
+    return headers if headers is not None else {}
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Check if the exception raised by a provider SDK means "429 Too Many Requests".
+
+    Args:
+        error: Exception raised by the SDK.
+
+    Returns:
+        True if the request was rate limited.
+    """
+    for attr in ("status_code", "code"):
+        if getattr(error, attr, None) == 429:
+            return True
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def get_retry_after_from_error(error: BaseException) -> float | None:
+    return parse_retry_after(_get_error_response_headers(error))
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously up to its capacity once per `period` seconds."""
+
+    def __init__(self, capacity: float | None, period: float = 60.0) -> None:
+        self.capacity = capacity
+        self.period = period
+        self.level = capacity or 0.0
+        self._updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.capacity
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self._updated_at) * self.capacity / self.period)
+        self._updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        assert self.capacity
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * self.period / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.unlimited:
+            return None
+        self._refill()
+        self.level -= min(amount, self.capacity or amount)
+
+    def sync(self, limit: int | None, remaining: int | None) -> None:
+        """Align the bucket with the limits reported by the server."""
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity:
+            self._refill()
+            self.level = min(float(remaining), self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """Rate limiter for a single (provider, API key) pair.
+
+    Combines two token buckets (requests/min and tokens/min) with AIMD concurrency control: the concurrency
+    limit grows additively after successful requests and is halved on each 429 response. Callers wait in a
+    FIFO queue, so nobody fails because of a neighbour's burst. The limits are learned from the `Retry-After`,
+    `x-ratelimit-*` and `anthropic-ratelimit-*` response headers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        max_concurrency: int = 16,
+        initial_concurrency: int | None = None,
+    ) -> None:
+        self.name = name
+        self.requests = TokenBucket(capacity=requests_per_minute)
+        self.tokens = TokenBucket(capacity=tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit: float = float(initial_concurrency or max_concurrency)
+        self.in_flight = 0
+        self.rate_limited_count = 0
+        self._blocked_until = 0.0
+        self._queue: deque[object] = deque()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._condition_instance: asyncio.Condition | None = None
+
+    @property
+    def _condition(self) -> asyncio.Condition:
+        # The limiters live in a process-wide registry, so the condition is bound to the currently running loop.
+        loop = asyncio.get_running_loop()
+        if self._condition_instance is None or self._loop is not loop:
+            self._loop = loop
+            self._condition_instance = asyncio.Condition()
+        return self._condition_instance
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "limiter": self.name,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "requests_per_minute": self.requests.capacity,
+            "tokens_per_minute": self.tokens.capacity,
+            "rate_limited_count": self.rate_limited_count,
+        }
+
+    def _time_until_ready(self, tokens: int) -> float | None:
+        """Time to wait before the request can be started. None means "wait for a slot to be released"."""
+        if self.in_flight >= max(int(self.concurrency_limit), 1):
+            return None
+        return max(
+            self._blocked_until - time.monotonic(),
+            self.requests.time_until_available(1),
+            self.tokens.time_until_available(tokens),
+            0.0,
+        )
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait for the turn to send a request.
+
+        Args:
+            tokens: Estimated amount of tokens the request will consume.
+
+        Returns:
+            Time (in seconds) the caller spent in the queue.
+        """
+        ticket = object()
+        started_at = time.monotonic()
+        async with self._condition:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    delay = self._time_until_ready(tokens) if self._queue[0] is ticket else None
+                    if delay == 0.0:
+                        break
+                    try:
+                        async with asyncio.timeout(delay):
+                            await self._condition.wait()
+                    except TimeoutError:
+                        pass
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self.in_flight += 1
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+        return time.monotonic() - started_at
+
+    async def release(self, success: bool) -> None:
+        async with self._condition:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if success:
+                self.concurrency_limit = min(
+                    self.concurrency_limit + 1 / max(self.concurrency_limit, 1), float(self.max_concurrency)
+                )
+            self._condition.notify_all()
+
+    def on_rate_limited(self, retry_after: float | None = None) -> None:
+        """Multiplicative decrease + cool down after a 429 response."""
+        self.rate_limited_count += 1
+        self.concurrency_limit = max(self.concurrency_limit / 2, 1.0)
+        delay = retry_after if retry_after is not None else gpt_settings.backoff_factor * 2
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning(
+            f"[{self.name}] Rate limited. Concurrency limit decreased to {self.concurrency_limit:.1f}, "
+            f"requests are paused for {delay:.1f}s. Queue depth: {self.queue_depth}."
+        )
+
+    def update_from_headers(self, headers: Mapping[str, str], status_code: int | None = None) -> None:
+        """Learn the limits from the response headers.
+
+        Args:
+            headers: Response headers.
+            status_code: Response status code.
+        """
+        self.requests.sync(
+            limit=_get_header_int(headers, "x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+            remaining=_get_header_int(
+                headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"
+            ),
+        )
+        self.tokens.sync(
+            limit=_get_header_int(
+                headers,
+                "x-ratelimit-limit-tokens",
+                "anthropic-ratelimit-input-tokens-limit",
+                "anthropic-ratelimit-tokens-limit",
+            ),
+            remaining=_get_header_int(
+                headers,
+                "x-ratelimit-remaining-tokens",
+                "anthropic-ratelimit-input-tokens-remaining",
+                "anthropic-ratelimit-tokens-remaining",
+            ),
+        )
+
+        block_for: float | None = None
+        if _get_header_int(headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining") == 0:
+            block_for = _get_header_reset(headers, "x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset")
+        if status_code == 429:
+            block_for = parse_retry_after(headers) or block_for
+        if block_for:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + block_for)
+
+    def adjust_tokens(self, delta: int) -> None:
+        """Correct the tokens bucket when the actual usage differs from the estimation."""
+        if delta > 0:
+            self.tokens.take(delta)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator["RateLimiterSlot"]:
+        """Hold a request slot for the duration of the request.
+
+        Args:
+            tokens: Estimated amount of tokens the request will consume.
+
+        Yields:
+            Slot object. Set `rate_limited` to True if the request was rate limited.
+        """
+        queue_depth = self.queue_depth
+        waited = await self.acquire(tokens=tokens)
+        if waited > 0.1:
+            from chibi.services.metrics import MetricsService
+
+            MetricsService.send_rate_limiter_metrics(
+                limiter=self.name, wait_time=waited, queue_depth=queue_depth, stats=self.stats()
+            )
+        slot = RateLimiterSlot(wait_time=waited)
+        try:
+            yield slot
+        except BaseException:
+            await self.release(success=False)
+            raise
+        await self.release(success=not slot.rate_limited)
+
+
+class RateLimiterSlot:
+    def __init__(self, wait_time: float) -> None:
+        self.wait_time = wait_time
+        self.rate_limited = False
+
+
+class RateLimiterRegistry(metaclass=SingletonMeta):
+    """Process-wide registry of the rate limiters, one per (provider, API key) pair."""
+
+    def __init__(self) -> None:
+        self._limiters: dict[tuple[str, str], AdaptiveRateLimiter] = {}
+
+    def get(self, provider_name: str, api_key: str | None) -> AdaptiveRateLimiter:
+        key = (provider_name, hash_api_key(api_key))
+        if limiter := self._limiters.get(key):
+            return limiter
+        limiter = AdaptiveRateLimiter(
+            name=f"{provider_name}:{key[1][:6]}",
+            requests_per_minute=gpt_settings.rate_limit_rpm,
+            tokens_per_minute=gpt_settings.rate_limit_tpm,
+            max_concurrency=gpt_settings.rate_limit_max_concurrency,
+        )
+        self._limiters[key] = limiter
+        return limiter
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [limiter.stats() for limiter in self._limiters.values()]
@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+import anthropic
+import httpx
+import openai
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.exceptions import GptException, NoResponseError, ServiceRateLimitError, ServiceUnavailableError
+from chibi.services.providers.rate_limiter import is_rate_limit_error
+from chibi.utils.app import SingletonMeta
+
+
+class ErrorClass(str, Enum):
+    RATE_LIMIT = "rate_limit"
+    TIMEOUT = "timeout"
+    CONNECTION = "connection"
+    SERVER = "server"
+    EMPTY_RESPONSE = "empty_response"
+    FATAL = "fatal"
+
+
+# Errors that mean "the provider is unhealthy" and should open the circuit breaker.
+BREAKER_ERROR_CLASSES = frozenset({ErrorClass.TIMEOUT, ErrorClass.CONNECTION, ErrorClass.SERVER})
+
+_TIMEOUT_ERRORS: tuple[type[BaseException], ...] = (
+    TimeoutError,
+    httpx.TimeoutException,
+    openai.APITimeoutError,
+    anthropic.APITimeoutError,
+)
+_CONNECTION_ERRORS: tuple[type[BaseException], ...] = (
+    httpx.TransportError,
+    openai.APIConnectionError,
+    anthropic.APIConnectionError,
+)
+
+
+def _get_status_code(error: BaseException) -> int | None:
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def classify_error(error: BaseException) -> ErrorClass:
+    """Map an exception raised by a provider SDK to the retry policy class.
+
+    Args:
+        error: Exception raised by the SDK (or by the provider code itself).
+
+    Returns:
+        Error class.
+    """
+    if isinstance(error, NoResponseError):
+        return ErrorClass.EMPTY_RESPONSE
+    if isinstance(error, ServiceRateLimitError):
+        return ErrorClass.RATE_LIMIT
+    if isinstance(error, GptException):
+        # Already interpreted by the provider code (no API key, bad request, etc).
+        return ErrorClass.FATAL
+    if is_rate_limit_error(error):
+        return ErrorClass.RATE_LIMIT
+    if isinstance(error, _TIMEOUT_ERRORS):
+        return ErrorClass.TIMEOUT
+    if isinstance(error, _CONNECTION_ERRORS):
+        return ErrorClass.CONNECTION
+
+    status_code = _get_status_code(error)
+    if status_code == 408:
+        return ErrorClass.TIMEOUT
+    if status_code is not None and status_code >= 500:  # including Anthropic's 529 "overloaded"
+        return ErrorClass.SERVER
+    return ErrorClass.FATAL
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry policy for a single error class.
+
+    Attributes:
+        max_attempts: Total amount of attempts (including the first one).
+        base_delay: Minimal delay between attempts, seconds.
+        max_delay: Maximal delay between attempts, seconds.
+    """
+
+    max_attempts: int
+    base_delay: float = gpt_settings.backoff_factor
+    max_delay: float = gpt_settings.retry_max_delay
+
+    def next_delay(self, previous_delay: float | None) -> float:
+        """Get the delay before the next attempt using the "decorrelated jitter" algorithm.
+
+        Args:
+            previous_delay: The previous delay (None for the first retry).
+
+        Returns:
+            Delay in seconds.
+        """
+        upper = (previous_delay or self.base_delay) * 3
+        return min(self.max_delay, random.uniform(self.base_delay, max(upper, self.base_delay)))
+
+
+RETRY_POLICIES: dict[ErrorClass, RetryPolicy] = {
+    # The delay comes from the rate limiter (Retry-After), the request just waits in the queue again.
+    ErrorClass.RATE_LIMIT: RetryPolicy(max_attempts=gpt_settings.retries + 1),
+    # Each attempt may take up to `gpt_settings.timeout` seconds, so a single extra attempt is enough.
+    ErrorClass.TIMEOUT: RetryPolicy(max_attempts=2),
+    ErrorClass.CONNECTION: RetryPolicy(max_attempts=gpt_settings.retries + 1),
+    ErrorClass.SERVER: RetryPolicy(max_attempts=gpt_settings.retries + 1),
+    ErrorClass.EMPTY_RESPONSE: RetryPolicy(max_attempts=gpt_settings.retries),
+    ErrorClass.FATAL: RetryPolicy(max_attempts=1),
+}
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for a single (provider, model) pair.
+
+    After `failure_threshold` consecutive failures (timeouts, connection and 5xx errors) the breaker opens and
+    all the requests fail fast with `ServiceUnavailableError`. After `recovery_timeout` seconds a single probe
+    request is let through (half-open state): its success closes the breaker, its failure opens it again. A probe
+    with no outcome reported within `probe_timeout` seconds is considered lost, and the next request probes.
+    """
+
+    def __init__(
+        self, provider: str, model: str, failure_threshold: int, recovery_timeout: float, probe_timeout: float = 600.0
+    ) -> None:
+        self.provider = provider
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_timeout = probe_timeout
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.retries_count = 0
+        self.rejected_count = 0
+        self._opened_at = 0.0
+        self._probe_ids = itertools.count(1)
+        self._probe_id: int | None = None
+        self._probe_started_at = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "retries_count": self.retries_count,
+            "rejected_count": self.rejected_count,
+        }
+
+    def _set_state(self, state: CircuitState) -> None:
+        if state == self.state:
+            return None
+        logger.warning(f"[{self.provider}] {self.model}: circuit breaker {self.state.value} -> {state.value}")
+        self.state = state
+        from chibi.services.metrics import MetricsService
+
+        MetricsService.send_circuit_breaker_metrics(stats=self.stats())
+
+    def before_call(self) -> int | None:
+        """Check if the request may be sent.
+
+        Returns:
+            Probe id if the request is the half-open probe, None otherwise.
+
+        Raises:
+            ServiceUnavailableError: if the breaker is open (or the half-open probe is already in flight).
+        """
+        if self.state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._set_state(CircuitState.HALF_OPEN)
+
+        if self.state == CircuitState.CLOSED:
+            return None
+        if self.state == CircuitState.HALF_OPEN and (
+            self._probe_id is None or time.monotonic() - self._probe_started_at >= self.probe_timeout
+        ):
+            self._probe_id = next(self._probe_ids)
+            self._probe_started_at = time.monotonic()
+            return self._probe_id
+
+        self.rejected_count += 1
+        retry_in = max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0)
+        raise ServiceUnavailableError(
+            provider=self.provider,
+            model=self.model,
+            detail=f"Circuit breaker is open after {self.consecutive_failures} failures, retry in {retry_in:.0f}s",
+        )
+
+    def record_success(self) -> None:
+        self._probe_id = None
+        self.consecutive_failures = 0
+        self._set_state(CircuitState.CLOSED)
+
+    def record_cancelled(self, probe_id: int | None) -> None:
+        """Forget the cancelled request (i.e. the loser of a hedged request), so it does not hold the probe.
+
+        Args:
+            probe_id: Value returned by `before_call` for the request: only the probe itself releases the probe.
+        """
+        if probe_id is not None and probe_id == self._probe_id:
+            self._probe_id = None
+
+    def record_failure(self, error_class: ErrorClass) -> None:
+        self._probe_id = None
+        if error_class not in BREAKER_ERROR_CLASSES:
+            # The provider has answered, so it is alive.
+            if self.state == CircuitState.HALF_OPEN:
+                self._set_state(CircuitState.CLOSED)
+            return None
+
+        self.consecutive_failures += 1
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+
+
+class CircuitBreakerRegistry(metaclass=SingletonMeta):
+    """Process-wide registry of the circuit breakers, one per (provider, model) pair."""
+
+    def __init__(self) -> None:
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        if breaker := self._breakers.get(key):
+            return breaker
+        breaker = CircuitBreaker(
+            provider=provider,
+            model=model,
+            failure_threshold=gpt_settings.circuit_breaker_failure_threshold,
+            recovery_timeout=gpt_settings.circuit_breaker_recovery_timeout,
+        )
+        self._breakers[key] = breaker
+        return breaker
+
+    def is_open(self, provider: str, model: str) -> bool:
+        """Check if the calls of the model fail fast now (the breaker is not created if there is none yet)."""
+        breaker = self._breakers.get((provider, model))
+        return bool(
+            breaker
+            and breaker.state == CircuitState.OPEN
+            and time.monotonic() - breaker._opened_at < breaker.recovery_timeout
+        )
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [breaker.stats() for breaker in self._breakers.values()]
+
+
+async def sleep_before_retry(
+    breaker: CircuitBreaker, error: BaseException, error_class: ErrorClass, attempt: int, delay: float
+) -> None:
+    breaker.retries_count += 1
+    logger.warning(
+        f"[{breaker.provider}] {breaker.model}: attempt #{attempt} failed ({error_class.value}: {error!r}). "
+        f"Retrying in {delay:.2f} seconds..."
+    )
+    if delay > 0:
+        await asyncio.sleep(delay)
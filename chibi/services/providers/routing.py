@@ -0,0 +1,212 @@
+import re
+from collections import deque
+from typing import TYPE_CHECKING, Any, Literal
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.services.providers.latency import LatencyHistogram
+from chibi.services.providers.resilience import CircuitBreakerRegistry
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from chibi.schemas.app import ModelChangeSchema
+
+TaskClass = Literal["light", "standard", "heavy"]
+ModelTier = Literal["light", "standard", "heavy"]
+
+# Model name parts (split by dashes, dots, etc.) telling the model class. Light markers are checked first
+# (i.e. "o3-mini" is light).
+LIGHT_MODEL_MARKERS = frozenset({"nano", "mini", "flash", "haiku", "lite", "small", "tiny", "instant", "fast"})
+HEAVY_MODEL_MARKERS = frozenset({"opus", "pro", "o1", "o3", "reasoner", "reasoning", "thinking", "large"})
+
+# Expected latency of the models never called yet, seconds.
+TIER_LATENCY_PRIORS: dict[ModelTier, float] = {"light": 4.0, "standard": 10.0, "heavy": 30.0}
+# How much a model class is penalized for a task class. Light models win the standard tasks once they are observed
+# to be fast enough, the heavy tasks go to the heavy models unless these are slow or failing.
+TIER_PENALTIES: dict[TaskClass, dict[ModelTier, float]] = {
+    "light": {"light": 1.0, "standard": 2.0, "heavy": 4.0},
+    "standard": {"light": 3.0, "standard": 1.0, "heavy": 1.5},
+    "heavy": {"light": 10.0, "standard": 3.5, "heavy": 1.0},
+}
+# Observed latency is trusted once there are enough samples.
+MIN_SAMPLES = 3
+# Models failing that often are not picked at all.
+MAX_ERROR_RATE = 0.5
+
+
+def get_model_tier(model: str) -> ModelTier:
+    """Guess the model class by its name."""
+    parts = set(re.split(r"[-_.:/\s]+", model.lower()))
+    if parts & LIGHT_MODEL_MARKERS:
+        return "light"
+    if parts & HEAVY_MODEL_MARKERS:
+        return "heavy"
+    return "standard"
+
+
+def get_output_tokens(response: Any) -> int:
+    """Get the number of generated tokens from the response of any provider SDK (0 if unknown)."""
+    usage = getattr(response, "usage", None)
+    for attr in ("completion_tokens", "output_tokens"):
+        if isinstance(value := getattr(usage, attr, None), int):
+            return value
+    value = getattr(getattr(response, "usage_metadata", None), "candidates_token_count", None)
+    return value if isinstance(value, int) else 0
+
+
+class ModelStats:
+    """Sliding window statistics of the calls of a model: latency, generation speed and error rate."""
+
+    def __init__(self, window: int = 100) -> None:
+        self.latency = LatencyHistogram(window=window)
+        self._throughput: deque[float] = deque(maxlen=window)
+        self._outcomes: deque[bool] = deque(maxlen=window)
+
+    @property
+    def calls(self) -> int:
+        return len(self._outcomes)
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if not self._throughput:
+            return None
+        return sorted(self._throughput)[len(self._throughput) // 2]
+
+    def record_success(self, seconds: float, output_tokens: int = 0) -> None:
+        self._outcomes.append(True)
+        self.latency.record(seconds)
+        if output_tokens and seconds > 0:
+            self._throughput.append(output_tokens / seconds)
+
+    def record_failure(self) -> None:
+        self._outcomes.append(False)
+
+    def as_dict(self) -> dict[str, Any]:
+        p50 = self.latency.percentile(0.5)
+        tokens_per_second = self.tokens_per_second
+        return {
+            "calls": self.calls,
+            "p50_latency": round(p50, 2) if p50 is not None else None,
+            "tokens_per_second": round(tokens_per_second, 1) if tokens_per_second is not None else None,
+            "error_rate": round(self.error_rate, 2),
+        }
+
+
+class ModelRouter(metaclass=SingletonMeta):
+    """Process-wide per-(provider, model) call statistics, used to pick the model for a task automatically."""
+
+    def __init__(self) -> None:
+        self._stats: dict[tuple[str, str], ModelStats] = {}
+
+    def get(self, provider: str, model: str) -> ModelStats:
+        key = (provider, model)
+        if stats := self._stats.get(key):
+            return stats
+        stats = ModelStats()
+        self._stats[key] = stats
+        return stats
+
+    def record_success(self, provider: str, model: str, seconds: float, output_tokens: int = 0) -> None:
+        self.get(provider=provider, model=model).record_success(seconds=seconds, output_tokens=output_tokens)
+
+    def record_failure(self, provider: str, model: str) -> None:
+        self.get(provider=provider, model=model).record_failure()
+
+    def stats(self, provider: str, model: str) -> dict[str, Any] | None:
+        """Get the statistics of the model, None if it has not been called yet."""
+        stats = self._stats.get((provider, model))
+        return stats.as_dict() if stats and stats.calls else None
+
+    def score(self, provider: str, model: str, task_class: TaskClass, budget: float | None = None) -> float | None:
+        """Score the model for the task: the expected latency weighted by the model class fitness and error rate.
+
+        Args:
+            provider: Provider name.
+            model: Model name.
+            task_class: Task class.
+            budget: Latency budget, seconds.
+
+        Returns:
+            Score (the lower, the better) or None if the model should not be used now.
+        """
+        if CircuitBreakerRegistry().is_open(provider=provider, model=model):
+            return None
+
+        tier = get_model_tier(model)
+        stats = self._stats.get((provider, model))
+        latency = TIER_LATENCY_PRIORS[tier]
+        error_rate = 0.0
+        if stats:
+            error_rate = stats.error_rate
+            if stats.latency.count >= MIN_SAMPLES:
+                latency = stats.latency.percentile(0.5) or latency
+                p95 = stats.latency.percentile(0.95)
+                if budget is not None and p95 is not None and p95 > budget:
+                    return None
+        if error_rate >= MAX_ERROR_RATE:
+            return None
+        return latency * TIER_PENALTIES[task_class][tier] / (1 - error_rate)
+
+    def is_observed(self, provider: str, model: str) -> bool:
+        """Check if the model has been called enough times to trust its statistics."""
+        stats = self._stats.get((provider, model))
+        return bool(stats and stats.latency.count >= MIN_SAMPLES)
+
+    def rank(
+        self, candidates: list["ModelChangeSchema"], task_class: TaskClass, budget: float | None = None
+    ) -> list["ModelChangeSchema"]:
+        """Rank the models for the task, the best first. Unfit models (see `score`) are excluded."""
+        scored = [
+            (score, candidate)
+            for candidate in candidates
+            if (
+                score := self.score(
+                    provider=candidate.provider, model=candidate.name, task_class=task_class, budget=budget
+                )
+            )
+            is not None
+        ]
+        return [candidate for _, candidate in sorted(scored, key=lambda item: item[0])]
+
+
+async def pick_model(
+    user_id: int, task_class: TaskClass = "standard", budget: float | None = None
+) -> "ModelChangeSchema | None":
+    """Pick the fastest and cheapest model available to the user that fits the task.
+
+    Only the models with enough calls observed are considered: the model class guessed by the name alone does not tell
+    an outdated model from a current one, so until there are statistics the caller keeps its own model.
+
+    Args:
+        user_id: Telegram user ID.
+        task_class: Task class: light (i.e. summarization, extraction), standard or heavy (complex reasoning).
+        budget: Latency budget, seconds (models with the observed p95 latency over it are skipped).
+
+    Returns:
+        The model or None if routing is disabled or no observed model fits.
+    """
+    if not gpt_settings.model_routing:
+        return None
+
+    from chibi.services.providers.tools.utils import get_models_available_to_user
+
+    router = ModelRouter()
+    candidates = [
+        candidate
+        for candidate in await get_models_available_to_user(user_id=user_id)
+        if router.is_observed(provider=candidate.provider, model=candidate.name)
+    ]
+    ranked = router.rank(candidates=candidates, task_class=task_class, budget=budget)
+    if not ranked:
+        return None
+    logger.info(
+        f"[User {user_id}] Model routing picked {ranked[0].name} ({ranked[0].provider}) for a {task_class} task"
+    )
+    return ranked[0]
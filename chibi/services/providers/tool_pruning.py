@@ -0,0 +1,156 @@
+import json
+import math
+from dataclasses import dataclass
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.models import Message, ToolSchema, User
+from chibi.services.providers.context_window import split_into_turns
+
+# Tool results and call arguments not larger than this are kept as they are: a stub would not be any shorter.
+MIN_PRUNED_BYTES = 256
+
+
+@dataclass(frozen=True)
+class ToolPruningPolicy:
+    """Tool call history pruning policy of a thread.
+
+    Attributes:
+        keep_turns: Number of the latest turns whose tool calls are kept intact.
+        max_bytes: Max size of the tool calls and results kept intact, bytes (0 means no limit).
+    """
+
+    keep_turns: int
+    max_bytes: int
+
+
+def get_pruning_policy(user: User, thread_id: int) -> ToolPruningPolicy | None:
+    """Get the tool call history pruning policy of the thread (the thread overrides take precedence).
+
+    Args:
+        user: User.
+        thread_id: Thread ID.
+
+    Returns:
+        The policy, or None if the pruning is disabled for the thread.
+    """
+    overrides = user.thread_tool_pruning.get(thread_id)
+    if not gpt_settings.tool_history_pruning and not overrides:
+        return None
+    if overrides and not overrides.enabled:
+        return None
+    return ToolPruningPolicy(
+        keep_turns=overrides.keep_turns if overrides and overrides.keep_turns else gpt_settings.tool_history_keep_turns,
+        max_bytes=(
+            overrides.max_bytes
+            if overrides and overrides.max_bytes is not None
+            else gpt_settings.tool_history_max_bytes
+        ),
+    )
+
+
+def _get_tool_bytes(message: Message) -> int:
+    if message.role == "tool":
+        return len(message.content.encode())
+    return sum(len((tool_call.function.arguments or "").encode()) for tool_call in message.tool_calls or [])
+
+
+def _get_stub(message: Message, size: int) -> str:
+    try:
+        payload = json.loads(message.content)
+    except json.JSONDecodeError:
+        payload = None
+    if not isinstance(payload, dict):
+        payload = {}
+
+    stub = {
+        "tool_name": message.tool_name or payload.get("tool_name"),
+        "status": payload.get("status", "unknown"),
+        "pruned": f"the {size} bytes result was dropped from the history",
+    }
+    result = payload.get("result")
+    if isinstance(result, dict) and isinstance(handle := result.get("handle"), str):
+        stub["handle"] = handle
+    return json.dumps(stub, ensure_ascii=False)
+
+
+def _prune_message(message: Message) -> Message:
+    """Replace the tool result (or the large tool call arguments) of the message with a one-line stub.
+
+    Tool call IDs are kept, so every call still has its result. The copy gets a stable negative ID: it is rebuilt on
+    every history load, and the stable ID keeps the token count and provider format caches warm.
+    """
+    if message.pinned:
+        return message
+
+    if message.role == "tool" and message.tool_call_id:
+        size = len(message.content.encode())
+        if size <= MIN_PRUNED_BYTES:
+            return message
+        content = _get_stub(message=message, size=size)
+        return message.model_copy(
+            update={"id": -message.id, "content": content, "token_count": None, "token_counter": None}
+        )
+
+    if not message.tool_calls:
+        return message
+    tool_calls: list[ToolSchema] = []
+    for tool_call in message.tool_calls:
+        size = len((tool_call.function.arguments or "").encode())
+        # Arguments bound by a thought signature must be sent back as they are.
+        if size <= MIN_PRUNED_BYTES or tool_call.thought_signature:
+            tool_calls.append(tool_call)
+            continue
+        arguments = json.dumps({"pruned": f"the {size} bytes arguments were dropped from the history"})
+        function = tool_call.function.model_copy(update={"arguments": arguments})
+        tool_calls.append(tool_call.model_copy(update={"function": function}))
+    if all(new is old for new, old in zip(tool_calls, message.tool_calls)):
+        return message
+    return message.model_copy(
+        update={"id": -message.id, "tool_calls": tool_calls, "token_count": None, "token_counter": None}
+    )
+
+
+def prune_tool_history(messages: list[Message], policy: ToolPruningPolicy) -> list[Message]:
+    """Replace the stale tool calls and results with one-line stubs (tool name, status, size).
+
+    The tool calls of the turns older than `keep_turns` are pruned, and of the older turns beyond the `max_bytes`
+    budget of the tool calls and results. Both boundaries move in steps of `keep_turns` turns (the budget one is
+    rounded up), so the history prefix (and the provider prompt cache) is not invalidated with every new turn. The
+    latest turn is never pruned.
+    The stored history stays intact: the pruned messages are copies.
+
+    Args:
+        messages: Conversation messages.
+        policy: Pruning policy.
+
+    Returns:
+        Messages to send to the model.
+    """
+    turns = split_into_turns(messages)
+    # Turns before this index are pruned.
+    stale = max(0, (len(turns) - policy.keep_turns) // policy.keep_turns * policy.keep_turns)
+
+    if policy.max_bytes:
+        total = 0
+        for i in range(len(turns) - 1, stale - 1, -1):
+            total += sum(_get_tool_bytes(message) for message in turns[i])
+            if total > policy.max_bytes:
+                stale = math.ceil((i + 1) / policy.keep_turns) * policy.keep_turns
+                break
+    stale = min(stale, len(turns) - 1)
+
+    pruned_messages: list[Message] = []
+    pruned = saved = 0
+    for i, turn in enumerate(turns):
+        for message in turn:
+            if i < stale and (pruned_message := _prune_message(message)) is not message:
+                pruned += 1
+                saved += _get_tool_bytes(message) - _get_tool_bytes(pruned_message)
+                message = pruned_message
+            pruned_messages.append(message)
+
+    if pruned:
+        logger.info(f"Tool call history pruned: {pruned} messages of {stale} turns stubbed, ~{saved} bytes saved.")
+    return pruned_messages
@@ -8,12 +8,12 @@ from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
 
 from chibi.config import gpt_settings
-from chibi.schemas.app import ModeratorsAnswer
 from chibi.services.providers.tools.constants import CMD_STDOUT_LIMIT
 from chibi.services.providers.tools.exceptions import ToolException
+from chibi.services.providers.tools.moderation import ModerationGate
 from chibi.services.providers.tools.tool import ChibiTool
 from chibi.services.providers.tools.utils import AdditionalOptions
-from chibi.services.user import get_cwd, get_moderation_provider
+from chibi.services.user import get_cwd
 
 
 class RunCommandInTerminalTool(ChibiTool):
@@ -49,6 +49,8 @@ class RunCommandInTerminalTool(ChibiTool):
         ),
     )
     name = "run_command_in_terminal"
+    core = True
+    max_concurrency_per_user = 4
 
     @classmethod
     async def function(
@@ -65,25 +67,13 @@ class RunCommandInTerminalTool(ChibiTool):
         if cmd.startswith("cat ") and "|" not in cmd:
             raise ToolException("To read the whole file, please use the 'read_file' tool instead.")
 
-        moderation_provider = await get_moderation_provider(user_id=user_id)
-
-        logger.log("MODERATOR", f"[{caller_model}] Pre-moderating command: '{cmd}'. CWD: {cwd}")
-        moderator_answer: ModeratorsAnswer = await moderation_provider.moderate_command(
-            cmd=cmd, model=gpt_settings.moderation_model
-        )
-        if moderator_answer.verdict == "declined":
+        decision = await ModerationGate().moderate(cmd=cmd, cwd=cwd, user_id=user_id, caller_model=caller_model)
+        if not decision.accepted:
             raise ToolException(
-                f"Moderator ({moderation_provider.name}) DECLINED command '{cmd}' from model "
-                f"{caller_model}. Reason: {moderator_answer.reason}"
+                f"Moderator ({decision.moderator}) DECLINED command '{cmd}' from model "
+                f"{caller_model}. Reason: {decision.answer.reason}"
             )
 
-        logger.log(
-            "MODERATOR",
-            (
-                f"[{caller_model}] Moderator ({moderation_provider.name}) ACCEPTED command '{cmd}' "
-                f"from model {caller_model}"
-            ),
-        )
         logger.log("TOOL", f"[{caller_model}] Running command in terminal: {cmd}. CWD: {cwd}. Timeout: {timeout}")
         try:
             process = await asyncio.create_subprocess_shell(
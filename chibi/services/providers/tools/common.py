@@ -8,8 +8,10 @@ from openai.types.shared_params import FunctionDefinition
 
 from chibi.config import gpt_settings
 from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema
+from chibi.services.providers.routing import ModelRouter, TaskClass, get_model_tier, pick_model
 from chibi.services.providers.tools.exceptions import ToolException
-from chibi.services.providers.tools.tool import ChibiTool
+from chibi.services.providers.tools.selection import SEARCH_TOOLS_TOOL_NAME, ToolSelector, current_tool_selection
+from chibi.services.providers.tools.tool import ChibiTool, RegisteredChibiTools
 from chibi.services.providers.tools.utils import AdditionalOptions, get_models_available_to_user, get_sub_agent_response
 
 
@@ -21,7 +23,11 @@ class GetAvailableLLMModelsTool(ChibiTool):
         type="function",
         function=FunctionDefinition(
             name="get_available_llm_models",
-            description="Get LLM models and providers available for user.",
+            description=(
+                "Get LLM models and providers available for user. Every model has a tier (light models are fast "
+                "and cheap, heavy ones are the most capable) and, if it was used recently, the observed stats: "
+                "calls, p50 latency (seconds), tokens per second and error rate."
+            ),
             parameters={
                 "type": "object",
                 "properties": {},
@@ -30,6 +36,8 @@ class GetAvailableLLMModelsTool(ChibiTool):
         ),
     )
     name = "get_available_llm_models"
+    core = True
+    side_effects = False
 
     @classmethod
     async def function(cls, **kwargs: Unpack[AdditionalOptions]) -> dict[str, Any]:
@@ -41,9 +49,67 @@ class GetAvailableLLMModelsTool(ChibiTool):
 
         data: list[ModelChangeSchema] = await get_models_available_to_user(user_id=user_id, image_generation=False)
 
-        return {
-            "available_models": [info.model_dump(include={"provider", "name", "display_name"}) for info in data],
-        }
+        router = ModelRouter()
+        available_models = []
+        for info in data:
+            model_info = info.model_dump(include={"provider", "name", "display_name"})
+            model_info["tier"] = get_model_tier(info.name)
+            if stats := router.stats(provider=info.provider, model=info.name):
+                model_info["stats"] = stats
+            available_models.append(model_info)
+        return {"available_models": available_models}
+
+
+async def get_delegate_model(
+    user_id: int,
+    provider_name: str | None,
+    model_name: str | None,
+    task_class: TaskClass,
+    timeout: int | None,
+    caller_provider: str,
+    caller_model: str,
+) -> tuple[str, str]:
+    """Get the provider and model the task is delegated to.
+
+    The model specified by the caller is validated, otherwise it is picked by the model routing, falling back to the
+    caller's model.
+
+    Args:
+        user_id: Telegram user ID.
+        provider_name: Provider name requested by the caller.
+        model_name: Model name requested by the caller.
+        task_class: Task class used to pick the model.
+        timeout: Task timeout, seconds (the latency budget of the picked model).
+        caller_provider: Provider of the caller model.
+        caller_model: Caller model name.
+
+    Returns:
+        Provider name and model name.
+    """
+    if model_name and not provider_name:
+        raise ToolException("If you specify a model_name, you must also specify a provider_name.")
+
+    if provider_name and not model_name:
+        raise ToolException("If you specify a provider_name, you must also specify a model_name.")
+
+    if model_name:
+        assert isinstance(provider_name, str)
+        available_models: list[ModelChangeSchema] = await get_models_available_to_user(user_id=user_id)
+
+        model_setups = [
+            model for model in available_models if model.name == model_name and model.provider == provider_name
+        ]
+        if not model_setups:
+            model_provider_map = (f"{model.name} ({model.provider})" for model in available_models)
+            raise ToolException(
+                f"Model name <-> Provider name mismatch. Please check your model name and provider name."
+                f"Available models: {', '.join(model_provider_map)}"
+            )
+        return provider_name, model_name
+
+    if picked_model := await pick_model(user_id=user_id, task_class=task_class, budget=timeout):
+        return picked_model.provider, picked_model.name
+    return caller_provider, caller_model
 
 
 class DelegateTool(ChibiTool):
@@ -60,7 +126,8 @@ class DelegateTool(ChibiTool):
                 "as atomic as possible. Delegate preferably tasks that involve processing large volumes of "
                 "information, to avoid saturating your context. Try to assign simpler tasks to cheaper and faster "
                 "models. You can find out the list of available models by executing tool get_available_llm_models. "
-                "If no model/provider specified, your model will be used (be sure you know your model)."
+                "If no model/provider specified, the fastest and cheapest model fitting the task_class is picked "
+                "automatically (or your model is used, if automatic routing is disabled)."
             ),
             parameters={
                 "type": "object",
@@ -69,12 +136,24 @@ class DelegateTool(ChibiTool):
                     "provider_name": {"type": "string", "description": "Provider name, i.e. 'OpenAI'"},
                     "model_name": {"type": "string", "description": "Model name, i.e. 'gpt-5.2'"},
                     "timeout": {"type": "integer", "description": "Timeout in seconds", "default": 600},
+                    "task_class": {
+                        "type": "string",
+                        "enum": ["light", "standard", "heavy"],
+                        "description": (
+                            "Task complexity, used to pick the model if none specified: light (extraction, "
+                            "summarization, formatting), standard, or heavy (complex reasoning, coding)"
+                        ),
+                        "default": "standard",
+                    },
                 },
                 "required": ["prompt"],
             },
         ),
     )
     name = "delegate_task"
+    core = True
+    max_concurrency_per_user = 3
+    cancellation_group = "delegation"
 
     @classmethod
     async def function(
@@ -83,37 +162,23 @@ class DelegateTool(ChibiTool):
         provider_name: str | None = None,
         model_name: str | None = None,
         timeout: int | None = gpt_settings.delegate_task_timeout,
+        task_class: TaskClass = "standard",
         **kwargs: Unpack[AdditionalOptions],
     ) -> dict[str, str]:
         user_id = kwargs.get("user_id")
         if not user_id:
             raise ToolException("This function requires user_id to be automatically provided.")
 
-        if model_name and not provider_name:
-            raise ToolException("If you specify a model_name, you must also specify a provider_name.")
-
-        if provider_name and not model_name:
-            raise ToolException("If you specify a provider_name, you must also specify a model_name.")
-
         caller_model = kwargs.get("caller_model", "unknown model")
-        caller_provider = kwargs["caller_provider"]
-
-        if model_name:
-            assert isinstance(provider_name, str)
-            available_models: list[ModelChangeSchema] = await get_models_available_to_user(user_id=user_id)
-
-            model_setups = [
-                model for model in available_models if model.name == model_name and model.provider == provider_name
-            ]
-            if not model_setups:
-                model_provider_map = (f"{model.name} ({model.provider})" for model in available_models)
-                raise ToolException(
-                    f"Model name <-> Provider name mismatch. Please check your model name and provider name."
-                    f"Available models: {', '.join(model_provider_map)}"
-                )
-        else:
-            model_name = caller_model
-            provider_name = caller_provider
+        provider_name, model_name = await get_delegate_model(
+            user_id=user_id,
+            provider_name=provider_name,
+            model_name=model_name,
+            task_class=task_class,
+            timeout=timeout,
+            caller_provider=kwargs["caller_provider"],
+            caller_model=caller_model,
+        )
 
         logger.log("DELEGATE", f"[{caller_model}] Delegating a task to {model_name}: {prompt}")
 
@@ -130,6 +195,138 @@ class DelegateTool(ChibiTool):
         return {"response": response.answer}
 
 
+class DelegateManyTool(ChibiTool):
+    register = gpt_settings.allow_delegation
+    run_in_background_by_default = True
+    allow_model_to_change_background_mode = False
+    definition = ChatCompletionToolParam(
+        type="function",
+        function=FunctionDefinition(
+            name="delegate_many",
+            description=(
+                "Delegate several independent tasks to sub-agents running in parallel. Each prompt is handled by a "
+                "separate sub-agent and should be exhaustive and expect a concrete result, just like for "
+                "delegate_task. All the results are returned together in one response, in the order of the prompts. "
+                "Prefer it over several delegate_task calls whenever the tasks do not depend on each other."
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "prompts": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Prompts, one per sub-agent",
+                    },
+                    "provider_name": {"type": "string", "description": "Provider name, i.e. 'OpenAI'"},
+                    "model_name": {"type": "string", "description": "Model name, i.e. 'gpt-5.2'"},
+                    "timeout": {"type": "integer", "description": "Timeout of each task in seconds", "default": 600},
+                    "task_class": {
+                        "type": "string",
+                        "enum": ["light", "standard", "heavy"],
+                        "description": (
+                            "Complexity of the tasks, used to pick the model if none specified: light (extraction, "
+                            "summarization, formatting), standard, or heavy (complex reasoning, coding)"
+                        ),
+                        "default": "standard",
+                    },
+                },
+                "required": ["prompts"],
+            },
+        ),
+    )
+    name = "delegate_many"
+    core = True
+    max_concurrency_per_user = 2
+    cancellation_group = "delegation"
+
+    @classmethod
+    async def _run_sub_agent(
+        cls,
+        semaphore: asyncio.Semaphore,
+        index: int,
+        user_id: int,
+        prompt: str,
+        provider_name: str,
+        model_name: str,
+        timeout: int | None,
+    ) -> dict[str, Any]:
+        async with semaphore:
+            coro = get_sub_agent_response(
+                user_id=user_id, prompt=prompt, provider_name=provider_name, model_name=model_name
+            )
+            try:
+                response: ChatResponseSchema = await asyncio.wait_for(fut=coro, timeout=timeout)
+            except asyncio.TimeoutError:
+                return {"task": index, "status": "error", "error": "Timed out waiting for delegated task to complete!"}
+            except Exception as e:
+                return {"task": index, "status": "error", "error": str(e)}
+        return {"task": index, "status": "ok", "response": response.answer}
+
+    @classmethod
+    async def function(
+        cls,
+        prompts: list[str],
+        provider_name: str | None = None,
+        model_name: str | None = None,
+        timeout: int | None = gpt_settings.delegate_task_timeout,
+        task_class: TaskClass = "standard",
+        **kwargs: Unpack[AdditionalOptions],
+    ) -> dict[str, Any]:
+        user_id = kwargs.get("user_id")
+        if not user_id:
+            raise ToolException("This function requires user_id to be automatically provided.")
+
+        if not prompts:
+            raise ToolException("At least one prompt is required.")
+
+        caller_model = kwargs.get("caller_model", "unknown model")
+        provider_name, model_name = await get_delegate_model(
+            user_id=user_id,
+            provider_name=provider_name,
+            model_name=model_name,
+            task_class=task_class,
+            timeout=timeout,
+            caller_provider=kwargs["caller_provider"],
+            caller_model=caller_model,
+        )
+
+        logger.log("DELEGATE", f"[{caller_model}] Delegating {len(prompts)} tasks to {model_name}")
+
+        semaphore = asyncio.Semaphore(gpt_settings.delegate_many_max_concurrency)
+        tasks = [
+            asyncio.ensure_future(
+                cls._run_sub_agent(
+                    semaphore=semaphore,
+                    index=index,
+                    user_id=user_id,
+                    prompt=prompt,
+                    provider_name=provider_name,
+                    model_name=model_name,
+                    timeout=timeout,
+                )
+            )
+            for index, prompt in enumerate(prompts, start=1)
+        ]
+        results: list[dict[str, Any]] = [{} for _ in prompts]
+        interface = kwargs.get("interface")
+        try:
+            for done, future in enumerate(asyncio.as_completed(tasks), start=1):
+                result = await future
+                results[result["task"] - 1] = result
+                logger.log(
+                    "SUBAGENT",
+                    f"[{model_name}] Delegated task {result['task']} is done ({done}/{len(prompts)}): {result}",
+                )
+                if interface and gpt_settings.show_llm_thoughts:
+                    await interface.send_message(message=f"🧩 Sub-tasks done: {done}/{len(prompts)}", reply=False)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        failed = sum(1 for result in results if result["status"] != "ok")
+        return {"succeeded": len(prompts) - failed, "failed": failed, "results": results}
+
+
 class GetCurrentDatetimeTool(ChibiTool):
     register = True
     definition = ChatCompletionToolParam(
@@ -141,6 +338,8 @@ class GetCurrentDatetimeTool(ChibiTool):
         ),
     )
     name = "get_current_datetime"
+    core = True
+    side_effects = False
 
     @classmethod
     async def function(cls, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
@@ -149,3 +348,41 @@ class GetCurrentDatetimeTool(ChibiTool):
         return {
             "datetime_now": now.strftime("%Y-%m-%d %H:%M:%S"),
         }
+
+
+class SearchToolsTool(ChibiTool):
+    register = gpt_settings.tool_selection
+    core = True
+    side_effects = False
+    allow_model_to_change_background_mode = False
+    definition = ChatCompletionToolParam(
+        type="function",
+        function=FunctionDefinition(
+            name=SEARCH_TOOLS_TOOL_NAME,
+            description=(
+                "Only a part of the available tools is provided to you with each request. If you need a tool you "
+                "do not have (i.e. to send a file or media, edit files, generate images or music, manage MCP "
+                "servers or threads), search for it by a short description of the action. The tools found become "
+                "available to you right away."
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "What the tool should do, i.e. 'send image to user'"},
+                },
+                "required": ["query"],
+            },
+        ),
+    )
+    name = SEARCH_TOOLS_TOOL_NAME
+
+    @classmethod
+    async def function(cls, query: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, Any]:
+        logger.log("TOOL", f"[{kwargs.get('caller_model', 'unknown model')}] Searching tools: {query}")
+        names = ToolSelector().search(query=query, limit=gpt_settings.tool_selection_search_limit)
+        if selection := current_tool_selection.get():
+            selection.add(names)
+        tools = [RegisteredChibiTools.tools_map[name].definition["function"] for name in names]
+        return {
+            "tools_found": [{"name": tool["name"], "description": tool.get("description", "")} for tool in tools],
+        }
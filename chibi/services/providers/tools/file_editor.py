@@ -5,6 +5,7 @@ This module provides functions for efficiently editing files through LLM tools.
 
 import os
 import re
+import shlex
 from pathlib import Path
 from typing import Any, Unpack
 
@@ -13,11 +14,10 @@ from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
 
 from chibi.config import gpt_settings
-from chibi.schemas.app import ModeratorsAnswer
 from chibi.services.providers.tools.exceptions import ToolException
+from chibi.services.providers.tools.moderation import ModerationGate
 from chibi.services.providers.tools.tool import ChibiTool
 from chibi.services.providers.tools.utils import AdditionalOptions
-from chibi.services.user import get_moderation_provider
 
 
 class ReplaceInFileTool(ChibiTool):
@@ -932,6 +932,8 @@ class ReadFileTool(ChibiTool):
         ),
     )
     name = "read_file"
+    core = True
+    side_effects = False
 
     @classmethod
     async def function(
@@ -955,24 +957,14 @@ class ReadFileTool(ChibiTool):
             raise ToolException("This function requires user_id to be automatically provided.")
 
         # Moderate first
-        moderation_provider = await get_moderation_provider(user_id=user_id)
-        cmd = f"cat {full_path}"
-
-        logger.log("MODERATOR", f"[{caller_model}] Pre-moderating file read: '{full_path}'")
-        moderator_answer: ModeratorsAnswer = await moderation_provider.moderate_command(
-            cmd=cmd, model=gpt_settings.moderation_model
+        decision = await ModerationGate().moderate(
+            cmd=f"cat {shlex.quote(full_path)}", user_id=user_id, caller_model=caller_model
         )
-        if moderator_answer.verdict == "declined":
+        if not decision.accepted:
             raise ToolException(
-                f"Moderator ({moderation_provider.name}) DECLINED file read '{full_path}'. "
-                f"Reason: {moderator_answer.reason}"
+                f"Moderator ({decision.moderator}) DECLINED file read '{full_path}'. Reason: {decision.answer.reason}"
             )
 
-        logger.log(
-            "MODERATOR",
-            (f"[{caller_model}] Moderator ({moderation_provider.name}) ACCEPTED file read '{full_path}'"),
-        )
-
         try:
             path = Path(full_path).expanduser().resolve()
             if not path.exists():
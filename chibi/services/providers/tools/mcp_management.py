@@ -1,10 +1,10 @@
+from __future__ import annotations
+
 import os
-from typing import Any, Callable, Coroutine, cast
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, cast
 
 from dotenv import dotenv_values
 from loguru import logger
-from mcp import ClientSession
-from mcp.types import CallToolResult
 from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
 
@@ -14,6 +14,10 @@ from chibi.services.providers.tools.tool import ChibiTool, RegisteredChibiTools
 from chibi.services.providers.tools.utils import AdditionalOptions
 from chibi.services.providers.utils import escape_and_truncate
 
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from mcp.types import CallToolResult
+
 JsonNode = dict[str, Any] | list[Any] | str | int | float | bool | None
 
 
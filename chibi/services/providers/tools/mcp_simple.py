@@ -1,8 +1,5 @@
 from typing import Any, Unpack
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
 from chibi.services.providers.tools.tool import ChibiTool
 from chibi.services.providers.tools.utils import AdditionalOptions
 
@@ -12,6 +9,7 @@ class McpEchoTool(ChibiTool):
 
     register = False
     name = "mcp_echo"
+    side_effects = False
     definition = {
         "type": "function",
         "function": {
@@ -44,6 +42,9 @@ if __name__ == "__main__":
         import os
         import tempfile
 
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
         with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
             f.write(server_script)
             server_path = f.name
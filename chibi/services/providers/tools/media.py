@@ -73,6 +73,7 @@ class GetAvailableImageModelsTool(ChibiTool):
         ),
     )
     name = "get_available_image_generation_models"
+    side_effects = False
 
     @classmethod
     async def function(cls, **kwargs: Unpack[AdditionalOptions]) -> dict[str, Any]:
@@ -118,6 +119,7 @@ class GenerateImageTool(ChibiTool):
         ),
     )
     name = "generate_image"
+    max_concurrency_per_user = 2
 
     @classmethod
     async def generate_and_send_image(cls, provider: str, model: str, prompt: str, interface: UserInterface) -> None:
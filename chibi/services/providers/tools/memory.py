@@ -1,11 +1,13 @@
 import os
-from typing import Unpack
+from typing import Any, Unpack
 
 from loguru import logger
 from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
+from pydantic import ValidationError
 
 from chibi.config import application_settings, gpt_settings
+from chibi.models import ToolPruningSettings
 from chibi.services.providers.tools.exceptions import ToolException
 from chibi.services.providers.tools.tool import ChibiTool
 from chibi.services.providers.tools.utils import AdditionalOptions
@@ -15,9 +17,11 @@ from chibi.services.user import (
     drop_tool_call_history,
     get_cwd,
     set_info,
+    set_tool_pruning_settings,
     set_working_dir,
     summarize_history,
 )
+from chibi.storage.blobs import BlobStore
 
 
 class SetUserInfoTool(ChibiTool):
@@ -40,6 +44,7 @@ class SetUserInfoTool(ChibiTool):
         ),
     )
     name = "set_user_info"
+    core = True
 
     @classmethod
     async def function(cls, new_user_info: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
@@ -101,6 +106,7 @@ class GetCurrentWorkingDirTool(ChibiTool):
         ),
     )
     name = "get_current_working_dir"
+    side_effects = False
 
     @classmethod
     async def function(cls, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
@@ -139,6 +145,7 @@ class ClearToolCallHistoryTool(ChibiTool):
         ),
     )
     name = "clear_tool_call_history"
+    core = True
 
     @classmethod
     async def function(cls, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
@@ -152,6 +159,125 @@ class ClearToolCallHistoryTool(ChibiTool):
         return {"status": "ok"}
 
 
+class ConfigureToolHistoryPruningTool(ChibiTool):
+    register = True
+    definition = ChatCompletionToolParam(
+        type="function",
+        function=FunctionDefinition(
+            name="configure_tool_history_pruning",
+            description=(
+                "Configure the automatic pruning of the tool call history in the current thread: the results (and "
+                "the large arguments) of the tool calls made more than `keep_turns` turns ago, or beyond the "
+                "`max_bytes` budget, are replaced with short stubs. Keep more when the task needs the old results, "
+                "prune more when the thread is long. Omitted parameters reset to the defaults "
+                f"(keep_turns={gpt_settings.tool_history_keep_turns}, max_bytes={gpt_settings.tool_history_max_bytes})."
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "enabled": {"type": "boolean", "description": "Whether to prune the tool call history."},
+                    "keep_turns": {
+                        "type": "integer",
+                        "description": "Number of the latest turns whose tool calls are kept intact.",
+                    },
+                    "max_bytes": {
+                        "type": "integer",
+                        "description": "Max size of the tool calls and results kept intact, bytes (0 - no limit).",
+                    },
+                },
+                "required": ["enabled"],
+            },
+        ),
+    )
+    name = "configure_tool_history_pruning"
+
+    @classmethod
+    async def function(
+        cls,
+        enabled: bool,
+        keep_turns: int | None = None,
+        max_bytes: int | None = None,
+        **kwargs: Unpack[AdditionalOptions],
+    ) -> dict[str, str]:
+        user_id = kwargs.get("user_id")
+        if not user_id:
+            raise ToolException("This function requires user_id to be automatically provided.")
+        interface = cls.get_interface(kwargs=kwargs)
+        try:
+            settings = ToolPruningSettings(enabled=enabled, keep_turns=keep_turns, max_bytes=max_bytes)
+        except ValidationError as e:
+            raise ToolException(f"Invalid pruning settings: {e}")
+
+        logger.log(
+            "TOOL",
+            f"[{kwargs.get('caller_model', 'unknown model')}] Configuring tool call history pruning in thread "
+            f"#{interface.thread_id}: {settings.model_dump()}",
+        )
+        await set_tool_pruning_settings(user_id=user_id, thread_id=interface.thread_id, settings=settings)
+        return {"status": "ok"}
+
+
+class FetchToolResultTool(ChibiTool):
+    register = gpt_settings.tool_result_spill_threshold > 0
+    core = True
+    side_effects = False
+    allow_model_to_change_background_mode = False
+    definition = ChatCompletionToolParam(
+        type="function",
+        function=FunctionDefinition(
+            name="fetch_tool_result",
+            description=(
+                "Read a large tool result moved out of the conversation history (only its beginning is kept there) "
+                "by its handle. Read it by ranges: the response tells the offset to continue from."
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "Result handle, i.e. 'blob:3f2a...'"},
+                    "offset": {"type": "integer", "description": "Offset to read from, characters", "default": 0},
+                    "length": {
+                        "type": "integer",
+                        "description": (
+                            f"Number of characters to read (max {gpt_settings.fetch_tool_result_max_chars})"
+                        ),
+                        "default": gpt_settings.fetch_tool_result_max_chars,
+                    },
+                },
+                "required": ["handle"],
+            },
+        ),
+    )
+    name = "fetch_tool_result"
+
+    @classmethod
+    async def function(
+        cls, handle: str, offset: int = 0, length: int | None = None, **kwargs: Unpack[AdditionalOptions]
+    ) -> dict[str, Any]:
+        user_id = kwargs.get("user_id")
+        if not user_id:
+            raise ToolException("This function requires user_id to be automatically provided.")
+
+        interface = kwargs.get("interface")
+        # Sub-agents have no thread of their own and read the results of the parent conversation.
+        thread_id = interface.thread_id if interface else None
+        logger.log("TOOL", f"[{kwargs.get('caller_model', 'unknown model')}] Fetching tool result {handle}")
+        try:
+            data = await BlobStore().get(user_id=user_id, handle=handle, thread_id=thread_id)
+        except ValueError as e:
+            raise ToolException(str(e))
+        if data is None:
+            raise ToolException(f"No tool result found by handle '{handle}'. It may have expired.")
+
+        text = data.decode(errors="replace")
+        offset = max(offset, 0)
+        length = min(length or gpt_settings.fetch_tool_result_max_chars, gpt_settings.fetch_tool_result_max_chars)
+        end = min(offset + length, len(text))
+        response: dict[str, Any] = {"content": text[offset:end], "offset": offset, "total_length": len(text)}
+        if end < len(text):
+            response["next_offset"] = end
+        return response
+
+
 class SummarizeHistoryTool(ChibiTool):
     register = True
     definition = ChatCompletionToolParam(
@@ -175,6 +301,7 @@ class SummarizeHistoryTool(ChibiTool):
         ),
     )
     name = "summarize_history"
+    core = True
 
     @classmethod
     async def function(cls, summary: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
@@ -207,6 +334,7 @@ class LoadBuiltinSkillTool(ChibiTool):
         ),
     )
     name = "load_builtin_skill"
+    core = True
 
     @classmethod
     async def function(cls, skill_name: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, str]:
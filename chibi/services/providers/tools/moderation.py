@@ -0,0 +1,598 @@
+import asyncio
+import fnmatch
+import os
+import shlex
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from cachetools import TTLCache
+from loguru import logger
+
+from chibi.config import application_settings, gpt_settings
+from chibi.schemas.app import ModeratorsAnswer
+from chibi.services.providers.latency import LatencyHistogram, LatencyRegistry
+from chibi.services.user import get_moderation_provider
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from chibi.services.providers.provider import Provider
+
+# Read-only commands (or command prefixes) accepted without asking the moderator model, as long as all their
+# arguments stay within the agent's home directory and their flags are in SAFE_FLAGS.
+DEFAULT_ALLOWLIST = (
+    "ls",
+    "pwd",
+    "cat",
+    "head",
+    "tail",
+    "wc",
+    "grep",
+    "rg",
+    "find",
+    "tree",
+    "file",
+    "stat",
+    "du",
+    "diff",
+    "which",
+    "echo",
+    "date",
+    "whoami",
+    "uname",
+    "git status",
+    "git log",
+    "git diff",
+    "git show",
+    "git branch",
+)
+# Commands (or command prefixes) declined without asking the moderator model.
+DEFAULT_DENYLIST = (
+    "mkfs",
+    "fdisk",
+    "shutdown",
+    "reboot",
+    "halt",
+    "poweroff",
+    "useradd",
+    "userdel",
+    "usermod",
+    "groupadd",
+    "groupdel",
+    "passwd",
+    "chpasswd",
+    "visudo",
+    "printenv",
+    "rm -rf /",
+    "rm -rf ~",
+)
+# Paths (glob patterns, matched against the resolved path and its name) nobody may touch.
+DEFAULT_DENIED_PATHS = (
+    ".env",
+    ".env.*",
+    "*/.ssh/*",
+    "*/.aws/*",
+    "*/.gnupg/*",
+    ".bash_history",
+    ".zsh_history",
+    "/etc/shadow",
+    "/etc/gshadow",
+    "/etc/sudoers",
+    "/etc/sudoers.d/*",
+)
+SAFE_ENV_FILES = frozenset({".env.example", ".env.template", ".env.sample"})
+
+_CONTROL_OPERATORS = frozenset({";", "&&", "||", "|", "\n"})
+
+# Normalized command, cwd, moderator provider name and model.
+VerdictKey = tuple[str, str, str, str]
+
+
+def _flags(short: str = "", long: tuple[str, ...] = ()) -> frozenset[str]:
+    return frozenset({f"-{char}" for char in short} | set(long))
+
+
+# Flags the allowlisted commands may be used with on the fast path. Any other flag (i.e. `rg --pre`, `tree -o`,
+# `find -delete`, `git diff --output`) sends the command to the moderator model, as well as any flag of the commands
+# added to MODERATION_ALLOWLIST without a table here. Digits are allowed in the short flag clusters (`head -5`).
+SAFE_FLAGS: dict[str, frozenset[str]] = {
+    "ls": _flags("1aAcdFhilLnrRsStuUx", ("--all", "--almost-all", "--human-readable", "--recursive", "--reverse")),
+    "pwd": _flags("LP"),
+    "cat": _flags("AbeEnstTuv", ("--number", "--show-all")),
+    "head": _flags("cnqv", ("--lines", "--bytes", "--quiet", "--verbose")),
+    "tail": _flags("cnqv", ("--lines", "--bytes", "--quiet", "--verbose")),
+    "wc": _flags("clmwL", ("--lines", "--words", "--bytes", "--chars")),
+    "grep": _flags(
+        "abcEFGhHiIlLnoqrRsvwxyABCem",
+        (
+            "--include",
+            "--exclude",
+            "--exclude-dir",
+            "--color",
+            "--ignore-case",
+            "--recursive",
+            "--line-number",
+            "--count",
+            "--files-with-matches",
+            "--context",
+            "--after-context",
+            "--before-context",
+            "--word-regexp",
+            "--fixed-strings",
+            "--extended-regexp",
+            "--invert-match",
+            "--max-count",
+            "--regexp",
+        ),
+    ),
+    "rg": _flags(
+        "ABCcFgHhiIlLmnNoqsStTuUvwx",
+        (
+            "--glob",
+            "--type",
+            "--type-not",
+            "--ignore-case",
+            "--smart-case",
+            "--fixed-strings",
+            "--word-regexp",
+            "--invert-match",
+            "--line-number",
+            "--count",
+            "--files",
+            "--files-with-matches",
+            "--hidden",
+            "--no-ignore",
+            "--max-count",
+            "--max-depth",
+            "--context",
+            "--after-context",
+            "--before-context",
+            "--follow",
+            "--json",
+            "--only-matching",
+            "--multiline",
+            "--regexp",
+            "--color",
+            "--heading",
+            "--no-heading",
+        ),
+    ),
+    "find": _flags(
+        "LPH",
+        (
+            "-name",
+            "-iname",
+            "-path",
+            "-ipath",
+            "-regex",
+            "-iregex",
+            "-type",
+            "-maxdepth",
+            "-mindepth",
+            "-size",
+            "-mtime",
+            "-mmin",
+            "-newer",
+            "-empty",
+            "-user",
+            "-group",
+            "-perm",
+            "-readable",
+            "-print",
+            "-print0",
+            "-prune",
+            "-not",
+            "-and",
+            "-or",
+            "-a",
+            "-o",
+            "-xdev",
+            "-depth",
+            "-follow",
+        ),
+    ),
+    "tree": _flags("aCdDfFghiIJlLpPsu", ("--dirsfirst", "--noreport", "--charset")),
+    "file": _flags("bhiLkN", ("--mime", "--mime-type", "--brief")),
+    "stat": _flags("cfLt", ("--format", "--printf", "--terse", "--dereference")),
+    "du": _flags("acdhkLmsx", ("--max-depth", "--summarize", "--human-readable", "--all", "--apparent-size")),
+    "diff": _flags(
+        "abBciEiNqrsStuwyU",
+        ("--unified", "--recursive", "--brief", "--ignore-all-space", "--side-by-side", "--color", "--exclude"),
+    ),
+    "which": _flags("a"),
+    "echo": _flags("neE"),
+    "date": _flags("dIRru", ("--utc", "--date", "--iso-8601", "--rfc-3339", "--rfc-email", "--reference")),
+    "whoami": _flags(),
+    "uname": _flags("aimnoprsv", ("--all",)),
+    "git status": _flags("bsuv", ("--short", "--branch", "--porcelain", "--untracked-files", "--ignored")),
+    "git log": _flags(
+        "pn",
+        (
+            "--oneline",
+            "--graph",
+            "--stat",
+            "--shortstat",
+            "--name-only",
+            "--name-status",
+            "--decorate",
+            "--all",
+            "--author",
+            "--since",
+            "--until",
+            "--grep",
+            "--format",
+            "--pretty",
+            "--max-count",
+            "--reverse",
+            "--follow",
+            "--patch",
+            "--abbrev-commit",
+            "--no-merges",
+            "--first-parent",
+            "--date",
+        ),
+    ),
+    "git diff": _flags(
+        "uw",
+        (
+            "--stat",
+            "--shortstat",
+            "--name-only",
+            "--name-status",
+            "--cached",
+            "--staged",
+            "--color",
+            "--no-color",
+            "--word-diff",
+            "--unified",
+            "--ignore-all-space",
+        ),
+    ),
+    "git show": _flags(
+        "s", ("--stat", "--name-only", "--name-status", "--oneline", "--format", "--pretty", "--no-patch")
+    ),
+    "git branch": _flags("arv", ("--all", "--remotes", "--list", "--show-current", "--verbose")),
+}
+# Commands accepted on the fast path without positional arguments only (`git branch name` creates a branch).
+FLAGS_ONLY_COMMANDS = frozenset({"git branch"})
+# Commands using single-dash long options, which are not split into the short flag clusters.
+_SINGLE_DASH_LONG_OPTIONS = frozenset({"find"})
+
+
+@dataclass
+class ModerationDecision:
+    """Moderation result.
+
+    Attributes:
+        answer: Moderator's answer.
+        source: How the decision was made: "allowlist", "denylist", "cache" or "llm".
+        moderator: Name of the moderator (the provider name or "local rules").
+        latency: Time spent on the decision, seconds.
+    """
+
+    answer: ModeratorsAnswer
+    source: str
+    moderator: str
+    latency: float = 0.0
+
+    @property
+    def accepted(self) -> bool:
+        return self.answer.verdict != "declined"
+
+
+def _split_command(cmd: str) -> list[list[str]] | None:
+    """Split the shell command into simple commands (pipelines and lists are split by their operators).
+
+    Returns:
+        List of the simple commands' tokens or None if the command could not be parsed.
+    """
+    lexer = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        return None
+
+    commands: list[list[str]] = [[]]
+    for token in tokens:
+        if token in _CONTROL_OPERATORS:
+            commands.append([])
+        else:
+            commands[-1].append(token)
+    return [command for command in commands if command]
+
+
+def normalize_command(cmd: str) -> str:
+    """Get the canonical form of the command, so the commands differing in whitespace/quoting share the verdict."""
+    try:
+        return shlex.join(shlex.split(cmd))
+    except ValueError:
+        return " ".join(cmd.split())
+
+
+def _match_rule(tokens: list[str], rules: list[str]) -> str | None:
+    """Get the longest rule (a command prefix) the command matches."""
+    program = [os.path.basename(tokens[0]), *tokens[1:]]
+    matched: str | None = None
+    for rule in rules:
+        prefix = rule.split()
+        if prefix and program[: len(prefix)] == prefix and (not matched or len(prefix) > len(matched.split())):
+            matched = " ".join(prefix)
+    return matched
+
+
+def _is_safe_flag(flag: str, rule: str) -> bool:
+    safe_flags = SAFE_FLAGS.get(rule, frozenset())
+    name = flag.split("=")[0]
+    if flag == "--" or name in safe_flags:
+        return True
+    if flag.startswith("--") or rule in _SINGLE_DASH_LONG_OPTIONS:
+        return False
+    return all(char.isdigit() or f"-{char}" in safe_flags for char in flag[1:])
+
+
+def _resolve(token: str, cwd: str) -> Path:
+    return Path(cwd, os.path.expanduser(token)).resolve()
+
+
+def _is_denied_path(path: Path, patterns: list[str]) -> bool:
+    if path.name in SAFE_ENV_FILES:
+        return False
+    return any(fnmatch.fnmatch(str(path), pattern) or fnmatch.fnmatch(path.name, pattern) for pattern in patterns)
+
+
+def _is_within(path: Path, root: Path) -> bool:
+    return path == root or root in path.parents
+
+
+def classify_command(cmd: str, cwd: str | None = None) -> ModeratorsAnswer | None:
+    """Classify the command using the local rules only.
+
+    Args:
+        cmd: Shell command.
+        cwd: Working directory of the command.
+
+    Returns:
+        Moderator's answer or None if the command should be moderated by the LLM.
+    """
+    commands = _split_command(cmd)
+    if not commands:
+        return None
+
+    cwd = cwd or os.getcwd()
+    denylist = gpt_settings.moderation_denylist or list(DEFAULT_DENYLIST)
+    denied_paths = gpt_settings.moderation_denied_paths or list(DEFAULT_DENIED_PATHS)
+
+    for tokens in commands:
+        if _match_rule(tokens, denylist):
+            return ModeratorsAnswer(verdict="declined", reason=f"'{tokens[0]}' is in the moderation denylist.")
+        for token in tokens[1:]:
+            if not token.startswith("-") and _is_denied_path(_resolve(token, cwd=cwd), denied_paths):
+                return ModeratorsAnswer(verdict="declined", reason=f"Access to '{token}' is forbidden.")
+
+    # Expansions, substitutions, redirections and background jobs are left for the LLM to judge.
+    if any(char in cmd for char in "$`\n<>&(){}"):
+        return None
+
+    allowlist = gpt_settings.moderation_allowlist or list(DEFAULT_ALLOWLIST)
+    home_dir = Path(application_settings.home_dir).expanduser().resolve()
+    if not _is_within(Path(cwd).expanduser().resolve(), home_dir):
+        return None
+
+    for tokens in commands:
+        if not (rule := _match_rule(tokens, allowlist)):
+            return None
+        for token in tokens[len(rule.split()) :]:
+            if token.startswith("-"):
+                if not _is_safe_flag(token, rule=rule):
+                    return None
+            elif rule in FLAGS_ONLY_COMMANDS or not _is_within(_resolve(token, cwd=cwd), home_dir):
+                return None
+    return ModeratorsAnswer(verdict="accepted")
+
+
+@dataclass
+class _PendingBatch:
+    provider: "Provider"
+    model: str | None
+    commands: list[tuple[str, "asyncio.Future[ModeratorsAnswer]"]] = field(default_factory=list)
+    flush_handle: asyncio.TimerHandle | None = None
+
+
+class ModerationBatcher:
+    """Coalesces the concurrent moderation requests into batches.
+
+    The requests of the same user to the same moderator (provider instance and model) arriving within
+    `moderation_batch_window` seconds (i.e. the parallel tool calls of a single round) are sent as a single structured
+    prompt returning a verdict per command. The commands of different users never share a prompt, so one user's
+    command text cannot sway the verdicts of the other's. If the provider does not support batches or the answer
+    could not be parsed, the commands are moderated one by one.
+    """
+
+    def __init__(self) -> None:
+        self._batches: dict[tuple[int, int, str | None], _PendingBatch] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches_count = 0
+        self.fallbacks_count = 0
+
+    async def moderate(
+        self, provider: "Provider", cmd: str, user_id: int, model: str | None = None
+    ) -> ModeratorsAnswer:
+        if gpt_settings.moderation_batch_window <= 0:
+            return await provider.moderate_command(cmd=cmd, model=model)
+
+        loop = asyncio.get_running_loop()
+        # Provider instances are shared per (provider, API key), so the instance identifies the moderator.
+        key = (user_id, id(provider), model)
+        if not (batch := self._batches.get(key)):
+            batch = _PendingBatch(provider=provider, model=model)
+            batch.flush_handle = loop.call_later(gpt_settings.moderation_batch_window, self._flush, key)
+            self._batches[key] = batch
+
+        future: asyncio.Future[ModeratorsAnswer] = loop.create_future()
+        batch.commands.append((cmd, future))
+        if len(batch.commands) >= gpt_settings.moderation_batch_max_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: tuple[int, int, str | None]) -> None:
+        if not (batch := self._batches.pop(key, None)):
+            return None
+        if batch.flush_handle:
+            batch.flush_handle.cancel()
+        task = asyncio.ensure_future(self._moderate_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _moderate_batch(self, batch: _PendingBatch) -> None:
+        cmds = [cmd for cmd, _ in batch.commands]
+        results: list[ModeratorsAnswer | BaseException] | None = None
+        if len(cmds) > 1:
+            try:
+                answers = await batch.provider.moderate_commands(cmds=cmds, model=batch.model)
+                if len(answers) != len(cmds):
+                    raise ValueError(f"Got {len(answers)} verdicts for {len(cmds)} commands")
+                results = list(answers)
+                self.batches_count += 1
+                logger.log("MODERATOR", f"{batch.provider.name} moderated {len(cmds)} commands in a single request")
+            except NotImplementedError:
+                pass
+            except Exception as e:
+                self.fallbacks_count += 1
+                logger.warning(f"Batched moderation failed ({e!r}). Moderating {len(cmds)} commands one by one...")
+
+        if results is None:
+            results = await asyncio.gather(
+                *(batch.provider.moderate_command(cmd=cmd, model=batch.model) for cmd in cmds),
+                return_exceptions=True,
+            )
+
+        for (_, future), result in zip(batch.commands, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class ModerationGate(metaclass=SingletonMeta):
+    """Process-wide gate moderating the shell commands and file reads.
+
+    The command is first classified by the local rules (allowlist/denylist of commands and paths), which resolve
+    the obviously safe and the obviously forbidden commands instantly. The rest are sent to the moderator model,
+    and its verdicts are cached by (normalized command, cwd, moderator provider, moderator model) for
+    `moderation_cache_ttl` seconds. Only the successful verdicts are cached: a failed moderator call is retried the next
+    time. Concurrent requests to moderate the same command share a single LLM call, and the different ones are batched.
+    """
+
+    def __init__(self) -> None:
+        self._verdicts: TTLCache = TTLCache(maxsize=2048, ttl=gpt_settings.moderation_cache_ttl)
+        self._inflight: dict[VerdictKey, asyncio.Future[ModerationDecision]] = {}
+        self._counters: dict[str, int] = {"allowlist": 0, "denylist": 0, "cache": 0, "llm": 0}
+        self._latency = LatencyHistogram()
+        self._batcher = ModerationBatcher()
+
+    def clear(self) -> None:
+        self._verdicts.clear()
+
+    def stats(self) -> dict[str, Any]:
+        llm_calls = self._counters["llm"]
+        cache_hits = self._counters["cache"]
+        return {
+            **self._counters,
+            "decisions": sum(self._counters.values()),
+            "cache_hit_rate": cache_hits / (cache_hits + llm_calls) if cache_hits + llm_calls else 0.0,
+            "llm_latency_p50": self._latency.percentile(0.5),
+            "llm_latency_p95": self._latency.percentile(0.95),
+            "batches": self._batcher.batches_count,
+            "batch_fallbacks": self._batcher.fallbacks_count,
+        }
+
+    @staticmethod
+    def _get_moderator_model(moderation_provider: "Provider") -> str:
+        return (
+            gpt_settings.moderation_model
+            or moderation_provider.default_moderation_model
+            or moderation_provider.default_model
+        )
+
+    async def _ask_moderator(self, cmd: str, user_id: int, moderation_provider: "Provider") -> ModerationDecision:
+        model = self._get_moderator_model(moderation_provider)
+        start_time = time.monotonic()
+        answer = await self._batcher.moderate(
+            provider=moderation_provider, cmd=cmd, user_id=user_id, model=gpt_settings.moderation_model
+        )
+        latency = time.monotonic() - start_time
+        self._latency.record(latency)
+        LatencyRegistry().record(
+            provider=moderation_provider.name, model=model, seconds=latency, operation="moderation"
+        )
+        return ModerationDecision(answer=answer, source="llm", moderator=moderation_provider.name, latency=latency)
+
+    async def _moderate_with_llm(
+        self, key: VerdictKey, cmd: str, user_id: int, moderation_provider: "Provider"
+    ) -> ModerationDecision:
+        if future := self._inflight.get(key):
+            decision = await asyncio.shield(future)
+            return ModerationDecision(answer=decision.answer, source="cache", moderator=decision.moderator)
+
+        future = asyncio.ensure_future(
+            self._ask_moderator(cmd=cmd, user_id=user_id, moderation_provider=moderation_provider)
+        )
+        self._inflight[key] = future
+        try:
+            decision = await asyncio.shield(future)
+        finally:
+            self._inflight.pop(key, None)
+        if decision.answer.status == "ok":
+            self._verdicts[key] = decision
+        return decision
+
+    async def moderate(self, cmd: str, user_id: int, caller_model: str, cwd: str | None = None) -> ModerationDecision:
+        """Moderate the command.
+
+        Args:
+            cmd: Shell command (file reads are moderated as `cat <path>`).
+            user_id: Telegram user ID (the moderator model is the user's one).
+            caller_model: Name of the model asking to run the command (for the audit log).
+            cwd: Working directory of the command.
+
+        Returns:
+            Moderation decision.
+        """
+        start_time = time.monotonic()
+        answer = classify_command(cmd=cmd, cwd=cwd) if gpt_settings.moderation_fast_path else None
+        if answer:
+            source = "allowlist" if answer.verdict == "accepted" else "denylist"
+            decision = ModerationDecision(answer=answer, source=source, moderator="local rules")
+        else:
+            moderation_provider = await get_moderation_provider(user_id=user_id)
+            key = (
+                normalize_command(cmd),
+                cwd or "",
+                moderation_provider.name,
+                self._get_moderator_model(moderation_provider),
+            )
+            if cached := self._verdicts.get(key):
+                decision = ModerationDecision(answer=cached.answer, source="cache", moderator=cached.moderator)
+            else:
+                decision = await self._moderate_with_llm(
+                    key=key, cmd=cmd, user_id=user_id, moderation_provider=moderation_provider
+                )
+        decision.latency = time.monotonic() - start_time
+        self._counters[decision.source] += 1
+
+        logger.log(
+            "MODERATOR",
+            (
+                f"[{caller_model}] {decision.moderator} {'ACCEPTED' if decision.accepted else 'DECLINED'} command "
+                f"'{cmd}' (source: {decision.source}, {decision.latency * 1000:.0f}ms). CWD: {cwd}"
+                + ("" if decision.accepted else f". Reason: {decision.answer.reason}")
+            ),
+        )
+        from chibi.services.metrics import MetricsService
+
+        MetricsService.send_moderation_metrics(decision=decision, stats=self.stats())
+        return decision
@@ -21,6 +21,7 @@ class OcrPdfTool(ChibiTool):
     register = True
     run_in_background_by_default = True
     name = "ocr_pdf"
+    side_effects = False
     definition = ChatCompletionToolParam(
         type="function",
         function=FunctionDefinition(
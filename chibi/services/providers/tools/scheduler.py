@@ -0,0 +1,198 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from loguru import logger
+
+from chibi.services.providers.latency import LatencyHistogram
+from chibi.services.providers.tools.schemas import ToolResponseSchema
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from chibi.services.providers.tools.tool import ChibiTool
+
+# Queue waits longer than that are logged.
+SLOW_SLOT_WAIT = 1.0
+# Cancellation groups of the tools waiting for nested tool calls (made by their sub-agents) while holding a slot.
+NESTING_CANCELLATION_GROUPS = frozenset({"delegation"})
+
+
+class ToolCallBatch:
+    """Tool calls requested by the model in one round.
+
+    When a call of a cancellation group fails, the other calls of the same group in the batch (running, queued or
+    not started yet) are cancelled: their results would most likely be useless anyway.
+    """
+
+    def __init__(self) -> None:
+        self._running: dict[str, set[asyncio.Task]] = {}
+        self._failed: dict[str, str] = {}
+        self._cancelled: set[asyncio.Task] = set()
+
+    def get_failed_tool(self, group: str) -> str | None:
+        """Get the name of the tool whose failure cancelled the group, if any."""
+        return self._failed.get(group)
+
+    def add(self, group: str, task: asyncio.Task) -> None:
+        self._running.setdefault(group, set()).add(task)
+
+    def discard(self, group: str, task: asyncio.Task) -> None:
+        self._running.get(group, set()).discard(task)
+
+    def is_cancelled(self, task: asyncio.Task) -> bool:
+        return task in self._cancelled
+
+    def fail(self, group: str, tool_name: str, task: asyncio.Task | None) -> None:
+        """Mark the group as failed and cancel its other calls."""
+        self._failed.setdefault(group, tool_name)
+        for sibling in self._running.get(group, set()) - {task}:
+            if not sibling.done():
+                self._cancelled.add(sibling)
+                sibling.cancel()
+
+
+current_tool_call_batch: ContextVar[ToolCallBatch | None] = ContextVar("current_tool_call_batch", default=None)
+# Number of tool calls the current call is nested in (i.e. a tool called by a sub-agent of delegate_task).
+current_tool_call_depth: ContextVar[int] = ContextVar("current_tool_call_depth", default=0)
+
+
+class ToolStats:
+    """Sliding window statistics of a tool: time spent waiting for a slot and running."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.wait = LatencyHistogram(window=window)
+        self.run = LatencyHistogram(window=window)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, wait_time: float, run_time: float, status: str) -> None:
+        self.calls += 1
+        if status != "ok":
+            self.errors += 1
+        self.wait.record(wait_time)
+        self.run.record(run_time)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "wait_p50": self.wait.percentile(0.5),
+            "wait_p95": self.wait.percentile(0.95),
+            "run_p50": self.run.percentile(0.5),
+            "run_p95": self.run.percentile(0.95),
+        }
+
+
+class ToolScheduler(metaclass=SingletonMeta):
+    """Process-wide scheduler of the tool calls.
+
+    Enforces the concurrency limits (`ChibiTool.max_concurrency` across all the users and
+    `ChibiTool.max_concurrency_per_user`, not applied to the delegation calls nested in other ones), the default
+    timeouts (`ChibiTool.default_timeout`) and the fail-fast cancellation groups (`ChibiTool.cancellation_group`) of
+    the tools, and records the queue wait and run time per tool.
+    """
+
+    def __init__(self) -> None:
+        self._tool_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._user_semaphores: dict[tuple[str, int], asyncio.Semaphore] = {}
+        self._stats: dict[str, ToolStats] = {}
+
+    def _get_semaphores(
+        self, tool: type["ChibiTool"], user_id: int | None, nested: bool = False
+    ) -> list[asyncio.Semaphore]:
+        semaphores = []
+        if tool.max_concurrency:
+            semaphores.append(self._tool_semaphores.setdefault(tool.name, asyncio.Semaphore(tool.max_concurrency)))
+        # The nested delegation calls are not limited per user: the outer ones holding the user slots wait for them, so
+        # a chain of delegations longer than the limit would deadlock. The leaf tools are limited at any depth.
+        exempt = nested and tool.cancellation_group in NESTING_CANCELLATION_GROUPS
+        if tool.max_concurrency_per_user and user_id is not None and not exempt:
+            semaphores.append(
+                self._user_semaphores.setdefault((tool.name, user_id), asyncio.Semaphore(tool.max_concurrency_per_user))
+            )
+        return semaphores
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {tool_name: stats.as_dict() for tool_name, stats in self._stats.items()}
+
+    def _record(self, tool_name: str, wait_time: float, run_time: float, status: str) -> None:
+        from chibi.services.metrics import MetricsService
+
+        self._stats.setdefault(tool_name, ToolStats()).record(wait_time=wait_time, run_time=run_time, status=status)
+        MetricsService.send_tool_metrics(tool_name=tool_name, wait_time=wait_time, run_time=run_time, status=status)
+
+    @staticmethod
+    def _cancelled_response(tool_name: str, failed_tool: str | None) -> ToolResponseSchema:
+        return ToolResponseSchema(
+            tool_name=tool_name,
+            status="cancelled",
+            result=f"The call was cancelled because a related {failed_tool or 'tool'} call failed.",
+        )
+
+    async def run(
+        self,
+        tool: type["ChibiTool"],
+        call: Callable[[], Awaitable[ToolResponseSchema]],
+        user_id: int | None = None,
+        caller_model: str = "unknown model",
+    ) -> ToolResponseSchema:
+        """Run the tool call once the tool has a free slot.
+
+        Args:
+            tool: Tool class.
+            call: Coroutine function executing the tool and wrapping its result (or error) into the response.
+            user_id: Telegram user ID.
+            caller_model: Name of the model that called the tool (for logging).
+
+        Returns:
+            The tool response (an error one if the tool timed out, a cancelled one if its group failed).
+        """
+        batch = current_tool_call_batch.get()
+        group = tool.cancellation_group if batch else None
+        task = asyncio.current_task()
+        if batch and group:
+            if failed_tool := batch.get_failed_tool(group):
+                return self._cancelled_response(tool_name=tool.name, failed_tool=failed_tool)
+            if task:
+                batch.add(group, task)
+
+        queued_at = time.monotonic()
+        wait_time = 0.0
+        depth = current_tool_call_depth.get()
+        depth_token = current_tool_call_depth.set(depth + 1)
+        try:
+            async with AsyncExitStack() as stack:
+                for semaphore in self._get_semaphores(tool=tool, user_id=user_id, nested=depth > 0):
+                    await stack.enter_async_context(semaphore)
+                started_at = time.monotonic()
+                wait_time = started_at - queued_at
+                if wait_time >= SLOW_SLOT_WAIT:
+                    logger.info(f"[{caller_model}] Tool '{tool.name}' waited {wait_time:.1f}s for a free slot")
+                try:
+                    async with asyncio.timeout(tool.default_timeout):
+                        response = await call()
+                except TimeoutError:
+                    logger.warning(f"[{caller_model}] Tool '{tool.name}' timed out after {tool.default_timeout}s")
+                    response = ToolResponseSchema(
+                        tool_name=tool.name,
+                        status="error",
+                        result=f"The tool timed out after {tool.default_timeout} seconds.",
+                    )
+                run_time = time.monotonic() - started_at
+        except asyncio.CancelledError:
+            if not (batch and group and task and batch.is_cancelled(task)):
+                raise
+            task.uncancel()
+            logger.info(f"[{caller_model}] Tool '{tool.name}' cancelled: a related call failed")
+            return self._cancelled_response(tool_name=tool.name, failed_tool=batch.get_failed_tool(group))
+        finally:
+            current_tool_call_depth.reset(depth_token)
+            if batch and group and task:
+                batch.discard(group, task)
+
+        self._record(tool_name=tool.name, wait_time=wait_time, run_time=run_time, status=response.status)
+        if batch and group and response.status == "error":
+            batch.fail(group=group, tool_name=tool.name, task=task)
+        return response
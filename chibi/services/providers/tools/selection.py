@@ -0,0 +1,267 @@
+import json
+import math
+import re
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Collection, Container, Iterator, cast
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.services.providers.prompt_cache import estimate_payload_tokens
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionToolParam
+
+    from chibi.models import Message, User
+    from chibi.services.interface import UserInterface
+
+SEARCH_TOOLS_TOOL_NAME = "search_tools"
+
+SELECTIONS_MAXSIZE = 1024
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    (
+        "a an and are as at be by can do for from get how i if in is it me my of on or please should that the this to "
+        "use was what with you your"
+    ).split()
+)
+
+
+def get_terms(text: str) -> list[str]:
+    """Split the text into lowercase terms, dropping the stop words (tool names are split by underscores too)."""
+    return [term for term in TERM_PATTERN.findall(text.lower().replace("_", " ")) if term not in STOP_WORDS]
+
+
+def get_tool_document(definition: "ChatCompletionToolParam") -> str:
+    """Get the searchable text of a tool: name, description and parameters."""
+    function = definition["function"]
+    parts = [function["name"], function.get("description", "")]
+    properties = cast(dict[str, Any], function.get("parameters", {}).get("properties", {}))
+    for name, schema in properties.items():
+        parts.extend([name, str(schema.get("description", "")) if isinstance(schema, dict) else ""])
+    return " ".join(parts)
+
+
+class BM25Index:
+    """Okapi BM25 ranking of the documents (tools) against a query."""
+
+    def __init__(self, documents: dict[str, str], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._terms = {name: Counter(get_terms(text)) for name, text in documents.items()}
+        self._lengths = {name: sum(terms.values()) for name, terms in self._terms.items()}
+        self._average_length = sum(self._lengths.values()) / len(self._lengths) if self._lengths else 0.0
+        frequencies: Counter[str] = Counter()
+        for terms in self._terms.values():
+            frequencies.update(terms.keys())
+        count = len(self._terms)
+        self._idf = {term: math.log(1 + (count - freq + 0.5) / (freq + 0.5)) for term, freq in frequencies.items()}
+
+    def score(self, query: str) -> dict[str, float]:
+        query_terms = set(get_terms(query)) & self._idf.keys()
+        scores: dict[str, float] = {}
+        for name, terms in self._terms.items():
+            length_norm = 1 - self.b + self.b * self._lengths[name] / (self._average_length or 1)
+            score = sum(
+                self._idf[term] * terms[term] * (self.k1 + 1) / (terms[term] + self.k1 * length_norm)
+                for term in query_terms
+                if term in terms
+            )
+            if score > 0:
+                scores[name] = score
+        return scores
+
+    def search(self, query: str, limit: int) -> list[str]:
+        """Get the names of the most relevant documents, the best first."""
+        scores = self.score(query)
+        return sorted(scores, key=lambda name: scores[name], reverse=True)[:limit]
+
+
+class ToolSelection:
+    """Names of the tools sent to the model, in the order their definitions are sent.
+
+    Within a turn the selection only grows (i.e. when the model loads tools with `search_tools`), and the new tools are
+    appended to the end, so the definitions sent before stay the same prompt prefix, cached by the providers. The
+    tools unused for a while are dropped between the turns, see `next_turn`.
+    """
+
+    def __init__(self, names: list[str]) -> None:
+        self.order = tuple(dict.fromkeys(names))
+        self.names = frozenset(self.order)
+        self.turn = 0
+        self.last_used = dict.fromkeys(self.order, 0)
+
+    def add(self, names: list[str]) -> None:
+        self.order = self.order + tuple(name for name in dict.fromkeys(names) if name not in self.names)
+        self.names = frozenset(self.order)
+        self.last_used.update(dict.fromkeys(names, self.turn))
+
+    def next_turn(self, used: Collection[str], available: Container[str], idle_turns: int) -> "ToolSelection":
+        """Get the selection for the next turn of the conversation.
+
+        The tools that are no longer registered are dropped. Every `idle_turns` turns the tools unused (not selected
+        for the turn, nor loaded with `search_tools`) for `idle_turns` turns are dropped too, so the cached prefix of
+        the tool definitions is rewritten at most once per `idle_turns` turns.
+
+        Args:
+            used: Names of the tools selected for the next turn.
+            available: Names of the registered tools.
+            idle_turns: Amount of turns an unused tool stays in the selection (0 - forever).
+
+        Returns:
+            The new selection (the tools of this one, in the same order).
+        """
+        turn = self.turn + 1
+        last_used = self.last_used | {name: turn for name in used if name in self.names}
+        drop_idle = bool(idle_turns) and turn % idle_turns == 0
+        selection = ToolSelection(
+            [
+                name
+                for name in self.order
+                if name in available and not (drop_idle and turn - last_used[name] >= idle_turns)
+            ]
+        )
+        selection.turn = turn
+        selection.last_used = {name: last_used[name] for name in selection.order}
+        return selection
+
+
+current_tool_selection: ContextVar[ToolSelection | None] = ContextVar("current_tool_selection", default=None)
+
+
+class ToolSelector(metaclass=SingletonMeta):
+    """Picks the subset of the registered tools sent to the model with a request.
+
+    The subset consists of the core tools (`ChibiTool.core`, `TOOL_SELECTION_CORE`), the tools already called in the
+    conversation, the tools found by the model with `search_tools`, and the tools most relevant (BM25 over the tool
+    descriptions) to the latest messages and the activated skills.
+
+    The selection is sticky per user conversation: the tools selected for the previous turns stay, and the new ones are
+    appended, so the tool definitions (the start of the prompt) are not rewritten every turn. Tools unused for
+    `TOOL_SELECTION_IDLE_TURNS` turns are dropped (see `ToolSelection.next_turn`), and the selections of the
+    `SELECTIONS_MAXSIZE` most recent conversations are kept. It starts over when the conversation history is reset.
+    """
+
+    def __init__(self) -> None:
+        self._index: BM25Index | None = None
+        self._version = -1
+        self._selections: OrderedDict[tuple[int, int], ToolSelection] = OrderedDict()
+
+    @property
+    def index(self) -> BM25Index:
+        from chibi.services.providers.tools.tool import RegisteredChibiTools
+
+        if self._index is None or self._version != RegisteredChibiTools.version:
+            self._index = BM25Index(
+                {name: get_tool_document(tool.definition) for name, tool in RegisteredChibiTools.tools_map.items()}
+            )
+            self._version = RegisteredChibiTools.version
+        return self._index
+
+    def search(self, query: str, limit: int | None = None) -> list[str]:
+        return self.index.search(query=query, limit=limit or gpt_settings.tool_selection_max_tools)
+
+    @staticmethod
+    def _get_query(messages: list["Message"], skills: dict[str, str]) -> str:
+        recent_messages = [message for message in messages if message.role in ("user", "assistant") and message.content]
+        texts = [message.content for message in recent_messages[-gpt_settings.tool_selection_context_messages :]]
+        texts.extend(f"{name} {payload}" for name, payload in skills.items())
+        return " ".join(texts)
+
+    def _get_called_tools(self, messages: list["Message"]) -> set[str]:
+        """Get the tools called in the conversation, and the ones found by the `search_tools` calls."""
+        names: set[str] = set()
+        for message in messages:
+            for tool_call in message.tool_calls or []:
+                names.add(tool_call.function.name)
+                if tool_call.function.name != SEARCH_TOOLS_TOOL_NAME:
+                    continue
+                try:
+                    query = json.loads(tool_call.function.arguments or "{}").get("query", "")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                names.update(self.search(query=str(query), limit=gpt_settings.tool_selection_search_limit))
+        return names
+
+    def forget(self, user_id: int, thread_id: int) -> None:
+        """Drop the sticky selection of the conversation, i.e. when its history is reset."""
+        self._selections.pop((user_id, thread_id), None)
+
+    def select(
+        self, messages: list["Message"], skills: dict[str, str], conversation: tuple[int, int] | None = None
+    ) -> ToolSelection | None:
+        """Select the tools for the request.
+
+        Args:
+            messages: Conversation messages.
+            skills: Activated skills (name -> payload).
+            conversation: (Telegram user ID, thread ID) the selection is sticky for (None - select from scratch).
+
+        Returns:
+            The selection, or None if all the tools should be sent (there are too few of them).
+        """
+        from chibi.services.providers.tools.tool import RegisteredChibiTools
+
+        tools_map = RegisteredChibiTools.tools_map
+        core = {name for name, tool in tools_map.items() if tool.core} | set(gpt_settings.tool_selection_core)
+        if len(tools_map) <= len(core) + gpt_settings.tool_selection_max_tools:
+            return None
+
+        relevant = self.search(query=self._get_query(messages=messages, skills=skills))
+        selected = core | self._get_called_tools(messages) | set(relevant)
+        previous = self._selections.get(conversation) if conversation else None
+        if previous:
+            selection = previous.next_turn(
+                used=selected, available=tools_map, idle_turns=gpt_settings.tool_selection_idle_turns
+            )
+        else:
+            selection = ToolSelection([])
+        selection.add([name for name in tools_map if name in selected])
+        if conversation:
+            self._selections[conversation] = selection
+            self._selections.move_to_end(conversation)
+            while len(self._selections) > SELECTIONS_MAXSIZE:
+                self._selections.popitem(last=False)
+        names = selection.names
+
+        all_definitions = [tool.definition for tool in tools_map.values()]
+        all_tokens = estimate_payload_tokens(all_definitions)
+        selected_tokens = estimate_payload_tokens(
+            [definition for definition in all_definitions if definition["function"]["name"] in names]
+        )
+        logger.info(
+            f"Tool selection: {len(names)} of {len(tools_map)} tools sent, "
+            f"~{all_tokens - selected_tokens} of ~{all_tokens} tool definition tokens saved"
+        )
+        return selection
+
+
+@contextmanager
+def select_tools(
+    messages: list["Message"], user: "User", interface: "UserInterface | None" = None
+) -> Iterator[ToolSelection | None]:
+    """Select the tools sent to the model while the block (a chat turn, including its tool call rounds) runs.
+
+    Args:
+        messages: Conversation messages.
+        user: User (their activated skills take part in the selection).
+        interface: User interface of the conversation (None for sub-agents, whose selection is not sticky).
+
+    Yields:
+        The selection, or None if all the tools are sent.
+    """
+    if not gpt_settings.tool_selection:
+        yield None
+        return
+
+    conversation = (user.id, interface.thread_id) if interface else None
+    selection = ToolSelector().select(messages=messages, skills=user.llm_skills, conversation=conversation)
+    token = current_tool_selection.set(selection)
+    try:
+        yield selection
+    finally:
+        current_tool_selection.reset(token)
@@ -1,25 +1,34 @@
 from __future__ import annotations
 
-from typing import Any, Callable, Coroutine, ParamSpec, TypeVar, cast
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Generic, ParamSpec, TypeVar, cast
 
 from loguru import logger
 from openai.types.chat import ChatCompletionToolParam
+from pydantic import BaseModel
 
 from chibi.config import gpt_settings
 from chibi.services.interface import UserInterface
 from chibi.services.providers.tools.exceptions import LoopDetectedException, NoUserInterfaceProvidedException
+from chibi.services.providers.tools.scheduler import ToolScheduler
 from chibi.services.providers.tools.schemas import ToolResponseSchema
+from chibi.services.providers.tools.selection import current_tool_selection
 from chibi.services.providers.tools.utils import AdditionalOptions, CallTracker
 from chibi.services.providers.utils import escape_and_truncate
 from chibi.services.task_manager import task_manager
 
 P = ParamSpec("P")
 R = TypeVar("R")
+T = TypeVar("T")
 
 ToolFunction = Callable[P, Coroutine[Any, Any, ToolResponseSchema]]
 RegisteredFunctionsMap = dict[str, ToolFunction]
 ToolsDefinitionMap = dict[str, ChatCompletionToolParam]
 
+SELECTED_SNAPSHOTS_MAXSIZE = 64
+
 
 class ChibiTool:
     register: bool
@@ -29,6 +38,17 @@ class ChibiTool:
     allow_model_to_change_background_mode: bool = True
     loop_warning: int = 5
     loop_break: int = 7
+    # Scheduling (see ToolScheduler): concurrent calls limits (None - unlimited), timeout in seconds (None - no
+    # timeout, i.e. the tool handles it itself) and the group whose calls of one round are cancelled if one fails.
+    max_concurrency: int | None = None
+    max_concurrency_per_user: int | None = None
+    default_timeout: float | None = None
+    cancellation_group: str | None = None
+    # Whether the tool changes anything outside the conversation. Results of the sub-agents that called such tools
+    # are never memoized.
+    side_effects: bool = True
+    # Core tools are sent with every request, the rest only when selected (see ToolSelector).
+    core: bool = False
 
     @classmethod
     def add_global_params(cls) -> dict[str, Any]:
@@ -48,6 +68,15 @@ class ChibiTool:
 
     @classmethod
     async def _get_tool_call_result(cls, *args, **kwargs) -> ToolResponseSchema:
+        return await ToolScheduler().run(
+            tool=cls,
+            call=lambda: cls._execute(*args, **kwargs),
+            user_id=kwargs.get("user_id"),
+            caller_model=kwargs.get("caller_model", "unknown model"),
+        )
+
+    @classmethod
+    async def _execute(cls, *args, **kwargs) -> ToolResponseSchema:
         try:
             result = await cls.function(**kwargs)
             logger.log(
@@ -144,12 +173,96 @@ class ChibiTool:
         RegisteredChibiTools.register(cls)
 
 
+def _serialize_definition(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json", exclude_none=True)
+    return str(obj)
+
+
+@dataclass(frozen=True)
+class ToolDefinitionsSnapshot(Generic[T]):
+    """Tool definitions translated to a provider format, valid for a single registry version.
+
+    Attributes:
+        version: The registry version the snapshot was built for.
+        definitions: Tool definitions in the provider format. Shared between requests, must not be mutated.
+        serialized: JSON representation of the definitions.
+    """
+
+    version: int
+    definitions: list[T]
+    serialized: str
+
+
 class RegisteredChibiTools:
     tools_map: dict[str, type[ChibiTool]] = {}
+    version: int = 0
+    _snapshots: dict[str, ToolDefinitionsSnapshot] = {}
+    _selected_snapshots: OrderedDict[tuple[str, tuple[str, ...]], ToolDefinitionsSnapshot] = OrderedDict()
 
     @classmethod
     def get_tool_definitions(cls) -> list[ChatCompletionToolParam]:
-        return [tool.definition for tool in cls.tools_map.values()]
+        """Get tool definitions in OpenAI format.
+
+        The list is rebuilt only when a tool gets registered or deregistered, so it must not be mutated.
+
+        Returns:
+            Tool definitions in OpenAI format.
+        """
+        return cls.get_tool_definitions_snapshot(
+            format_name="openai", converter=lambda definition: definition
+        ).definitions
+
+    @classmethod
+    def get_tool_definitions_snapshot(
+        cls, format_name: str, converter: Callable[[ChatCompletionToolParam], T]
+    ) -> ToolDefinitionsSnapshot[T]:
+        """Get the memoized tool definitions translated to the provider-specific format.
+
+        Only the tools of the current selection (see `select_tools`) are included, if there is one.
+
+        Args:
+            format_name: Unique name of the target format, i.e. "anthropic".
+            converter: Function translating a single OpenAI-format definition to the target format.
+
+        Returns:
+            Snapshot of the definitions for the current registry version.
+        """
+        snapshot = cls._snapshots.get(format_name)
+        if not snapshot or snapshot.version != cls.version:
+            definitions = [converter(tool.definition) for tool in cls.tools_map.values()]
+            snapshot = ToolDefinitionsSnapshot(
+                version=cls.version,
+                definitions=definitions,
+                serialized=json.dumps(definitions, default=_serialize_definition, ensure_ascii=False),
+            )
+            cls._snapshots[format_name] = snapshot
+
+        if not (selection := current_tool_selection.get()):
+            return snapshot
+        return cls._get_selected_snapshot(format_name=format_name, snapshot=snapshot, names=selection.order)
+
+    @classmethod
+    def _get_selected_snapshot(
+        cls, format_name: str, snapshot: ToolDefinitionsSnapshot[T], names: tuple[str, ...]
+    ) -> ToolDefinitionsSnapshot[T]:
+        key = (format_name, names)
+        selected = cls._selected_snapshots.get(key)
+        if selected and selected.version == snapshot.version:
+            cls._selected_snapshots.move_to_end(key)
+            return selected
+
+        definitions_map = dict(zip(cls.tools_map, snapshot.definitions, strict=True))
+        definitions = [definitions_map[name] for name in names if name in definitions_map]
+        selected = ToolDefinitionsSnapshot(
+            version=snapshot.version,
+            definitions=definitions,
+            serialized=json.dumps(definitions, default=_serialize_definition, ensure_ascii=False),
+        )
+        cls._selected_snapshots[key] = selected
+        while len(cls._selected_snapshots) > SELECTED_SNAPSHOTS_MAXSIZE:
+            cls._selected_snapshots.popitem(last=False)
+        return selected
 
     @classmethod
     def get_registered_functions(cls) -> RegisteredFunctionsMap:
@@ -160,6 +273,7 @@ class RegisteredChibiTools:
     @classmethod
     def register(cls, tool: type[ChibiTool]) -> None:
         cls.tools_map[tool.name] = tool
+        cls.version += 1
 
     @classmethod
     def deregister_tools(cls, tool_names: list[str]) -> None:
@@ -167,6 +281,7 @@ class RegisteredChibiTools:
             if tool_name not in cls.tools_map:
                 continue
             cls.tools_map.pop(tool_name)
+            cls.version += 1
             logger.info(f"The tool {tool_name} had been deregistered.")
 
     @classmethod
@@ -16,8 +16,10 @@ from chibi.models import Message
 from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema
 from chibi.services.interface import UserInterface
 from chibi.storage.abstract import Database
+from chibi.storage.blobs import BlobStore
 from chibi.storage.database import inject_database
 from chibi.utils.app import SingletonMeta
+from chibi.utils.tokens import message_tokens_cache
 
 if TYPE_CHECKING:
     from chibi.services.providers.provider import Provider
@@ -97,6 +99,57 @@ async def _get_url(url: str) -> Response:
         return await client.get(url=url, headers=headers)
 
 
+def normalize_prompt(prompt: str) -> str:
+    """Normalize the prompt for memoization: the whitespace differences do not matter."""
+    return " ".join(prompt.split())
+
+
+def get_side_effecting_tools(messages: list[Message]) -> list[str]:
+    """Get the names of the side-effecting tools called in the messages (unknown tools are side-effecting too)."""
+    from chibi.services.providers.tools.tool import RegisteredChibiTools
+
+    tool_names = {tool_call.function.name for message in messages for tool_call in message.tool_calls or []}
+    return sorted(
+        name for name in tool_names if not (tool := RegisteredChibiTools.tools_map.get(name)) or tool.side_effects
+    )
+
+
+SubAgentCacheKey = tuple[int, str, str, str, str]
+
+
+class SubAgentCache(metaclass=SingletonMeta):
+    """Memoized sub-agent results, keyed by (user, provider, model, normalized prompt, working dir).
+
+    Only results of the sub-agents that called no side-effecting tools are stored, so a hit never skips an action.
+    """
+
+    def __init__(self) -> None:
+        self._results: TTLCache = TTLCache(
+            maxsize=gpt_settings.sub_agent_cache_size, ttl=gpt_settings.sub_agent_cache_ttl
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_id: int, provider_name: str, model_name: str, prompt: str, working_dir: str) -> SubAgentCacheKey:
+        prompt_hash = sha256(normalize_prompt(prompt).encode()).hexdigest()
+        return user_id, provider_name, model_name, prompt_hash, working_dir
+
+    def get(self, key: SubAgentCacheKey) -> ChatResponseSchema | None:
+        response: ChatResponseSchema | None = self._results.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response.model_copy(update={"usage": None})
+
+    def set(self, key: SubAgentCacheKey, response: ChatResponseSchema) -> None:
+        self._results[key] = response
+
+    def clear(self) -> None:
+        self._results.clear()
+
+
 @inject_database
 async def get_sub_agent_response(
     db: Database,
@@ -111,6 +164,21 @@ async def get_sub_agent_response(
     if not provider:
         raise ValueError(f"No provider with name '{provider_name}' found.")
 
+    cache = SubAgentCache()
+    cache_key = cache.make_key(
+        user_id=user_id,
+        provider_name=provider_name,
+        model_name=model_name,
+        prompt=prompt,
+        working_dir=user.working_dir,
+    )
+    if gpt_settings.sub_agent_cache and (cached_response := cache.get(cache_key)):
+        logger.log(
+            "DELEGATE",
+            f"[{model_name}] Delegated task result served from the cache (hits: {cache.hits}, misses: {cache.misses})",
+        )
+        return cached_response
+
     user_prompt = {
         "user_type": "llm",
         "current_working_dir": user.working_dir,
@@ -123,12 +191,100 @@ async def get_sub_agent_response(
         user_message,
     ]
 
-    chat_response, _ = await provider.get_chat_response(
+    chat_response, new_messages = await provider.get_chat_response(
         messages=conversation_messages, user=user, model=model_name, system_prompt=SUB_EXECUTOR_PROMPT
     )
+    if gpt_settings.sub_agent_cache:
+        if side_effecting_tools := get_side_effecting_tools(new_messages):
+            logger.log(
+                "DELEGATE",
+                f"[{model_name}] Delegated task result is not cached: side-effecting tools called "
+                f"({', '.join(side_effecting_tools)})",
+            )
+        else:
+            cache.set(key=cache_key, response=chat_response)
     return chat_response
 
 
+def _get_tool_response(payload: Any) -> dict[str, Any] | None:
+    """Get the tool response from a tool message or a background tool response message payload."""
+    if not isinstance(payload, dict):
+        return None
+    if isinstance(tool_response := payload.get("tool_response"), dict):
+        return tool_response
+    return payload if "tool_name" in payload and "result" in payload else None
+
+
+async def spill_large_tool_results(user_id: int, messages: list[Message], thread_id: int = 0) -> list[Message]:
+    """Move the large tool results out of the messages to the blob store before they are saved to the history.
+
+    The history keeps the preview of the result, its size and the handle the model can read the whole result with
+    (the `fetch_tool_result` tool), so the result is not re-sent with every later request.
+
+    Args:
+        user_id: Telegram user ID.
+        messages: Messages to save.
+        thread_id: ID of the conversation thread the messages belong to.
+
+    Returns:
+        The messages, the ones with a large tool result replaced with the compact copies.
+    """
+    threshold = gpt_settings.tool_result_spill_threshold
+    if not threshold:
+        return messages
+
+    prepared_messages = []
+    for message in messages:
+        if message.role not in ("tool", "user") or len(message.content.encode()) <= threshold:
+            prepared_messages.append(message)
+            continue
+        try:
+            payload = json.loads(message.content)
+        except json.JSONDecodeError:
+            payload = None
+        if not (tool_response := _get_tool_response(payload)):
+            prepared_messages.append(message)
+            continue
+
+        result = tool_response["result"]
+        result_text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+        data = result_text.encode()
+        try:
+            handle = await BlobStore().put(user_id=user_id, data=data, thread_id=thread_id)
+        except Exception as e:
+            logger.error(f"Failed to spill the {tool_response.get('tool_name')} tool result: {e!r}")
+            prepared_messages.append(message)
+            continue
+
+        tool_response["result"] = {
+            "preview": result_text[: gpt_settings.tool_result_preview_chars],
+            "size_bytes": len(data),
+            "handle": handle,
+        }
+        tool_response["additional_details"] = " ".join(
+            filter(
+                None,
+                [
+                    tool_response.get("additional_details"),
+                    f"The result is too large to keep in the history, only its beginning is shown. Call "
+                    f"fetch_tool_result with the handle '{handle}' to read the rest if you need it.",
+                ],
+            )
+        )
+        logger.info(
+            f"[User {user_id}] Tool result of {tool_response.get('tool_name')} ({len(data)} bytes) moved to the "
+            f"blob store: {handle}"
+        )
+        # The copy keeps the id (the history order), so the count of the original content must not be reused.
+        message_tokens_cache.discard(message_id=message.id)
+        prepared_messages.append(
+            message.model_copy(
+                update={"content": json.dumps(payload, ensure_ascii=False), "token_count": None, "token_counter": None}
+            )
+        )
+    return prepared_messages
+
+
 async def download(url: str) -> bytes | None:
     try:
         async with httpx.AsyncClient() as client:
@@ -22,6 +22,7 @@ class GetFileInfoTool(ChibiTool):
     register = True
     run_in_background_by_default = False
     name = "get_file_info"
+    side_effects = False
     definition = ChatCompletionToolParam(
         type="function",
         function=FunctionDefinition(
@@ -61,6 +62,8 @@ class AnalyzeImageTool(ChibiTool):
     register = True
     run_in_background_by_default = True
     name = "analyze_image"
+    side_effects = False
+    max_concurrency_per_user = 3
     definition = ChatCompletionToolParam(
         type="function",
         function=FunctionDefinition(
@@ -1,12 +1,10 @@
 from typing import Any, Unpack
 
 import httpx
-from ddgs import DDGS
 from httpx import Response
 from loguru import logger
 from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
-from trafilatura import extract
 
 from chibi.config import gpt_settings
 from chibi.services.providers.tools.exceptions import ToolException
@@ -38,6 +36,9 @@ class SearchNewsTool(ChibiTool):
         ),
     )
     name = "search_news"
+    side_effects = False
+    max_concurrency_per_user = 2
+    default_timeout = 30
 
     @classmethod
     async def function(
@@ -58,6 +59,8 @@ class SearchNewsTool(ChibiTool):
             "TOOL",
             f"[{caller_model}] Searching news for '{search_phrase}', max_results={max_results}",
         )
+        from ddgs import DDGS
+
         try:
             result = DDGS(proxy=gpt_settings.proxy).news(query=search_phrase, max_results=max_results, region="wt-wt")
         except Exception as e:
@@ -94,6 +97,10 @@ class DDGSWebSearchTool(ChibiTool):
         ),
     )
     name = "ddgs_web_search"
+    core = True
+    side_effects = False
+    max_concurrency_per_user = 2
+    default_timeout = 30
 
     @classmethod
     async def function(
@@ -116,6 +123,8 @@ class DDGSWebSearchTool(ChibiTool):
                 f"max_results={max_results}"
             ),
         )
+        from ddgs import DDGS
+
         try:
             result = DDGS(proxy=gpt_settings.proxy).text(query=search_phrase, max_results=max_results, region="wt-wt")
         except Exception as e:
@@ -148,6 +157,9 @@ class GoogleSearchTool(ChibiTool):
         ),
     )
     name = "google_web_search"
+    side_effects = False
+    max_concurrency_per_user = 2
+    default_timeout = 30
 
     @classmethod
     async def function(cls, search_phrase: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, Any]:
@@ -219,6 +231,11 @@ class ReadWebPageTool(ChibiTool):
         ),
     )
     name = "read_web_page"
+    core = True
+    side_effects = False
+    max_concurrency = 16
+    max_concurrency_per_user = 4
+    default_timeout = 60
 
     @classmethod
     async def function(cls, url: str, **kwargs: Unpack[AdditionalOptions]) -> dict[str, Any]:
@@ -246,6 +263,8 @@ class ReadWebPageTool(ChibiTool):
         if not data:
             raise ToolException(f"Failed to extract data from URL: {url}. Empty response received.")
 
+        from trafilatura import extract
+
         content = extract(filecontent=data, include_links=True)
         if not content:
             msg = f"Failed to extract URL: {url}. Empty extracted data. Trying to send raw HTML to model"
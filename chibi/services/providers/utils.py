@@ -2,25 +2,28 @@ import inspect
 import json
 import os
 import platform
-from typing import Any, Callable, Coroutine, ParamSpec, Type, TypeAlias, TypeVar
+from functools import cache
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, ParamSpec, Type, TypeAlias, TypeVar
 
-from anthropic.types import (
-    Message as AnthropicMessage,
-)
-from google.genai.types import GenerateContentResponse
-from mistralai import ChatCompletionResponse
 from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletion
 
 from chibi.config import application_settings, gpt_settings
-from chibi.schemas.app import UsageSchema
+from chibi.schemas.app import ModeratorsAnswer, ModeratorsBatchAnswer, UsageSchema
 from chibi.schemas.suno import SunoGetGenerationDetailsSchema
 from chibi.services.interface import UserInterface
+from chibi.services.providers.hedging import claim_hedged_request
+from chibi.services.system_prompt import current_system_prompt_snapshot
 from chibi.services.user import get_chibi_user
 from chibi.storage.files import get_file_storage
 from chibi.storage.files.file_storage import FileStorage
 from chibi.utils.app import get_builtin_skill_names
 
+if TYPE_CHECKING:
+    from anthropic.types import Message as AnthropicMessage
+    from google.genai.types import GenerateContentResponse
+    from mistralai import ChatCompletionResponse
+
 T = TypeVar("T")
 P = ParamSpec("P")
 M = TypeVar("M", bound=Callable[..., Coroutine[Any, Any, Any]])
@@ -55,8 +58,23 @@ def escape_and_truncate(message: str | dict[str, Any] | list[dict[str, Any]] | N
     return f"{escaped_message[:limit]}... (truncated)"
 
 
+@cache
+def get_platform_info() -> str:
+    return platform.platform()
+
+
 async def prepare_system_prompt(base_system_prompt: str, user_id: int, interface: UserInterface | None) -> str:
-    user = await get_chibi_user(user_id=user_id)
+    """Prepare the system prompt: the base prompt with the user, environment and conversation data.
+
+    Within a chat turn (see `system_prompt_snapshot`) the prompt is prepared once and reused by the rounds of the tool
+    loop, until one of its inputs changes.
+    """
+    snapshot = current_system_prompt_snapshot.get()
+    key = (base_system_prompt, user_id, interface.thread_id if interface else None)
+    if snapshot and (prepared_prompt := snapshot.prompts.get(key)):
+        return prepared_prompt
+
+    user = (snapshot and snapshot.get_user(user_id)) or await get_chibi_user(user_id=user_id)
     prompt: dict[str, Any] = {
         "system_prompt": base_system_prompt,
         "available_builtin_skills": get_builtin_skill_names(),
@@ -65,7 +83,7 @@ async def prepare_system_prompt(base_system_prompt: str, user_id: int, interface
     if gpt_settings.filesystem_access:
         system_data = {
             "current_working_dir": user.working_dir,
-            "platform": platform.platform(),
+            "platform": get_platform_info(),
             "shell": os.environ.get("SHELL", "unknown"),
             "running_inside_container": application_settings.running_in_container,
         }
@@ -89,7 +107,10 @@ async def prepare_system_prompt(base_system_prompt: str, user_id: int, interface
             )
 
     prompt.update({"user_id": user.id, "user_info": user.info, "activated_skills": user.llm_skills})
-    return json.dumps(prompt)
+    prepared_prompt = json.dumps(prompt)
+    if snapshot:
+        snapshot.prompts[key] = prepared_prompt
+    return prepared_prompt
 
 
 async def send_llm_thoughts(thoughts: str, interface: UserInterface | None = None) -> None:
@@ -99,13 +120,14 @@ async def send_llm_thoughts(thoughts: str, interface: UserInterface | None = Non
     if not interface:
         return None
 
+    claim_hedged_request()
     message = f"💡💭 {thoughts}"
 
     await interface.send_message(message=message, reply=False)
     return None
 
 
-def get_usage_from_anthropic_response(response_message: AnthropicMessage) -> UsageSchema:
+def get_usage_from_anthropic_response(response_message: "AnthropicMessage") -> UsageSchema:
     return UsageSchema(
         completion_tokens=response_message.usage.output_tokens,
         prompt_tokens=response_message.usage.input_tokens,
@@ -129,7 +151,7 @@ def get_usage_from_openai_response(response_message: ChatCompletion) -> UsageSch
     return usage
 
 
-def get_usage_from_google_response(response_message: GenerateContentResponse) -> UsageSchema:
+def get_usage_from_google_response(response_message: "GenerateContentResponse") -> UsageSchema:
     if not response_message.usage_metadata:
         return UsageSchema()
 
@@ -141,7 +163,7 @@ def get_usage_from_google_response(response_message: GenerateContentResponse) ->
     )
 
 
-def get_usage_from_mistral_response(response_message: ChatCompletionResponse) -> UsageSchema:
+def get_usage_from_mistral_response(response_message: "ChatCompletionResponse") -> UsageSchema:
     return UsageSchema(
         completion_tokens=response_message.usage.completion_tokens or 0,
         prompt_tokens=response_message.usage.prompt_tokens or 0,
@@ -151,6 +173,44 @@ def get_usage_from_mistral_response(response_message: ChatCompletionResponse) ->
     )
 
 
+def get_moderation_batch_content(cmds: list[str]) -> str:
+    return json.dumps([{"id": i, "cmd": cmd} for i, cmd in enumerate(cmds)], ensure_ascii=False)
+
+
+def parse_moderation_batch_answer(answer: str | dict[str, Any], count: int) -> list[ModeratorsAnswer]:
+    """Parse the moderator's answer to the batch of commands.
+
+    Args:
+        answer: Raw answer (JSON string or the already parsed JSON).
+        count: Amount of commands in the batch.
+
+    Returns:
+        Answers in the order of the commands.
+
+    Raises:
+        ValueError: if the answer is malformed or does not cover every command exactly once.
+    """
+    try:
+        if isinstance(answer, str):
+            answer = answer.strip().strip("```").strip("json").strip()
+            batch = ModeratorsBatchAnswer.model_validate_json(answer)
+        else:
+            batch = ModeratorsBatchAnswer.model_validate(answer)
+    except Exception as e:
+        raise ValueError(f"Error parsing moderator's batch response: {answer}. Error: {e}") from e
+
+    verdicts = {verdict.id: verdict for verdict in batch.verdicts}
+    if len(batch.verdicts) != count or sorted(verdicts) != list(range(count)):
+        raise ValueError(f"Moderator's batch response does not match the {count} commands: {answer}")
+
+    return [
+        ModeratorsAnswer(verdict="accepted", status="ok")
+        if verdicts[i].verdict == "accepted"
+        else ModeratorsAnswer(verdict="declined", reason=verdicts[i].reason, status="operation aborted")
+        for i in range(count)
+    ]
+
+
 def get_usage_msg(usage: UsageSchema | CompletionUsage | None) -> str:
     if usage is None:
         return ""
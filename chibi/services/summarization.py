@@ -0,0 +1,229 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+from chibi.models import Message, User
+from chibi.services.lock_manager import LockManager
+from chibi.services.task_manager import task_manager
+from chibi.storage.abstract import Database
+from chibi.storage.database import inject_database
+from chibi.utils.app import SingletonMeta
+from chibi.utils.tokens import get_token_counter
+
+if TYPE_CHECKING:
+    from chibi.services.providers.provider import Provider
+
+SUMMARIZATION_PROMPT = (
+    "Summarize this conversation between the user and the AI assistant using English. Keep the most important and "
+    "useful information: facts about the user, decisions made, unfinished tasks, names, numbers, file paths and URLs. "
+    "Do not call any tools, answer with the summary only."
+)
+MERGE_SUMMARIES_PROMPT = (
+    "You are given the summaries of the consecutive parts of a single conversation between the user and the AI "
+    "assistant, in chronological order. Merge them into a single summary using English, keeping the most important "
+    "and useful information. Do not call any tools, answer with the summary only."
+)
+
+
+def render_history(messages: list[Message]) -> str:
+    """Render the conversation as plain text for the summarization model (tool results are skipped)."""
+    lines: list[str] = []
+    for message in messages:
+        if message.role == "tool" or message.tool_call_id:
+            continue
+        content = message.content
+        if message.tool_calls:
+            tool_names = ", ".join(tool.function.name for tool in message.tool_calls)
+            content = f"{content}\n[called tools: {tool_names}]".strip()
+        if content:
+            lines.append(f"{message.role}: {content}")
+    return "\n\n".join(lines)
+
+
+def split_into_chunks(messages: list[Message], chunk_tokens: int) -> list[list[Message]]:
+    """Split the messages into consecutive chunks of about `chunk_tokens` tokens."""
+    chunks: list[list[Message]] = [[]]
+    size = 0
+    for message in messages:
+        if chunks[-1] and size + message.estimate_tokens > chunk_tokens:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(message)
+        size += message.estimate_tokens
+    return [chunk for chunk in chunks if chunk]
+
+
+def _group_summaries(summaries: list[str], chunk_tokens: int) -> list[list[str]]:
+    """Group the consecutive summaries to merge, at least two per group, so every reduce round makes progress."""
+    counter = get_token_counter()
+    groups: list[list[str]] = [[]]
+    size = 0
+    for summary in summaries:
+        tokens = counter.count(summary)
+        if len(groups[-1]) >= 2 and size + tokens > chunk_tokens:
+            groups.append([])
+            size = 0
+        groups[-1].append(summary)
+        size += tokens
+    return groups
+
+
+async def _complete(provider: "Provider", model: str | None, user: User, text: str, system_prompt: str) -> str:
+    response, _ = await provider.get_chat_response(
+        messages=[Message(role="user", content=text)], user=user, model=model, system_prompt=system_prompt
+    )
+    return response.answer
+
+
+async def summarize_messages(provider: "Provider", model: str | None, user: User, messages: list[Message]) -> str:
+    """Summarize the messages using the map-reduce approach.
+
+    Histories longer than `summarization_chunk_tokens` are split into chunks summarized in parallel, then the
+    partial summaries are merged (in parallel groups, until a single summary is left).
+
+    Args:
+        provider: Provider to use.
+        model: Model name (None for the provider default one).
+        user: User instance.
+        messages: Messages to summarize.
+
+    Returns:
+        Summary.
+    """
+    chunk_tokens = gpt_settings.summarization_chunk_tokens
+    chunks = split_into_chunks(messages, chunk_tokens=chunk_tokens)
+    summaries = list(
+        await asyncio.gather(
+            *(
+                _complete(provider, model, user, text=render_history(chunk), system_prompt=SUMMARIZATION_PROMPT)
+                for chunk in chunks
+            )
+        )
+    )
+    while len(summaries) > 1:
+        groups = _group_summaries(summaries, chunk_tokens=chunk_tokens)
+        summaries = list(
+            await asyncio.gather(
+                *(
+                    _complete(
+                        provider,
+                        model,
+                        user,
+                        text="\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(group, start=1)),
+                        system_prompt=MERGE_SUMMARIES_PROMPT,
+                    )
+                    if len(group) > 1
+                    else asyncio.sleep(0, result=group[0])
+                    for group in groups
+                )
+            )
+        )
+    return summaries[0]
+
+
+async def _get_summarization_model(user: User, thread_id: int) -> tuple["Provider", str | None]:
+    """Get the configured summarization model, else the one picked by the model routing, else the active one."""
+    from chibi.services.providers.routing import pick_model
+
+    if gpt_settings.summarization_provider and (provider := user.providers.get(gpt_settings.summarization_provider)):
+        return provider, gpt_settings.summarization_model
+    if gpt_settings.summarization_model:
+        return user.get_active_llm_provider(thread_id=thread_id), gpt_settings.summarization_model
+    if (picked := await pick_model(user_id=user.id, task_class="light")) and (
+        provider := user.providers.get(picked.provider)
+    ):
+        return provider, picked.name
+    return user.get_active_llm_provider(thread_id=thread_id), user.get_active_llm_model(thread_id=thread_id)
+
+
+def _get_summarization_cut(messages: list[Message], keep_turns: int) -> int:
+    """Get the index of the first message kept verbatim: the beginning of the `keep_turns`-th latest turn."""
+    user_message_indexes = [i for i, message in enumerate(messages) if message.role == "user"]
+    if len(user_message_indexes) <= keep_turns:
+        return 0
+    return user_message_indexes[-keep_turns] if keep_turns else len(messages)
+
+
+def _is_same_message(first: Message, second: Message) -> bool:
+    # Some storages do not keep the message ids, so the messages are compared by their content.
+    return first.role == second.role and first.content == second.content and first.tool_call_id == second.tool_call_id
+
+
+@inject_database
+async def summarize_conversation(db: Database, user_id: int, thread_id: int) -> bool:
+    """Replace the older part of the conversation with its summary.
+
+    The summary is generated without holding the thread lock, so the user is never blocked. Then, under the lock,
+    the history is swapped in one go: the summarized messages are replaced with the (pinned) summary, and the
+    latest turns, including the ones added while the summary was being generated, are kept as is.
+
+    Args:
+        user_id: Telegram user ID.
+        thread_id: Thread ID.
+
+    Returns:
+        True if the history has been summarized.
+    """
+    user = await db.get_or_create_user(user_id=user_id)
+    messages: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
+    cut = _get_summarization_cut(messages, keep_turns=gpt_settings.summarization_keep_turns)
+    if not cut:
+        return False
+
+    summarized = messages[:cut]
+    provider, model = await _get_summarization_model(user=user, thread_id=thread_id)
+    logger.info(f"[User {user_id}] Summarizing {cut} messages of the thread {thread_id} with {provider.name}...")
+    summary = await summarize_messages(provider=provider, model=model, user=user, messages=summarized)
+    if not summary.strip():
+        logger.warning(f"[User {user_id}] Empty summary of the thread {thread_id} received, the history is kept.")
+        return False
+
+    lock = await LockManager().get_lock(key=f"{user_id}_{thread_id}")
+    async with lock:
+        current: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
+        if len(current) < cut or not all(map(_is_same_message, current[:cut], summarized)):
+            logger.warning(f"[User {user_id}] The thread {thread_id} history has changed, summary discarded.")
+            return False
+
+        history = [
+            Message(role="user", content="What we were talking about?", pinned=True),
+            Message(role="assistant", content=summary, pinned=True),
+            *current[cut:],
+        ]
+        await db.drop_messages(user=user, thread_id=thread_id)
+        for message in history:
+            await db.add_message(user=user, message=message, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
+    logger.info(f"[User {user_id}] The thread {thread_id} history has been summarized.")
+    return True
+
+
+class HistorySummarizer(metaclass=SingletonMeta):
+    """Runs the conversation summarization in the background, at most once at a time per thread."""
+
+    def __init__(self) -> None:
+        self._running: set[tuple[int, int]] = set()
+
+    def schedule(self, user_id: int, thread_id: int) -> bool:
+        """Schedule the thread summarization.
+
+        Returns:
+            True if the summarization has been scheduled, False if it is already running.
+        """
+        key = (user_id, thread_id)
+        if key in self._running:
+            return False
+        self._running.add(key)
+        if not task_manager.run_task(coro=self._summarize(user_id=user_id, thread_id=thread_id), user_id=user_id):
+            self._running.discard(key)
+            return False
+        return True
+
+    async def _summarize(self, user_id: int, thread_id: int) -> None:
+        try:
+            await summarize_conversation(user_id=user_id, thread_id=thread_id)
+        except Exception as e:
+            logger.error(f"[User {user_id}] Failed to summarize the thread {thread_id} history: {e!r}")
+        finally:
+            self._running.discard((user_id, thread_id))
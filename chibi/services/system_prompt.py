@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from chibi.models import User
+
+# Base system prompt, user ID and thread ID (None if there is no interface).
+SystemPromptKey = tuple[str, int, int | None]
+
+
+class SystemPromptSnapshot:
+    """System prompts prepared during a chat turn, reused by all the rounds of its tool loop.
+
+    The turn starts with the user loaded by the caller, so the prompt inputs are not loaded again. The services
+    changing the prompt inputs (user info, skills, working dir, uploaded files) invalidate the snapshot, so the
+    next round sees the changes.
+    """
+
+    def __init__(self, user: User) -> None:
+        self.user: User | None = user
+        self.prompts: dict[SystemPromptKey, str] = {}
+
+    def get_user(self, user_id: int) -> User | None:
+        return self.user if self.user and self.user.id == user_id else None
+
+    def invalidate(self) -> None:
+        self.user = None
+        self.prompts.clear()
+
+
+current_system_prompt_snapshot: ContextVar[SystemPromptSnapshot | None] = ContextVar(
+    "current_system_prompt_snapshot", default=None
+)
+
+
+@contextmanager
+def system_prompt_snapshot(user: User) -> Iterator[SystemPromptSnapshot]:
+    """Reuse the system prompt while the block (a chat turn, including its tool call rounds) runs.
+
+    Args:
+        user: User, as loaded for the turn.
+
+    Yields:
+        The snapshot.
+    """
+    snapshot = SystemPromptSnapshot(user=user)
+    token = current_system_prompt_snapshot.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        current_system_prompt_snapshot.reset(token)
+
+
+def invalidate_system_prompt_snapshot() -> None:
+    """Make the next round of the current turn (if any) prepare the system prompt from scratch."""
+    if snapshot := current_system_prompt_snapshot.get():
+        snapshot.invalidate()
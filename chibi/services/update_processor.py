@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Hashable
+from weakref import WeakValueDictionary
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def get_update_key(update: object) -> Hashable | None:
+    """Get the key of the update sequence: updates with the same key are processed one by one, in order.
+
+    Args:
+        update: Incoming update.
+
+    Returns:
+        (chat ID, thread ID), or None if the update does not belong to a chat (inline queries, for example).
+    """
+    if not isinstance(update, Update) or not (chat := update.effective_chat):
+        return None
+    message = update.effective_message
+    return chat.id, (message.message_thread_id or 0) if message else 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently, but the updates of the same chat thread one by one, in order of arrival.
+
+    An update waiting for the previous update of its thread does not take a slot of the concurrency cap, so a busy chat
+    does not hold up the others. Such updates count against `max_pending_updates` instead.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int) -> None:
+        """Initialize the processor.
+
+        Args:
+            max_concurrent_updates: Max number of updates processed at the same time.
+            max_pending_updates: Max number of updates accepted for processing (running or waiting for their thread).
+        """
+        super().__init__(max_concurrent_updates=max(max_concurrent_updates, max_pending_updates))
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self.concurrency = max_concurrent_updates
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: WeakValueDictionary[Hashable, asyncio.Lock] = WeakValueDictionary()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = get_update_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return None
+
+        # The lock is dropped with the last update of the thread waiting for it.
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock, self._workers:
+            await coroutine
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -8,15 +8,16 @@ from itertools import islice
 from typing import TYPE_CHECKING, Any, Optional
 from uuid import UUID
 
-from aiocache import cached
-
 from chibi.config import gpt_settings
 from chibi.exceptions import NoProviderSelectedError
-from chibi.models import Message, SelectedModel, TelegramFileMeta, User
+from chibi.models import Message, SelectedModel, TelegramFileMeta, ToolPruningSettings, User
 from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema, VisionResultSchema
 from chibi.services.interface import UserInterface
 from chibi.services.lock_manager import LockManager
+from chibi.services.summarization import HistorySummarizer
+from chibi.services.system_prompt import invalidate_system_prompt_snapshot, system_prompt_snapshot
 from chibi.storage.abstract import Database
+from chibi.storage.blobs import BlobStore
 from chibi.storage.database import inject_database
 
 if TYPE_CHECKING:
@@ -43,28 +44,13 @@ async def set_active_model(db: Database, interface: UserInterface, model: ModelC
 
 @inject_database
 async def reset_chat_history(db: Database, user_id: int, thread_id: int) -> None:
-    user = await db.get_or_create_user(user_id=user_id)
-    await db.drop_messages(user=user, thread_id=thread_id)
+    from chibi.services.providers.tools.selection import ToolSelector
 
-
-@inject_database
-async def emergency_summarization(db: Database, user_id: int, thread_id: int) -> None:
     user = await db.get_or_create_user(user_id=user_id)
-
-    chat_history = await db.get_messages(user=user, thread_id=thread_id)
-    chat_history_string = str(msg for msg in chat_history if not any((msg.get("tool_calls"), msg.get("tool_call_id"))))
-    user_messages: list[Message] = [Message(role="user", content=chat_history_string)]
-
-    response, _ = await user.get_active_llm_provider(thread_id=thread_id).get_chat_response(
-        messages=user_messages,
-        user=user,
-        system_prompt="Summarize this conversation, keeping the most important and useful information using English.",
-    )
-    initial_message = Message(role="user", content="What we were talking about?")
-    answer_message = Message(role="assistant", content=response.answer)
-    await reset_chat_history(user_id=user_id, thread_id=thread_id)
-    await db.add_message(user=user, message=initial_message, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
-    await db.add_message(user=user, message=answer_message, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
+    await db.drop_messages(user=user, thread_id=thread_id)
+    await BlobStore().drop(user_id=user_id, thread_id=thread_id)
+    ToolSelector().forget(user_id=user_id, thread_id=thread_id)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -90,15 +76,24 @@ async def send_scheduled_message_to_llm(
         conversation_messages: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
         new_message_to_llm = Message(role="user", content=json.dumps(prompt))
         conversation_messages.append(new_message_to_llm)
+        conversation_messages = _prune_tool_history(user=user, thread_id=thread_id, messages=conversation_messages)
 
         active_provider = user.get_active_llm_provider(thread_id=thread_id)
         active_model = user.get_active_llm_model(thread_id=thread_id)
+        conversation_messages = _fit_to_context(
+            messages=conversation_messages, models=[active_model or active_provider.default_model]
+        )
 
-        chat_response, new_messages = await active_provider.get_chat_response(
-            messages=conversation_messages, user=user, model=active_model, interface=interface
+        with system_prompt_snapshot(user=user):
+            chat_response, new_messages = await active_provider.get_chat_response(
+                messages=conversation_messages, user=user, model=active_model, interface=interface
+            )
+        from chibi.services.providers.tools.utils import spill_large_tool_results
+
+        spilled_messages = await spill_large_tool_results(
+            user_id=user.id, messages=[new_message_to_llm, *new_messages], thread_id=thread_id
         )
-        await db.add_message(user=user, message=new_message_to_llm, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
-        for msg in new_messages:
+        for msg in spilled_messages:
             await db.add_message(user=user, message=msg, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
         return chat_response
 
@@ -116,6 +111,7 @@ async def save_telegram_document_metadata(db: Database, user_id: int, file_metad
         user.telegram_files = files_update
 
     await db.save_user(user)
+    invalidate_system_prompt_snapshot()
     return file_meta.file_unique_id
 
 
@@ -136,6 +132,40 @@ async def get_telegram_document(db: Database, user_id: int, file_unique_id: str)
     return user.telegram_files.get(file_unique_id)
 
 
+def _prune_tool_history(user: User, thread_id: int, messages: list[Message]) -> list[Message]:
+    """Replace the stale tool calls and results with stubs according to the thread tool history pruning policy."""
+    from chibi.services.providers.tool_pruning import get_pruning_policy, prune_tool_history
+
+    if not (policy := get_pruning_policy(user=user, thread_id=thread_id)):
+        return messages
+    return prune_tool_history(messages=messages, policy=policy)
+
+
+def _fit_to_context(messages: list[Message], models: list[str]) -> list[Message]:
+    """Trim the conversation to fit the smallest context window of the models that may get the request."""
+    from chibi.services.providers.context_window import fit_messages, get_model_budget
+
+    if not gpt_settings.context_trimming:
+        return messages
+    budgets = [budget for model in models if (budget := get_model_budget(model))]
+    if not budgets:
+        return messages
+    return fit_messages(messages=messages, budget=min(budgets, key=lambda budget: budget.input_budget))
+
+
+def _get_hedge_provider(user: User, active_provider: "Provider", active_model: str | None) -> Optional["Provider"]:
+    """Get the fallback provider to hedge the chat request with (if hedging is configured and makes sense)."""
+    if not gpt_settings.hedge_fallback_provider:
+        return None
+    hedge_provider = user.providers.get(gpt_settings.hedge_fallback_provider)
+    if not hedge_provider:
+        return None
+    hedge_model = gpt_settings.hedge_fallback_model or hedge_provider.default_model
+    if hedge_provider.name == active_provider.name and hedge_model == (active_model or active_provider.default_model):
+        return None
+    return hedge_provider
+
+
 @inject_database
 async def get_llm_chat_completion_answer(
     db: Database,
@@ -189,17 +219,43 @@ async def get_llm_chat_completion_answer(
         conversation_messages: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
         new_message_to_llm = Message(role="user", content=json.dumps(prompt))
         conversation_messages.append(new_message_to_llm)
+        conversation_messages = _prune_tool_history(user=user, thread_id=thread_id, messages=conversation_messages)
 
         active_provider = user.get_active_llm_provider(thread_id=thread_id)
-
-        chat_response, new_messages = await active_provider.get_chat_response(
+        active_model = user.get_active_llm_model(thread_id=thread_id)
+        hedge_provider = _get_hedge_provider(user=user, active_provider=active_provider, active_model=active_model)
+        hedge_model = gpt_settings.hedge_fallback_model or hedge_provider.default_model if hedge_provider else None
+        conversation_messages = _fit_to_context(
             messages=conversation_messages,
-            user=user,
-            model=user.get_active_llm_model(thread_id=thread_id),
-            interface=interface,
+            models=[active_model or active_provider.default_model, *([hedge_model] if hedge_model else [])],
         )
-        await db.add_message(user=user, message=new_message_to_llm, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
-        for message in new_messages:
+
+        with system_prompt_snapshot(user=user):
+            if hedge_provider:
+                from chibi.services.providers.hedging import get_hedged_chat_response
+
+                chat_response, new_messages = await get_hedged_chat_response(
+                    primary=active_provider,
+                    primary_model=active_model or active_provider.default_model,
+                    fallback=hedge_provider,
+                    fallback_model=hedge_model or hedge_provider.default_model,
+                    messages=conversation_messages,
+                    user=user,
+                    interface=interface,
+                )
+            else:
+                chat_response, new_messages = await active_provider.get_chat_response(
+                    messages=conversation_messages,
+                    user=user,
+                    model=active_model,
+                    interface=interface,
+                )
+        from chibi.services.providers.tools.utils import spill_large_tool_results
+
+        spilled_messages = await spill_large_tool_results(
+            user_id=user.id, messages=[new_message_to_llm, *new_messages], thread_id=thread_id
+        )
+        for message in spilled_messages:
             await db.add_message(user=user, message=message, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
         return chat_response
 
@@ -208,14 +264,12 @@ async def get_llm_chat_completion_answer(
 async def check_history_and_summarize(db: Database, user_id: int, thread_id: int) -> bool:
     user = await db.get_or_create_user(user_id=user_id)
     messages: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
-    # Roughly estimating how many tokens the current conversation history will comprise. It is possible to calculate
-    # this accurately, but the modules that can be used for this need to be separately built for armv7, which is
-    # difficult to do right now (but will be done further, I hope).
+    # Token counts are computed once per message (BPE if TOKENIZER_FILE is set, heuristics otherwise) and persisted.
     tokens = sum(msg.estimate_tokens for msg in messages)
-    if tokens >= gpt_settings.max_history_tokens:
-        await emergency_summarization(user_id=user_id, thread_id=thread_id)
-        return True
-    return False
+    if tokens < gpt_settings.max_history_tokens * gpt_settings.summarization_threshold:
+        return False
+    # Summarization runs in the background, the history is swapped once the summary is ready.
+    return HistorySummarizer().schedule(user_id=user_id, thread_id=thread_id)
 
 
 @inject_database
@@ -293,7 +347,6 @@ async def ocr_pdf(
     return await provider.ocr(pdf=pdf, model=model)
 
 
-@cached(ttl=3600)
 @inject_database
 async def get_user_cached_models(db: Database, user_id: int, image_generation: bool = False) -> list[ModelChangeSchema]:
     user = await db.get_or_create_user(user_id=user_id)
@@ -333,9 +386,14 @@ async def user_has_reached_images_generation_limit(db: Database, user_id: int) -
 
 @inject_database
 async def set_api_key(db: Database, user_id: int, api_key: str, provider_name: str) -> None:
+    from chibi.services.providers import RegisteredProviders
+
     user = await db.get_or_create_user(user_id=user_id)
+    previous_api_keys = user.providers.tokens
+    previous_api_key = user.tokens.get(provider_name)
     user.tokens[provider_name] = api_key
     await db.save_user(user)
+    RegisteredProviders.invalidate(user_api_keys=previous_api_keys, stale_api_key=previous_api_key)
     return None
 
 
@@ -350,6 +408,7 @@ async def set_info(db: Database, user_id: int, new_info: str) -> None:
     user = await db.get_or_create_user(user_id=user_id)
     user.info = new_info
     await db.save_user(user)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -357,6 +416,7 @@ async def activate_llm_skill(db: Database, user_id: int, skill_name: str, skill_
     user = await db.get_or_create_user(user_id=user_id)
     user.llm_skills[skill_name] = skill_payload
     await db.save_user(user)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -366,6 +426,7 @@ async def deactivate_llm_skill(db: Database, user_id: int, skill_name: str) -> N
         raise ValueError(f"The skill {skill_name} seems never been activated")
     user.llm_skills.pop(skill_name)
     await db.save_user(user)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -373,6 +434,7 @@ async def set_working_dir(db: Database, user_id: int, new_wd: str) -> None:
     user = await db.get_or_create_user(user_id=user_id)
     user.working_dir = new_wd
     await db.save_user(user)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -398,6 +460,7 @@ async def drop_tool_call_history(db: Database, user_id: int, thread_id: int) ->
         message.tool_calls = None
         message.tool_call_id = None
         await db.add_message(user=user, message=message, ttl=gpt_settings.messages_ttl, thread_id=thread_id)
+    invalidate_system_prompt_snapshot()
 
 
 @inject_database
@@ -406,6 +469,22 @@ async def summarize_history(db: Database, user_id: int, thread_id: int) -> None:
     chat_history: list[Message] = await db.get_conversation_messages(user=user, thread_id=thread_id)
     await reset_chat_history(user_id=user_id, thread_id=thread_id)
     await db.add_message(user=user, message=chat_history[0], ttl=gpt_settings.messages_ttl, thread_id=thread_id)
+    invalidate_system_prompt_snapshot()
+
+
+@inject_database
+async def set_tool_pruning_settings(db: Database, user_id: int, thread_id: int, settings: ToolPruningSettings) -> None:
+    """Save the tool call history pruning settings of a specific thread for the user.
+
+    Args:
+        db: The database instance.
+        user_id: The ID of the user.
+        thread_id: The ID of the thread.
+        settings: The pruning settings of the thread.
+    """
+    user = await db.get_or_create_user(user_id=user_id)
+    user.thread_tool_pruning[thread_id] = settings
+    await db.save_user(user)
 
 
 @inject_database
@@ -464,12 +543,17 @@ async def clone_thread_messages(
         cloned = deepcopy(message)
         cloned.id = time.time_ns() + i
         await db.add_message(user=user, message=cloned, thread_id=new_thread_id)
+    # The spilled tool results the cloned messages refer to.
+    await BlobStore().copy(user_id=user_id, from_thread_id=old_thread_id, to_thread_id=new_thread_id)
 
     if old_thread_id in user.thread_selected_llm:
         user.thread_selected_llm[new_thread_id] = user.thread_selected_llm[old_thread_id]
     if old_thread_id in user.thread_selected_image_model:
         user.thread_selected_image_model[new_thread_id] = user.thread_selected_image_model[old_thread_id]
 
+    if old_thread_id in user.thread_tool_pruning:
+        user.thread_tool_pruning[new_thread_id] = user.thread_tool_pruning[old_thread_id]
+
     user.thread_names[new_thread_id] = name or str(new_thread_id)
 
     await db.save_user(user)
@@ -0,0 +1,146 @@
+import asyncio
+import hmac
+import secrets
+import signal
+from urllib.parse import urlparse
+
+from aiohttp import web
+from loguru import logger
+from telegram import Update
+from telegram.ext import Application
+
+from chibi.config import telegram_settings
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Telegram redelivers the update answered with an error, so the rejected updates are not lost.
+RETRY_AFTER_SECONDS = 1
+
+
+class WebhookServer:
+    """Embedded HTTP server receiving the updates Telegram POSTs to the webhook.
+
+    Updates are acknowledged as soon as they are queued for the application, before processing. When the intake
+    queue is full, or all the update processor slots are taken, updates are rejected with 429, so Telegram delivers
+    them again later instead of the bot piling up unbounded work.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        url: str,
+        secret_token: str,
+        listen: str = "0.0.0.0",
+        port: int = 8080,
+        max_connections: int = 40,
+    ) -> None:
+        """Initialize the server.
+
+        Args:
+            application: Application to pass the updates to (its update queue is the intake queue).
+            url: Public HTTPS URL of the webhook (its path is served).
+            secret_token: Secret token Telegram sends along with every update.
+            listen: Address to listen on.
+            port: Port to listen on.
+            max_connections: Max number of simultaneous HTTPS connections Telegram opens to the webhook.
+        """
+        self.application = application
+        self.url = url
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.max_connections = max_connections
+        self.web_app = web.Application()
+        self.web_app.router.add_post(urlparse(url).path or "/", self.handle_update)
+        self._runner: web.AppRunner | None = None
+
+    def _is_saturated(self) -> bool:
+        processor = self.application.update_processor
+        return processor.current_concurrent_updates >= processor.max_concurrent_updates
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token):
+            logger.warning(f"Webhook request from {request.remote} rejected: invalid secret token.")
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Webhook request from {request.remote} rejected: invalid update ({e}).")
+            return web.Response(status=400)
+
+        try:
+            if self._is_saturated():
+                raise asyncio.QueueFull
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"Update {update.update_id} rejected: the bot is busy, Telegram will deliver it again.")
+            return web.Response(status=429, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+        return web.Response(status=200)
+
+    async def start(self) -> None:
+        """Start listening and register the webhook with Telegram."""
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.listen, port=self.port).start()
+        logger.info(f"Listening for the webhook updates on {self.listen}:{self.port}.")
+
+        await self.application.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=self.max_connections,
+        )
+        logger.info(f"Webhook registered: {self.url}")
+
+    async def stop(self) -> None:
+        """Stop accepting the updates (the webhook stays registered, i.e. for the other replicas)."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def run_webhook(application: Application) -> None:
+    """Run the application receiving the updates through the webhook until SIGINT or SIGTERM.
+
+    Args:
+        application: Application built without an updater.
+    """
+    if not telegram_settings.webhook_url:
+        raise RuntimeError("No webhook URL configured")
+
+    secret_token = telegram_settings.webhook_secret_token
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("No WEBHOOK_SECRET_TOKEN set, using a random one: set it explicitly to run several replicas.")
+
+    server = WebhookServer(
+        application=application,
+        url=telegram_settings.webhook_url,
+        secret_token=secret_token,
+        listen=telegram_settings.webhook_listen,
+        port=telegram_settings.webhook_port,
+        max_connections=telegram_settings.webhook_max_connections,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        await stop.wait()
+    finally:
+        logger.info("Stopping the webhook server...")
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
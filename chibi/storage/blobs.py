@@ -0,0 +1,176 @@
+import asyncio
+import os
+import shutil
+import time
+from hashlib import sha256
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from chibi.config import application_settings, gpt_settings
+from chibi.utils.app import SingletonMeta
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+BLOB_REDIS_KEY_PREFIX = "chibi:blob"
+BLOB_DIR_NAME = "blobs"
+HANDLE_PREFIX = "blob:"
+# Expired local blobs are looked for at most that often, seconds.
+SWEEP_INTERVAL = 3600
+
+
+class BlobStore(metaclass=SingletonMeta):
+    """Content-addressed per-conversation store of the large payloads (i.e. tool results) kept out of the history.
+
+    Blobs are stored in Redis if configured, or in the local data directory otherwise, and expire with the messages
+    (local blobs are swept by their modification time). The blobs of a conversation thread are deleted when its history
+    is reset. The handle is the SHA-256 of the content, so identical payloads are stored once per thread.
+    """
+
+    def __init__(self) -> None:
+        self._redis: "Redis | None" = None
+        self._swept_at = 0.0
+
+    async def _get_redis(self) -> "Redis | None":
+        if not application_settings.redis:
+            return None
+        if self._redis is None:
+            from redis.asyncio import from_url
+
+            self._redis = from_url(application_settings.redis)
+        return self._redis
+
+    @staticmethod
+    def _get_digest(handle: str) -> str:
+        digest = handle.removeprefix(HANDLE_PREFIX)
+        if len(digest) != 64 or not all(char in "0123456789abcdef" for char in digest):
+            raise ValueError(f"Invalid blob handle: '{handle}'")
+        return digest
+
+    @staticmethod
+    def _get_root() -> Path:
+        return Path(application_settings.local_data_path) / BLOB_DIR_NAME
+
+    def _get_file_path(self, user_id: int, thread_id: int, digest: str) -> Path:
+        return self._get_root() / str(user_id) / str(thread_id) / digest[:2] / digest
+
+    @staticmethod
+    def _get_redis_key(user_id: int, thread_id: int | str, digest: str) -> str:
+        return f"{BLOB_REDIS_KEY_PREFIX}:{user_id}:{thread_id}:{digest}"
+
+    def _sweep(self, ttl: int) -> None:
+        """Delete the local blobs not stored again for longer than the TTL, and the directories left empty."""
+        expire_before = time.time() - ttl
+        removed = 0
+        for dir_path, _, file_names in os.walk(self._get_root(), topdown=False):
+            for file_name in file_names:
+                path = Path(dir_path) / file_name
+                try:
+                    if path.stat().st_mtime < expire_before:
+                        path.unlink()
+                        removed += 1
+                except OSError as e:
+                    logger.error(f"Failed to delete the expired blob {path}: {e!r}")
+            try:
+                Path(dir_path).rmdir()
+            except OSError:
+                pass  # Not empty.
+        if removed:
+            logger.info(f"{removed} expired blobs deleted")
+
+    async def _sweep_if_due(self) -> None:
+        now = time.time()
+        if now - self._swept_at < SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        await asyncio.to_thread(self._sweep, gpt_settings.messages_ttl)
+
+    async def put(self, user_id: int, data: bytes, thread_id: int = 0) -> str:
+        """Store the blob.
+
+        Args:
+            user_id: Telegram user ID (the owner of the blob).
+            data: Blob content.
+            thread_id: ID of the conversation thread the blob belongs to.
+
+        Returns:
+            Blob handle.
+        """
+        digest = sha256(data).hexdigest()
+        if redis := await self._get_redis():
+            await redis.set(self._get_redis_key(user_id, thread_id, digest), data, ex=gpt_settings.messages_ttl)
+            return f"{HANDLE_PREFIX}{digest}"
+
+        await self._sweep_if_due()
+        path = self._get_file_path(user_id=user_id, thread_id=thread_id, digest=digest)
+        if path.exists():
+            # Referenced by a new message again: expires with it.
+            await asyncio.to_thread(path.touch)
+        else:
+            await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(path.write_bytes, data)
+        return f"{HANDLE_PREFIX}{digest}"
+
+    async def get(self, user_id: int, handle: str, thread_id: int | None = 0) -> bytes | None:
+        """Get the blob content, None if there is no such blob (or it has expired).
+
+        Args:
+            user_id: Telegram user ID (the owner of the blob).
+            handle: Blob handle.
+            thread_id: ID of the conversation thread the blob belongs to, None to look in all the user threads (i.e.
+                for the sub-agents, which have no thread of their own).
+
+        Returns:
+            Blob content or None.
+        """
+        digest = self._get_digest(handle)
+        if redis := await self._get_redis():
+            if thread_id is not None:
+                data: bytes | None = await redis.get(self._get_redis_key(user_id, thread_id, digest))
+                return data
+            keys = await redis.keys(self._get_redis_key(user_id, "*", digest))
+            return await redis.get(keys[0]) if keys else None
+
+        if thread_id is not None:
+            path = self._get_file_path(user_id=user_id, thread_id=thread_id, digest=digest)
+        else:
+            paths = await asyncio.to_thread(
+                lambda: list((self._get_root() / str(user_id)).glob(f"*/{digest[:2]}/{digest}"))
+            )
+            if not paths:
+                return None
+            path = paths[0]
+        if not path.exists():
+            return None
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except OSError as e:
+            logger.error(f"Failed to read the blob {handle}: {e!r}")
+            return None
+
+    async def drop(self, user_id: int, thread_id: int = 0) -> None:
+        """Delete all the blobs of the conversation thread, i.e. when its history is reset."""
+        if redis := await self._get_redis():
+            keys = await redis.keys(self._get_redis_key(user_id, thread_id, "*"))
+            if keys:
+                await redis.delete(*keys)
+            return
+        await asyncio.to_thread(shutil.rmtree, self._get_root() / str(user_id) / str(thread_id), ignore_errors=True)
+
+    async def copy(self, user_id: int, from_thread_id: int, to_thread_id: int) -> None:
+        """Copy all the blobs of the conversation thread to another one, i.e. when the thread is cloned."""
+        if redis := await self._get_redis():
+            for key in await redis.keys(self._get_redis_key(user_id, from_thread_id, "*")):
+                if (data := await redis.get(key)) is None:
+                    continue
+                digest = (key.decode() if isinstance(key, bytes) else key).rsplit(":", 1)[-1]
+                await redis.set(self._get_redis_key(user_id, to_thread_id, digest), data, ex=gpt_settings.messages_ttl)
+            return
+
+        source = self._get_root() / str(user_id) / str(from_thread_id)
+        if source.exists():
+            # Copied with a new modification time: the blobs expire with the cloned messages.
+            target = self._get_root() / str(user_id) / str(to_thread_id)
+            await asyncio.to_thread(shutil.copytree, source, target, copy_function=shutil.copy, dirs_exist_ok=True)
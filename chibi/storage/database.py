@@ -4,9 +4,6 @@ from typing import Awaitable, Callable, Concatenate, Optional, ParamSpec, TypeVa
 
 from chibi.config.app import application_settings
 from chibi.storage.abstract import Database
-from chibi.storage.dynamodb import DynamoDBStorage
-from chibi.storage.local import LocalStorage
-from chibi.storage.redis import RedisStorage
 
 R = TypeVar("R")
 P = ParamSpec("P")
@@ -33,13 +30,18 @@ class DatabaseCache:
                 return self._cache
 
             backend = application_settings.storage_backend.lower()
+            # The backend modules (and their client libraries) are imported only when the backend is used.
             if backend == "redis":
+                from chibi.storage.redis import RedisStorage
+
                 # RedisStorage.create expects URL and password
                 self._cache = await RedisStorage.create(
                     url=cast(str, application_settings.redis),
                     password=application_settings.redis_password,
                 )
             elif backend == "dynamodb":
+                from chibi.storage.dynamodb import DynamoDBStorage
+
                 # DynamoDBStorage.create expects region, access_key, secret_key, tables
                 self._cache = await DynamoDBStorage.create(
                     region=application_settings.aws_region or "",
@@ -50,6 +52,8 @@ class DatabaseCache:
                 )
             else:
                 # default to local storage
+                from chibi.storage.local import LocalStorage
+
                 self._cache = LocalStorage(application_settings.local_data_path)
 
             return self._cache
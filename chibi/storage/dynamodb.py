@@ -188,6 +188,7 @@ class DynamoDBStorage(Database):
             ttl: Optional Time To Live for the message in seconds.
             thread_id: Thread identifier (0 for global messages).
         """
+        message.fill_token_count()
         expire_at: int | None = None
         if ttl is not None:
             expire_at = int(time.time()) + ttl
@@ -239,7 +240,7 @@ class DynamoDBStorage(Database):
                     # Use "data" field for full message serialization (new format)
                     if "data" in it:
                         msg = Message.model_validate_json(it["data"])
-                        result.append(msg.model_dump(exclude={"expire_at", "id"}))
+                        result.append(msg.model_dump(exclude={"expire_at"}))
                     else:
                         # Backward compatibility: reconstruct from individual fields (old format)
                         result.append(
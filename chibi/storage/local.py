@@ -46,6 +46,7 @@ class LocalStorage(Database):
         return None
 
     async def add_message(self, user: User, message: Message, ttl: int | None = None, thread_id: int = 0) -> None:
+        message.fill_token_count()
         user_refreshed = await self.get_or_create_user(user_id=user.id)
         expire_at = time.time() + ttl if ttl else None
 
@@ -68,7 +69,7 @@ class LocalStorage(Database):
             messages = user_refreshed.messages
 
         msgs = [
-            msg.model_dump(exclude={"expire_at", "id"})
+            msg.model_dump(exclude={"expire_at"})
             for msg in messages
             if msg.expire_at is None or msg.expire_at > current_time
         ]
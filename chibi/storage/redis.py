@@ -79,6 +79,7 @@ class RedisStorage(Database):
 
     @retry_connection
     async def add_message(self, user: User, message: Message, ttl: int | None = None, thread_id: int = 0) -> None:
+        message.fill_token_count()
         if thread_id:
             message_key = f"user:{user.id}:thread:{thread_id}:message:{message.id}"
         else:
@@ -1,4 +1,5 @@
 from functools import wraps
+from hashlib import sha256
 from pathlib import Path
 from typing import Any, Callable
 
@@ -17,6 +18,7 @@ from chibi.exceptions import (
     RecursionLimitExceeded,
     ServiceRateLimitError,
     ServiceResponseError,
+    ServiceUnavailableError,
 )
 from chibi.services.interface import UserInterface
 
@@ -31,6 +33,11 @@ class SingletonMeta(type):
         return cls._instances[cls]
 
 
+def hash_api_key(api_key: str | None) -> str:
+    """Get a short non-reversible fingerprint of the API key, safe to use in cache keys and logs."""
+    return sha256((api_key or "").encode()).hexdigest()[:12]
+
+
 async def run_heartbeat(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a heartbeat GET request to a configured monitoring URL.
 
@@ -67,12 +74,12 @@ def _provider_statuses() -> list[str]:
     Returns:
         list of string containing the provider clients statuses data.
     """
-    from chibi.services.providers import RegisteredProviders
+    from chibi.services.providers import PROVIDER_MODULES, RegisteredProviders
 
     statuses = [
         "<magenta>Provider clients:</magenta>",
     ]
-    for provider_name in RegisteredProviders.all.keys():
+    for provider_name in map(str.lower, PROVIDER_MODULES):
         status = SETTING_SET if provider_name in RegisteredProviders.available else SETTING_UNSET
         statuses.append(f"{provider_name.capitalize()} client: {status}")
     return statuses
@@ -187,6 +194,10 @@ def handle_gpt_exceptions(func: Callable[..., Any]) -> Callable[..., Any]:
             logger.error(f"{error_msg_prefix}: {e}")
             text = f"Rate Limit exceeded for {e.provider}. We should back off a bit."
 
+        except ServiceUnavailableError as e:
+            logger.error(f"{error_msg_prefix}: {e}")
+            text = f"{e.provider} ({e.model}) seems to be down at the moment. Please, try again a bit later."
+
         except NoModelSelectedError as e:
             logger.error(f"{error_msg_prefix}: {e}")
 
@@ -213,17 +224,40 @@ def handle_gpt_exceptions(func: Callable[..., Any]) -> Callable[..., Any]:
     return wrapper
 
 
+class BuiltinSkillsIndex(metaclass=SingletonMeta):
+    """Index of the built-in skills (file name -> description, the first line of the file).
+
+    The files are read only when the skills directory changes (its mtime changes when a skill file is added, removed
+    or replaced), not with every system prompt.
+    """
+
+    def __init__(self) -> None:
+        self._skills: dict[str, str] = {}
+        self._mtime_ns: int | None = None
+
+    @staticmethod
+    def _read_skills(path: Path) -> dict[str, str]:
+        result = {}
+        for f in path.iterdir():
+            if not f.is_file() or f.name.startswith("."):
+                continue
+            try:
+                with f.open(encoding="utf-8") as fh:
+                    first_line = fh.readline()
+                desc = first_line.lstrip("# ").strip() if first_line.startswith("#") else f.stem
+                result[f.name] = desc
+            except (UnicodeDecodeError, OSError):
+                continue
+        return result
+
+    def get(self) -> dict[str, str]:
+        path = Path(application_settings.skills_dir)
+        mtime_ns = path.stat().st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            self._skills = self._read_skills(path)
+            self._mtime_ns = mtime_ns
+        return self._skills
+
+
 def get_builtin_skill_names() -> dict[str, str]:
-    path = Path(application_settings.skills_dir)
-    result = {}
-    for f in path.iterdir():
-        if not f.is_file() or f.name.startswith("."):
-            continue
-        try:
-            with f.open(encoding="utf-8") as fh:
-                first_line = fh.readline()
-            desc = first_line.lstrip("# ").strip() if first_line.startswith("#") else f.stem
-            result[f.name] = desc
-        except (UnicodeDecodeError, OSError):
-            continue
-    return result
+    return BuiltinSkillsIndex().get()
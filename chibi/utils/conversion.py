@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class MessageConversionCache:
+    """Messages converted to the provider formats, keyed by (message id, format), bounded LRU.
+
+    Every entry keeps the fingerprint of the message it was converted from (the converted fields themselves, so
+    comparing them is mostly a matter of identity checks), and a changed message is converted again. Cached payloads
+    are shared, so the callers modifying them (i.e. marking with `cache_control`) must get copies via `copy`.
+    """
+
+    def __init__(self, maxsize: int = 20000) -> None:
+        self._payloads: OrderedDict[tuple[int, str], tuple[tuple[Any, ...], Any]] = OrderedDict()
+        self._maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_convert(
+        self,
+        message_id: int,
+        target: str,
+        fingerprint: tuple[Any, ...],
+        convert: Callable[[], T],
+        copy: Callable[[T], T] | None = None,
+    ) -> T:
+        """Get the converted message from the cache, or convert and cache it.
+
+        Args:
+            message_id: Message ID.
+            target: Target format name.
+            fingerprint: Fields the converted message is built from.
+            convert: Conversion function.
+            copy: Function copying the payload before handing it out, if the callers modify it.
+
+        Returns:
+            Converted message.
+        """
+        key = (message_id, target)
+        cached = self._payloads.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self._payloads.move_to_end(key)
+            self.hits += 1
+            payload = cached[1]
+        else:
+            self.misses += 1
+            payload = convert()
+            self._payloads[key] = (fingerprint, payload)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self._maxsize:
+                self._payloads.popitem(last=False)
+        return copy(payload) if copy else payload
+
+    def clear(self) -> None:
+        self._payloads.clear()
+        self.hits = self.misses = 0
+
+
+message_conversion_cache = MessageConversionCache()
@@ -6,7 +6,6 @@ from urllib.parse import parse_qs, urlparse
 
 import click
 import httpx
-import telegramify_markdown
 from loguru import logger
 from telegram import (
     Chat as TelegramChat,
@@ -250,6 +249,8 @@ async def send_long_message(
         thread_id: The message thread ID.
     """
     if normalize_md:
+        import telegramify_markdown
+
         message = telegramify_markdown.markdownify(message)
         chunks = split_markdown_v2(message)
     else:
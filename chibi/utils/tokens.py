@@ -0,0 +1,173 @@
+import base64
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from loguru import logger
+
+from chibi.config import gpt_settings
+
+# Every chat message costs a few tokens on top of its content (role and message delimiters).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# An approximation of the cl100k/o200k pre-tokenizer using the stdlib `re` ([^\W\d_] is "any letter").
+_PRETOKENIZE_PATTERN = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+)
+_HEURISTIC_PATTERN = re.compile(
+    r"(?P<latin>[A-Za-z]+)"
+    r"|(?P<digits>\d+)"
+    r"|(?P<cjk>[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])"
+    r"|(?P<letters>[^\W\d_]+)"
+    r"|(?P<space> )"
+    r"|(?P<whitespace>\s+)"
+    r"|(?P<other>.)",
+    re.DOTALL,
+)
+
+
+class TokenCounter(ABC):
+    """Counts the tokens a text takes in the LLM context."""
+
+    name: str
+
+    @abstractmethod
+    def count(self, text: str) -> int: ...
+
+    def count_message(self, role: str, content: str, tool_calls: str | None = None) -> int:
+        """Count the tokens of a chat message.
+
+        Args:
+            role: Message role.
+            content: Message content.
+            tool_calls: JSON representation of the message tool calls, if any.
+
+        Returns:
+            Number of tokens.
+        """
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count(role) + self.count(content)
+        if tool_calls:
+            tokens += self.count(tool_calls)
+        return tokens
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """Character class based estimation, close to the real BPE tokenizers for prose, code, JSON and CJK text.
+
+    Latin words take a token per ~5 letters, numbers are split by 3 digits, CJK characters take a token each,
+    other scripts a token per ~3 letters, and punctuation/symbols (the bulk of code and JSON) a token each.
+    """
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for match in _HEURISTIC_PATTERN.finditer(text):
+            kind, segment = match.lastgroup, match.group()
+            if kind == "latin":
+                tokens += math.ceil(len(segment) / 5)
+            elif kind == "digits":
+                tokens += math.ceil(len(segment) / 3)
+            elif kind == "letters":
+                tokens += math.ceil(len(segment) / 3)
+            elif kind == "space":
+                # A single space is merged with the next word.
+                continue
+            elif kind == "other":
+                tokens += max(1, len(segment.encode()) // 2)
+            else:
+                tokens += 1
+        return tokens
+
+
+class BPETokenCounter(TokenCounter):
+    """Pure Python byte-level BPE tokenizer (no native extensions, so it works on armv7 too).
+
+    Uses the merge ranks in the tiktoken format (i.e. `cl100k_base.tiktoken` or `o200k_base.tiktoken`: a base64
+    encoded token and its rank per line). Pre-tokenized pieces repeat a lot, so their token counts are memoized.
+    """
+
+    def __init__(self, ranks_file: str, piece_cache_size: int = 65536) -> None:
+        path = Path(ranks_file).expanduser()
+        self.name = f"bpe:{path.stem}"
+        self._ranks: dict[bytes, int] = {}
+        for line in path.read_bytes().splitlines():
+            if line:
+                token, rank = line.split()
+                self._ranks[base64.b64decode(token)] = int(rank)
+        self._piece_cache: OrderedDict[bytes, int] = OrderedDict()
+        self._piece_cache_size = piece_cache_size
+
+    def _count_piece(self, piece: bytes) -> int:
+        if piece in self._ranks:
+            return 1
+        parts = [piece[i : i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank, best_index = None, -1
+            for i in range(len(parts) - 1):
+                rank = self._ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_index = rank, i
+            if best_rank is None:
+                break
+            parts[best_index : best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+        return len(parts)
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for match in _PRETOKENIZE_PATTERN.finditer(text):
+            piece = match.group().encode()
+            if (count := self._piece_cache.get(piece)) is None:
+                count = self._count_piece(piece)
+                self._piece_cache[piece] = count
+                if len(self._piece_cache) > self._piece_cache_size:
+                    self._piece_cache.popitem(last=False)
+            tokens += count
+        return tokens
+
+
+@lru_cache()
+def get_token_counter() -> TokenCounter:
+    """Get the configured token counter: the BPE one if the `TOKENIZER_FILE` is set and valid, else the heuristic."""
+    if gpt_settings.tokenizer_file:
+        try:
+            counter = BPETokenCounter(ranks_file=gpt_settings.tokenizer_file)
+            logger.info(f"Using the {counter.name} token counter.")
+            return counter
+        except Exception as e:
+            logger.error(f"Failed to load the tokenizer from {gpt_settings.tokenizer_file}: {e!r}. Using heuristics.")
+    return HeuristicTokenCounter()
+
+
+class MessageTokensCache:
+    """Token counts of the recently seen messages, keyed by (message id, counter name).
+
+    Counts are also persisted with the messages themselves, this cache only covers the messages stored before
+    (or without) it.
+    """
+
+    def __init__(self, maxsize: int = 50000) -> None:
+        self._counts: OrderedDict[tuple[int, str], int] = OrderedDict()
+        self._maxsize = maxsize
+
+    def get(self, message_id: int, counter: str) -> int | None:
+        key = (message_id, counter)
+        if (count := self._counts.get(key)) is not None:
+            self._counts.move_to_end(key)
+        return count
+
+    def set(self, message_id: int, counter: str, count: int) -> None:
+        self._counts[(message_id, counter)] = count
+        if len(self._counts) > self._maxsize:
+            self._counts.popitem(last=False)
+
+    def discard(self, message_id: int) -> None:
+        """Forget the counts of the message, i.e. when its content is replaced keeping the id."""
+        for key in [key for key in self._counts if key[0] == message_id]:
+            del self._counts[key]
+
+
+message_tokens_cache = MessageTokensCache()
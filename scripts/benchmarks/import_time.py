@@ -0,0 +1,65 @@
+"""Import time benchmark of the entry points (a regression check for the lazy imports).
+
+Every module is imported in a fresh interpreter with `-X importtime`; the best of the runs is reported along with
+the slowest imports. Usage:
+
+    python -m scripts.benchmarks.import_time [--modules chibi.cli chibi.runners.terminal] [--repeat 3] [--top 10]
+        [--max-ms 3000]
+
+Exits with the status 1 if any module takes longer than `--max-ms`.
+"""
+
+import argparse
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["chibi.cli", "chibi.runners.terminal"]
+
+
+def measure(module: str) -> dict[str, int]:
+    """Import the module in a fresh interpreter.
+
+    Returns:
+        Cumulative import time of every imported module, us.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda timings: timings[module])
+        total_ms = best[module] / 1000
+        print(f"{module}: {total_ms:.0f} ms (best of {args.repeat})")
+        top = sorted(best.items(), key=lambda item: item[1], reverse=True)[1 : args.top + 1]
+        for name, cumulative in top:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            print(f"  regression: {total_ms:.0f} ms > {args.max_ms:.0f} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
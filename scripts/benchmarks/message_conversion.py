@@ -0,0 +1,77 @@
+"""Micro-benchmark of the history conversion to the provider formats.
+
+Simulates the tool loop: the same history is converted on every round. Usage:
+
+    python -m scripts.benchmarks.message_conversion [--messages 300] [--rounds 20]
+"""
+
+import argparse
+import json
+import time
+from typing import Callable
+
+from chibi.models import FunctionSchema, Message, ToolSchema
+from chibi.utils.conversion import message_conversion_cache
+
+FORMATS: dict[str, Callable[[Message], object]] = {
+    "openai": Message.to_openai,
+    "anthropic": Message.to_anthropic,
+    "google": Message.to_google,
+    "mistral": Message.to_mistral,
+}
+UNCACHED_FORMATS: dict[str, Callable[[Message], object]] = {
+    "openai": Message._to_openai,
+    "anthropic": Message._to_anthropic,
+    "google": Message._to_google,
+    "mistral": Message._to_mistral,
+}
+
+
+def build_history(size: int) -> list[Message]:
+    """Build a conversation of `size` messages: user questions, tool calls with their results and answers."""
+    messages: list[Message] = []
+    while len(messages) < size:
+        i = len(messages)
+        arguments = json.dumps({"path": f"src/module_{i}.py", "pattern": "TODO", "recursive": True})
+        messages += [
+            Message(role="user", content=f"Find the TODOs in module {i}, please."),
+            Message(
+                role="assistant",
+                content="Let me check.",
+                tool_calls=[ToolSchema(id=f"call-{i}", function=FunctionSchema(name="grep", arguments=arguments))],
+            ),
+            Message(role="tool", content=json.dumps({"matches": ["TODO: refactor"] * 20}), tool_call_id=f"call-{i}"),
+            Message(role="assistant", content=f"Module {i} has 20 TODOs, all about refactoring."),
+        ]
+    return messages[:size]
+
+
+def measure(history: list[Message], convert: Callable[[Message], object], rounds: int, repeat: int = 5) -> float:
+    """Best of `repeat` runs, ms per round."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for message in history:
+                convert(message)
+        timings.append((time.perf_counter() - started) / rounds * 1000)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    history = build_history(args.messages)
+    print(f"{args.messages} messages, {args.rounds} rounds, ms per round:")
+    for name, convert in FORMATS.items():
+        message_conversion_cache.clear()
+        uncached = measure(history, UNCACHED_FORMATS[name], rounds=args.rounds)
+        cached = measure(history, convert, rounds=args.rounds)
+        print(f"  {name:<10} uncached {uncached:8.2f}   cached {cached:8.2f}   x{uncached / cached:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
-from typing import AsyncIterator, Generator, Iterable
+import asyncio
+import json
+from typing import Any, AsyncIterator, Generator, Iterable
 from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
+from telegram._utils.defaultvalue import DEFAULT_NONE
+from telegram._utils.types import ODVInput
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Chibi", "username": "chibi_bot"}
 
 
 class AsyncBytesIterator:
@@ -67,6 +74,45 @@ class MockResponse:
         return self._payload
 
 
+class FakeBotAPI(BaseRequest):
+    """Bot API recording the called methods and their parameters, answering after a fixed network delay."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: list[tuple[str, dict]] = []
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> float:
+        return 5.0
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((api_method, params))
+        result: Any = True
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method == "sendMessage":
+            await asyncio.sleep(self.latency)
+            result = {"message_id": 1, "date": 0, "chat": {"id": params["chat_id"], "type": "private"}, "text": "ok"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
 class RestApiFriendlyMock:
     def __init__(self, token: str) -> None:
         self.token = token
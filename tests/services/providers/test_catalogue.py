@@ -0,0 +1,91 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from chibi.schemas.app import ModelChangeSchema
+from chibi.services.providers.catalogue import REFRESH_AHEAD_RATIO, ModelCatalogue
+
+
+def _provider(name: str, token: str, models: list[str]) -> MagicMock:
+    provider = MagicMock()
+    provider.name = name
+    provider.token = token
+    provider.get_available_models = AsyncMock(
+        return_value=[ModelChangeSchema(provider=name, name=model, image_generation=False) for model in models]
+    )
+    return provider
+
+
+@pytest.fixture
+def catalogue():
+    catalogue = ModelCatalogue()
+    catalogue.invalidate()
+    yield catalogue
+    catalogue.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_users_sharing_the_key_share_the_entry(catalogue):
+    first = _provider("OpenAI", "shared-key", ["gpt-5"])
+    second = _provider("OpenAI", "shared-key", ["gpt-5"])
+    other_key = _provider("OpenAI", "other-key", ["gpt-5-mini"])
+
+    await asyncio.gather(
+        catalogue.get_models([first]),
+        catalogue.get_models([second]),
+        catalogue.get_models([other_key]),
+    )
+
+    assert first.get_available_models.await_count + second.get_available_models.await_count == 1
+    assert other_key.get_available_models.await_count == 1
+    assert [model.name for model in await catalogue.get_models([second, other_key])] == ["gpt-5", "gpt-5-mini"]
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_revalidated(catalogue):
+    provider = _provider("Anthropic", "key", ["claude-old"])
+    await catalogue.get_provider_models(provider)
+
+    key = catalogue._get_key(provider=provider, image_generation=False)
+    catalogue._entries[key].fetched_at = time.time() - catalogue._entries[key].ttl * REFRESH_AHEAD_RATIO - 1
+    provider.get_available_models.return_value = [
+        ModelChangeSchema(provider="Anthropic", name="claude-new", image_generation=False)
+    ]
+
+    assert [model.name for model in await catalogue.get_provider_models(provider)] == ["claude-old"]
+    await asyncio.sleep(0.01)
+    assert [model.name for model in await catalogue.get_provider_models(provider)] == ["claude-new"]
+    assert provider.get_available_models.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_last_known_models(catalogue):
+    provider = _provider("Gemini", "key", ["gemini-pro"])
+    await catalogue.get_provider_models(provider)
+
+    key = catalogue._get_key(provider=provider, image_generation=False)
+    catalogue._entries[key].fetched_at = 0
+    provider.get_available_models.return_value = []
+
+    assert [model.name for model in await catalogue.get_provider_models(provider)] == ["gemini-pro"]
+
+
+@pytest.mark.asyncio
+async def test_catalogue_is_persisted_to_redis(catalogue):
+    from fakeredis import FakeAsyncRedis
+
+    catalogue._redis = FakeAsyncRedis()
+    try:
+        with patch("chibi.services.providers.catalogue.application_settings.redis", "redis://localhost:6379/0"):
+            provider = _provider("Mistral", "key", ["mistral-large"])
+            await catalogue.get_provider_models(provider)
+
+            # A fresh process (or another replica) starts warm.
+            catalogue.invalidate()
+            restarted = _provider("Mistral", "key", [])
+            assert [model.name for model in await catalogue.get_provider_models(restarted)] == ["mistral-large"]
+            restarted.get_available_models.assert_not_awaited()
+    finally:
+        catalogue._redis = None
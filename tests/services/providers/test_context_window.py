@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import pytest
+
+from chibi.models import FunctionSchema, Message, ToolSchema
+from chibi.services.providers.context_window import (
+    ModelBudget,
+    fit_messages,
+    get_model_budget,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_reserve():
+    with patch("chibi.services.providers.context_window.gpt_settings.context_reserve_tokens", 0):
+        yield
+
+
+def _turn(index: int, words: int = 100, tool_result_words: int = 0, pinned: bool = False) -> list[Message]:
+    messages = [Message(role="user", content="question " * words, pinned=pinned)]
+    if tool_result_words:
+        tool_call = ToolSchema(id=f"call_{index}", function=FunctionSchema(name="read_file", arguments="{}"))
+        messages.append(Message(role="assistant", content="", tool_calls=[tool_call]))
+        messages.append(Message(role="tool", content="data " * tool_result_words, tool_call_id=f"call_{index}"))
+    messages.append(Message(role="assistant", content="answer " * words, pinned=pinned))
+    return messages
+
+
+def test_model_budgets():
+    assert (budget := get_model_budget("gpt-4o-mini")) is not None and budget.context_window == 128_000
+    assert (budget := get_model_budget("claude-sonnet-4-5")) is not None and budget.context_window == 200_000
+    assert get_model_budget("llama-3-8b-instruct") is None
+
+    with patch(
+        "chibi.services.providers.context_window.gpt_settings.context_budgets_raw", "llama=8192:1024,gpt-4o=64000"
+    ):
+        assert get_model_budget("llama-3-8b-instruct") == ModelBudget(context_window=8192, max_output=1024)
+        assert (budget := get_model_budget("gpt-4o-mini")) is not None and budget.context_window == 64000
+
+
+def test_fitting_conversation_is_not_changed():
+    messages = _turn(0) + _turn(1)
+    assert fit_messages(messages, budget=ModelBudget(context_window=100_000, max_output=0)) is messages
+
+
+def test_oldest_turns_are_dropped_keeping_tool_pairs_and_pinned_messages():
+    messages = (
+        _turn(0, pinned=True)
+        + _turn(1, tool_result_words=50)
+        + _turn(2)
+        + _turn(3)
+        + [Message(role="user", content="new question")]
+    )
+
+    fitted = fit_messages(messages, budget=ModelBudget(context_window=700, max_output=0))
+
+    assert sum(message.estimate_tokens for message in fitted) <= 700
+    assert fitted[:2] == messages[:2]  # pinned
+    assert fitted[-1] == messages[-1]
+    assert fitted[2].role == "user"
+    tool_call_ids = {tool.id for message in fitted for tool in message.tool_calls or []}
+    assert {message.tool_call_id for message in fitted if message.role == "tool"} == tool_call_ids
+
+
+def test_large_old_tool_results_are_compacted_before_dropping_turns():
+    messages = _turn(0, words=10, tool_result_words=3000) + _turn(1, words=10) + _turn(2, words=10)
+    original_content = messages[2].content
+
+    fitted = fit_messages(messages, budget=ModelBudget(context_window=1000, max_output=0))
+
+    assert len(fitted) == len(messages)
+    assert fitted[2].tool_call_id == "call_0"
+    assert "was trimmed" in fitted[2].content
+    assert messages[2].content == original_content
+
+    # The compacted copy is the same on every request.
+    again = fit_messages(messages, budget=ModelBudget(context_window=1000, max_output=0))
+    assert again[2].id == fitted[2].id != messages[2].id
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from chibi.services.providers.hedging import claim_hedged_request, get_hedge_delay, get_hedged_chat_response
+from chibi.services.providers.latency import LatencyRegistry
+
+
+class FakeProvider:
+    def __init__(self, name: str, delay: float, calls_tools: bool = False, fail: bool = False) -> None:
+        self.name = name
+        self.delay = delay
+        self.calls_tools = calls_tools
+        self.fail = fail
+        self.cancelled = False
+        self.side_effects = 0
+
+    async def get_chat_response(self, model: str, **kwargs: Any) -> str:
+        try:
+            if self.calls_tools:
+                await asyncio.sleep(self.delay / 2)
+                claim_hedged_request()
+                self.side_effects += 1
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return f"{self.name}:{model}"
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay():
+    with patch("chibi.services.providers.hedging.gpt_settings.hedge_default_delay", 0.05):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    primary, fallback = FakeProvider("primary", delay=0.01), FakeProvider("fallback", delay=0.01)
+    result = await get_hedged_chat_response(primary, "m1", fallback, "m2")  # type: ignore[arg-type]
+    assert result == "primary:m1"
+    assert not fallback.cancelled and fallback.side_effects == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_loses_to_fallback():
+    primary, fallback = FakeProvider("primary", delay=1), FakeProvider("fallback", delay=0.01)
+    result = await get_hedged_chat_response(primary, "m1", fallback, "m2")  # type: ignore[arg-type]
+    await asyncio.sleep(0)
+    assert result == "fallback:m2"
+    assert primary.cancelled
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_are_never_duplicated():
+    # Both contenders want to call tools: the first one to claim wins, the other is cancelled before its tools run.
+    primary = FakeProvider("primary", delay=0.2, calls_tools=True)
+    fallback = FakeProvider("fallback", delay=0.02, calls_tools=True)
+    result = await get_hedged_chat_response(primary, "m1", fallback, "m2")  # type: ignore[arg-type]
+    await asyncio.sleep(0)
+    assert result == "fallback:m2"
+    assert primary.side_effects + fallback.side_effects == 1
+    assert primary.cancelled
+
+
+@pytest.mark.asyncio
+async def test_failed_contender_falls_back_to_the_other():
+    primary = FakeProvider("primary", delay=0.1, fail=True)
+    fallback = FakeProvider("fallback", delay=0.2)
+    assert await get_hedged_chat_response(primary, "m1", fallback, "m2") == "fallback:m2"  # type: ignore[arg-type]
+
+    fallback.fail = True
+    with pytest.raises(RuntimeError, match="primary failed"):
+        await get_hedged_chat_response(primary, "m1", fallback, "m2")  # type: ignore[arg-type]
+
+
+def test_hedge_delay_follows_observed_p95():
+    registry = LatencyRegistry()
+    assert get_hedge_delay(provider="hedge-test", model="m") == 0.05
+
+    for latency in range(1, 101):
+        registry.record(provider="hedge-test", model="m", seconds=float(latency))
+    assert get_hedge_delay(provider="hedge-test", model="m") == 95.0
+
+
+def test_claim_outside_of_hedged_request_is_noop():
+    claim_hedged_request()
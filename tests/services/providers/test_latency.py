@@ -0,0 +1,97 @@
+import asyncio
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from chibi.services.providers.latency import LATENCY_FILE_NAME, LatencyRegistry
+from chibi.services.providers.openai import OpenAI
+from chibi.utils.app import SingletonMeta
+
+
+@pytest.fixture
+def registry():
+    SingletonMeta._instances.pop(LatencyRegistry, None)
+    yield LatencyRegistry()
+    SingletonMeta._instances.pop(LatencyRegistry, None)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(delay: float) -> None:
+        return None
+
+    monkeypatch.setattr("chibi.services.providers.resilience.asyncio.sleep", sleep)
+
+
+def test_timeout_is_default_until_enough_samples(registry: LatencyRegistry):
+    for _ in range(5):
+        registry.record(provider="OpenAI", model="gpt-5-nano", seconds=1.0)
+    with patch("chibi.services.providers.latency.gpt_settings.adaptive_timeout_min_samples", 10):
+        assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180) == 180
+
+
+def test_timeout_follows_p99_within_bounds(registry: LatencyRegistry):
+    for seconds in [5.0] * 19 + [15.0]:
+        registry.record(provider="OpenAI", model="gpt-5-nano", seconds=seconds)
+    registry.record(provider="OpenAI", model="o3", seconds=120.0)
+
+    with (
+        patch("chibi.services.providers.latency.gpt_settings.adaptive_timeout_min_samples", 1),
+        patch("chibi.services.providers.latency.gpt_settings.adaptive_timeout_factor", 2.0),
+        patch("chibi.services.providers.latency.gpt_settings.adaptive_timeout_min", 20.0),
+    ):
+        assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180) == 30.0
+        assert registry.get_timeout(provider="OpenAI", model="o3", default=180) == 180
+        assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180, operation="tts") == 180
+
+        with patch("chibi.services.providers.latency.gpt_settings.adaptive_timeout_min", 60.0):
+            assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180) == 60.0
+
+        with patch("chibi.services.providers.latency.gpt_settings.adaptive_timeouts", False):
+            assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180) == 180
+
+
+def test_timeout_overrides(registry: LatencyRegistry):
+    with patch("chibi.services.providers.latency.gpt_settings.timeout_overrides_raw", "o3=600, nano:chat=15"):
+        assert registry.get_timeout(provider="OpenAI", model="o3-pro", default=180) == 600
+        assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180) == 15
+        assert registry.get_timeout(provider="OpenAI", model="gpt-5-nano", default=180, operation="tts") == 180
+
+
+@pytest.mark.asyncio
+async def test_histograms_survive_restart(registry: LatencyRegistry, tmp_path: Path):
+    for seconds in (1.0, 2.0, 3.0):
+        registry.record(provider="OpenAI", model="gpt-5-nano", seconds=seconds)
+
+    with patch("chibi.services.providers.latency.application_settings.local_data_path", str(tmp_path)):
+        await registry.persist()
+        assert json.loads((tmp_path / LATENCY_FILE_NAME).read_text())[0]["samples"] == [1.0, 2.0, 3.0]
+
+        SingletonMeta._instances.pop(LatencyRegistry, None)
+        restarted = LatencyRegistry()
+        restarted.record(provider="OpenAI", model="gpt-5-nano", seconds=4.0)
+        await restarted.load()
+
+    assert restarted.get(provider="OpenAI", model="gpt-5-nano").samples == [1.0, 2.0, 3.0, 4.0]
+
+
+@pytest.mark.asyncio
+async def test_stuck_request_fails_fast_and_is_retried(registry: LatencyRegistry):
+    provider = OpenAI(token="latency-test-token")
+    attempts = 0
+
+    async def request() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            await asyncio.Event().wait()
+        return "answer"
+
+    with patch("chibi.services.providers.latency.gpt_settings.timeout_overrides_raw", "stuck-model=0.05"):
+        assert await provider._call_resilient(request, model="stuck-model") == "answer"
+
+    assert attempts == 2
+    # The timed out attempt is recorded too, so the adaptive timeout grows if the model gets slower.
+    assert registry.get(provider=provider.name, model="stuck-model").count == 2
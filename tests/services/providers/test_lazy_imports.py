@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from chibi.services.providers.provider import PROVIDER_MODULES
+
+SCRIPT = """
+import json, sys
+from chibi.services.providers import RegisteredProviders
+before = sorted(RegisteredProviders.all)
+sdk_loaded = "google.genai" in sys.modules or "mistralai" in sys.modules
+from chibi.services.providers import MistralAI
+RegisteredProviders.load(all_providers=True)
+print(json.dumps({"before": before, "sdk_loaded": sdk_loaded, "after": sorted(RegisteredProviders.all)}))
+"""
+
+
+def test_providers_are_loaded_on_demand():
+    env = {key: value for key, value in os.environ.items() if not key.endswith(("_KEY", "_API_KEY"))}
+    env["PUBLIC_MODE"] = "false"
+
+    result = subprocess.run([sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True, env=env)
+    output = json.loads(result.stdout.splitlines()[-1])
+
+    assert output["before"] == []
+    assert not output["sdk_loaded"]
+    assert output["after"] == sorted(name.lower() for name in PROVIDER_MODULES)
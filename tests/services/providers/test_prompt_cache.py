@@ -0,0 +1,241 @@
+"""Tests for the Anthropic cache breakpoint planner.
+
+`test_cache_read_tokens_per_round` is a small benchmark: it replays a recorded tool-loop conversation against a
+fake Anthropic API emulating prompt caching (prefix match at breakpoints with a 20-blocks lookback) and reports
+the `cache_read_input_tokens` per round. Run with `pytest -s` to see the table.
+"""
+
+import hashlib
+import json
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from anthropic.types import Message as AnthropicMessage
+from anthropic.types import MessageParam, TextBlock, TextBlockParam, ToolParam, ToolUseBlock, Usage
+
+from chibi.models import Message, User
+from chibi.services.providers.anthropic import Anthropic
+from chibi.services.providers.prompt_cache import (
+    ANTHROPIC_MAX_CACHE_BREAKPOINTS,
+    AnthropicCacheBreakpointPlanner,
+    estimate_payload_tokens,
+)
+from chibi.services.providers.tools.schemas import ToolResponseSchema
+from chibi.services.providers.tools.tool import ToolDefinitionsSnapshot
+
+LOOKBACK_BLOCKS = 20
+TOOL_ROUNDS = 10
+
+
+def _tool(name: str, size: int = 2000) -> ToolParam:
+    return ToolParam(
+        name=name,
+        description="x" * size,
+        input_schema={"type": "object", "properties": {}, "required": []},
+    )
+
+
+def _text_message(role: str, text: str) -> MessageParam:
+    return MessageParam(role=role, content=[TextBlockParam(type="text", text=text)])  # type: ignore[typeddict-item]
+
+
+def _tool_result_message(tool_use_id: str, size: int = 2000) -> MessageParam:
+    return MessageParam(
+        role="user",
+        content=[{"type": "tool_result", "tool_use_id": tool_use_id, "content": "r" * size}],
+    )
+
+
+class PromptCachingSimulator:
+    """Emulates Anthropic prompt caching to count cache reads for a request."""
+
+    def __init__(self) -> None:
+        self.cache: set[str] = set()
+
+    @staticmethod
+    def _flatten(kwargs: dict[str, Any]) -> list[dict[str, Any]]:
+        blocks: list[dict[str, Any]] = []
+        blocks.extend(dict(tool) for tool in kwargs.get("tools") or [])
+        blocks.extend(dict(block) for block in kwargs.get("system") or [])
+        for message in kwargs["messages"]:
+            for block in message["content"]:
+                blocks.append({"role": message["role"], **block})
+        return blocks
+
+    def process(self, kwargs: dict[str, Any]) -> Usage:
+        blocks = self._flatten(kwargs)
+        prefix_hashes: list[str] = []
+        prefix_tokens: list[int] = []
+        digest = hashlib.sha256()
+        tokens = 0
+        for block in blocks:
+            payload = {k: v for k, v in block.items() if k != "cache_control"}
+            digest.update(json.dumps(payload, sort_keys=True, default=str).encode())
+            tokens += estimate_payload_tokens(payload)
+            prefix_hashes.append(digest.copy().hexdigest())
+            prefix_tokens.append(tokens)
+
+        breakpoints = [index for index, block in enumerate(blocks) if block.get("cache_control")]
+        assert len(breakpoints) <= ANTHROPIC_MAX_CACHE_BREAKPOINTS
+
+        cache_read = 0
+        for breakpoint in breakpoints:
+            for index in range(breakpoint, max(breakpoint - LOOKBACK_BLOCKS, -1), -1):
+                if prefix_hashes[index] in self.cache:
+                    cache_read = max(cache_read, prefix_tokens[index])
+                    break
+
+        cache_creation = 0
+        if breakpoints:
+            cache_creation = max(prefix_tokens[breakpoints[-1]] - cache_read, 0)
+            for breakpoint in breakpoints:
+                self.cache.add(prefix_hashes[breakpoint])
+
+        return Usage(
+            input_tokens=tokens - cache_read - cache_creation,
+            output_tokens=50,
+            cache_read_input_tokens=cache_read,
+            cache_creation_input_tokens=cache_creation,
+        )
+
+
+def test_small_prompt_gets_no_breakpoints():
+    planner = AnthropicCacheBreakpointPlanner(min_cacheable_tokens=1024)
+    plan = planner.plan(
+        tools=[_tool("t", size=10)],
+        system=[TextBlockParam(type="text", text="short")],
+        messages=[_text_message("user", "hi")],
+    )
+    assert plan.breakpoints_count == 0
+
+
+def test_all_four_breakpoints_are_used_in_tool_loop():
+    planner = AnthropicCacheBreakpointPlanner(min_cacheable_tokens=1024)
+    messages = [
+        _text_message("user", "a" * 4000),
+        _text_message("assistant", "b" * 4000),
+        _text_message("user", "new prompt"),
+        _text_message("assistant", "calling a tool"),
+        _tool_result_message("call_1", size=8000),
+    ]
+    tools, system, plan = planner.apply(
+        tools=[_tool("a", size=6000), _tool("b", size=6000)],
+        system=[TextBlockParam(type="text", text="s" * 4000)],
+        messages=messages,
+    )
+
+    assert plan.breakpoints_count == ANTHROPIC_MAX_CACHE_BREAKPOINTS
+    assert plan.tools and plan.system
+    assert plan.message_indexes == [1, 4]
+    assert tools[-1].get("cache_control") == {"type": "ephemeral"}
+    assert system[-1].get("cache_control") == {"type": "ephemeral"}
+    assert messages[1]["content"][-1]["cache_control"] == {"type": "ephemeral"}  # type: ignore[index]
+    assert messages[4]["content"][-1]["cache_control"] == {"type": "ephemeral"}  # type: ignore[index]
+
+
+def test_apply_does_not_mutate_shared_tool_definitions_and_strips_stale_markers():
+    planner = AnthropicCacheBreakpointPlanner(min_cacheable_tokens=100)
+    shared_tools = [_tool("a", size=4000)]
+    messages = [_text_message("user", "prompt"), _tool_result_message("call_1", size=4000)]
+    planner.apply(tools=shared_tools, system=[], messages=messages)
+
+    assert "cache_control" not in shared_tools[0]
+
+    messages.append(_text_message("assistant", "next call"))
+    messages.append(_tool_result_message("call_2", size=4000))
+    _, _, plan = planner.apply(tools=shared_tools, system=[], messages=messages)
+
+    marked = [index for index, msg in enumerate(messages) if "cache_control" in msg["content"][-1]]  # type: ignore
+    assert marked == plan.message_indexes == [3]
+
+
+def test_haiku_models_require_longer_prefix():
+    assert AnthropicCacheBreakpointPlanner.for_model("claude-haiku-4-5").min_cacheable_tokens == 2048
+    assert AnthropicCacheBreakpointPlanner.for_model("claude-sonnet-4-5").min_cacheable_tokens == 1024
+
+
+@pytest.mark.asyncio
+async def test_cache_read_tokens_per_round():
+    """Replay a recorded 10-step tool loop and check that every round reads the previous one from the cache."""
+    simulator = PromptCachingSimulator()
+    usages: list[Usage] = []
+    round_number = 0
+
+    async def create(**kwargs: Any) -> AnthropicMessage:
+        nonlocal round_number
+        round_number += 1
+        usage = simulator.process(kwargs)
+        usages.append(usage)
+        if round_number <= TOOL_ROUNDS:
+            content: list[Any] = [
+                TextBlock(type="text", text=f"Step {round_number}: reading the next file."),
+                ToolUseBlock(type="tool_use", id=f"call_{round_number}", name="read_file", input={"n": round_number}),
+            ]
+        else:
+            content = [TextBlock(type="text", text="Done.")]
+        return AnthropicMessage(
+            id=f"msg_{round_number}",
+            type="message",
+            role="assistant",
+            model="claude-sonnet-4-5",
+            content=content,
+            stop_reason="end_turn",
+            usage=usage,
+        )
+
+    provider = Anthropic(token="test-token")
+    client = MagicMock()
+    client.messages.create = create
+    client.with_options.return_value = client
+    provider.client = client
+
+    history = [
+        Message(role="user", content="Let's refactor the storage layer." * 40),
+        Message(role="assistant", content="Sure, here is the plan..." * 120),
+        Message(role="user", content="Start with the redis backend."),
+    ]
+    tool_result = ToolResponseSchema(tool_name="read_file", status="ok", result="line of code\n" * 400)
+    tools = [_tool(f"tool_{i}", size=1500) for i in range(20)]
+
+    with (
+        patch(
+            "chibi.services.providers.provider.prepare_system_prompt",
+            AsyncMock(return_value="You are a helpful assistant. " * 200),
+        ),
+        patch.object(
+            Anthropic,
+            "tools_snapshot",
+            new=ToolDefinitionsSnapshot(version=0, definitions=tools, serialized=json.dumps(tools)),
+        ),
+        patch.object(Anthropic, "call_functions", AsyncMock(return_value=[tool_result])),
+    ):
+        response, new_messages = await provider.get_chat_response(
+            messages=history, user=User(id=1), model="claude-sonnet-4-5"
+        )
+
+    assert response.answer == "Done."
+    assert len(usages) == TOOL_ROUNDS + 1
+
+    print("\nround | input | cache_creation | cache_read")
+    for index, usage in enumerate(usages, start=1):
+        print(
+            f"{index:>5} | {usage.input_tokens:>5} | {usage.cache_creation_input_tokens:>14} | "
+            f"{usage.cache_read_input_tokens:>10}"
+        )
+
+    # Every round after the first one reads the whole previous request from the cache,
+    # so only the freshly appended tool round is billed at the full price.
+    for previous, current in zip(usages, usages[1:]):
+        previous_prompt = (
+            previous.input_tokens
+            + (previous.cache_read_input_tokens or 0)
+            + (previous.cache_creation_input_tokens or 0)
+        )
+        assert (current.cache_read_input_tokens or 0) >= previous_prompt * 0.9
+
+    total_prompt = sum(
+        u.input_tokens + (u.cache_read_input_tokens or 0) + (u.cache_creation_input_tokens or 0) for u in usages
+    )
+    total_read = sum(u.cache_read_input_tokens or 0 for u in usages)
+    assert total_read / total_prompt > 0.8
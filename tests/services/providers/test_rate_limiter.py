@@ -0,0 +1,186 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from chibi.services.providers.rate_limiter import (
+    AdaptiveRateLimiter,
+    RateLimiterRegistry,
+    _parse_reset,
+    get_retry_after_from_error,
+    is_rate_limit_error,
+    parse_duration,
+    parse_retry_after,
+)
+
+
+def _rate_limit_error(headers: dict[str, str]) -> RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return RateLimitError("Too Many Requests", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("1s", 1.0), ("6m0s", 360.0), ("20ms", 0.02), ("1h2m3.5s", 3723.5), ("12", 12.0), ("soon", None)],
+)
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "10"}) == 1.5
+    assert parse_retry_after({"retry-after": "7"}) == 7.0
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < (parse_retry_after({"retry-after": http_date}) or 0) <= 30
+    assert parse_retry_after({}) is None
+
+
+def test_parse_reset():
+    assert _parse_reset("0") == 0.0
+    assert _parse_reset("1m30s") == 90.0
+    assert 15 < (_parse_reset((datetime.now(timezone.utc) + timedelta(seconds=20)).isoformat()) or 0) <= 20
+    assert _parse_reset("soon") is None
+
+
+def test_sdk_rate_limit_error_is_recognized():
+    error = _rate_limit_error({"retry-after": "3"})
+    assert is_rate_limit_error(error)
+    assert get_retry_after_from_error(error) == 3.0
+    assert not is_rate_limit_error(ValueError("boom"))
+
+
+def test_limits_are_learned_from_headers():
+    limiter = AdaptiveRateLimiter(name="test")
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-remaining-requests": "499",
+            "x-ratelimit-limit-tokens": "30000",
+            "x-ratelimit-remaining-tokens": "29000",
+        }
+    )
+    assert limiter.requests.capacity == 500
+    assert limiter.tokens.capacity == 30000
+    assert limiter.tokens.level == pytest.approx(29000, abs=5)
+
+    limiter.update_from_headers(
+        {
+            "anthropic-ratelimit-requests-limit": "50",
+            "anthropic-ratelimit-requests-remaining": "0",
+            "anthropic-ratelimit-requests-reset": (datetime.now(timezone.utc) + timedelta(seconds=20)).isoformat(),
+        }
+    )
+    assert limiter.requests.capacity == 50
+    assert limiter._time_until_ready(tokens=0) == pytest.approx(20, abs=1)
+
+
+def test_aimd_concurrency_control():
+    limiter = AdaptiveRateLimiter(name="test", max_concurrency=8)
+    limiter.on_rate_limited(retry_after=0)
+    limiter.on_rate_limited(retry_after=0)
+    assert limiter.concurrency_limit == 2
+
+    async def succeed() -> None:
+        for _ in range(4):
+            async with limiter.slot():
+                pass
+
+    asyncio.run(succeed())
+    assert 2 < limiter.concurrency_limit < 4
+    assert limiter.rate_limited_count == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_per_minute_bucket_delays_callers():
+    limiter = AdaptiveRateLimiter(name="test", requests_per_minute=600)  # 10 requests per second
+    limiter.requests.level = 1
+
+    started_at = time.monotonic()
+    for _ in range(3):
+        async with limiter.slot():
+            pass
+    assert time.monotonic() - started_at >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_callers_are_served_in_fifo_order_without_failing():
+    limiter = AdaptiveRateLimiter(name="test", max_concurrency=1)
+    order: list[int] = []
+    max_queue_depth = 0
+
+    async def call(number: int) -> None:
+        nonlocal max_queue_depth
+        async with limiter.slot():
+            max_queue_depth = max(max_queue_depth, limiter.queue_depth)
+            order.append(number)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call(number) for number in range(5)))
+
+    assert order == [0, 1, 2, 3, 4]
+    assert max_queue_depth >= 3
+    assert limiter.stats()["queue_depth"] == 0
+    assert limiter.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_provider_requeues_rate_limited_request():
+    from chibi.services.providers.openai import OpenAI
+
+    provider = OpenAI(token="rate-limiter-test-token")
+    limiter = provider.rate_limiter
+    attempts = 0
+
+    async def request() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise _rate_limit_error({"retry-after-ms": "10"})
+        return "ok"
+
+    assert await provider._call_resilient(request, model="gpt-test") == "ok"
+    assert attempts == 3
+    assert limiter.rate_limited_count == 2
+    assert limiter.in_flight == 0
+
+
+def test_registry_keeps_one_limiter_per_provider_and_key():
+    registry = RateLimiterRegistry()
+    first = registry.get(provider_name="OpenAI", api_key="key-1")
+    assert registry.get(provider_name="OpenAI", api_key="key-1") is first
+    assert registry.get(provider_name="OpenAI", api_key="key-2") is not first
+    assert registry.get(provider_name="Anthropic", api_key="key-1") is not first
+    assert "key-1" not in first.name
+
+
+@pytest.mark.asyncio
+async def test_response_hook_updates_limiter():
+    from chibi.services.providers.openai import OpenAI
+
+    provider = OpenAI(token="hook-test-token")
+    response = MagicMock(headers={"x-ratelimit-limit-requests": "42"}, status_code=200)
+    for hook in provider.httpx_event_hooks["response"]:
+        await hook(response)
+    assert provider.rate_limiter.requests.capacity == 42
+
+
+@pytest.mark.asyncio
+async def test_gemini_sdk_client_uses_hooked_httpx_client():
+    from chibi.services.providers.gemini_native import Gemini
+
+    provider = Gemini(token="gemini-hook-test-token")
+    pager = MagicMock()
+    pager.__aiter__.return_value = []
+    with patch("chibi.services.providers.gemini_native.Client") as client_cls:
+        client_cls.return_value.aio.__aenter__.return_value.models.list = AsyncMock(return_value=pager)
+        await provider.get_available_models()
+
+    http_options = client_cls.call_args.kwargs["http_options"]
+    response_hooks = http_options.httpx_async_client.event_hooks["response"]
+    assert [hook.__func__ for hook in response_hooks] == [Gemini._learn_rate_limits]
@@ -0,0 +1,205 @@
+import asyncio
+
+import httpx
+import pytest
+from anthropic import InternalServerError
+from openai import APITimeoutError, AuthenticationError, RateLimitError
+
+from chibi.exceptions import NoResponseError, NotAuthorizedError, ServiceRateLimitError, ServiceUnavailableError
+from chibi.services.providers.openai import OpenAI
+from chibi.services.providers.resilience import (
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitState,
+    ErrorClass,
+    RetryPolicy,
+    classify_error,
+)
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat")
+
+
+def _response(status_code: int) -> httpx.Response:
+    return httpx.Response(status_code, request=REQUEST)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(delay: float) -> None:
+        return None
+
+    monkeypatch.setattr("chibi.services.providers.resilience.asyncio.sleep", sleep)
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (RateLimitError("429", response=_response(429), body=None), ErrorClass.RATE_LIMIT),
+        (APITimeoutError(request=REQUEST), ErrorClass.TIMEOUT),
+        (httpx.ConnectError("refused"), ErrorClass.CONNECTION),
+        (InternalServerError("overloaded", response=_response(529), body=None), ErrorClass.SERVER),
+        (AuthenticationError("401", response=_response(401), body=None), ErrorClass.FATAL),
+        (NoResponseError(), ErrorClass.EMPTY_RESPONSE),
+        (ServiceRateLimitError(), ErrorClass.RATE_LIMIT),
+        (ValueError("bug"), ErrorClass.FATAL),
+    ],
+)
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_decorrelated_jitter_stays_within_bounds():
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=10)
+    delay = None
+    for _ in range(50):
+        new_delay = policy.next_delay(delay)
+        assert 0.5 <= new_delay <= 10
+        assert new_delay <= max((delay or 0.5) * 3, 0.5)
+        delay = new_delay
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(provider="test", model="m", failure_threshold=3, recovery_timeout=0)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure(ErrorClass.TIMEOUT)
+    assert breaker.state == CircuitState.OPEN
+
+    # Recovery timeout is over: a single probe goes through, the concurrent request is rejected.
+    breaker.before_call()
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(ServiceUnavailableError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_lost_probe_is_replaced(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("chibi.services.providers.resilience.time.monotonic", lambda: now)
+    breaker = CircuitBreaker(provider="test", model="m", failure_threshold=1, recovery_timeout=30, probe_timeout=60)
+    breaker.record_failure(ErrorClass.TIMEOUT)
+
+    now += 30
+    breaker.before_call()
+    with pytest.raises(ServiceUnavailableError):
+        breaker.before_call()
+
+    # The probe has never reported back: the next request probes instead.
+    now += 60
+    breaker.before_call()
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+def test_only_the_probe_releases_the_probe(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("chibi.services.providers.resilience.time.monotonic", lambda: now)
+    breaker = CircuitBreaker(provider="test", model="m", failure_threshold=1, recovery_timeout=30, probe_timeout=60)
+    request_id = breaker.before_call()
+    assert request_id is None
+    breaker.record_failure(ErrorClass.TIMEOUT)
+
+    now += 30
+    lost_probe_id = breaker.before_call()
+    now += 60
+    probe_id = breaker.before_call()
+    assert probe_id is not None and probe_id != lost_probe_id
+
+    # The request sent before the breaker opened and the lost probe are cancelled (i.e. hedge losers).
+    breaker.record_cancelled(probe_id=request_id)
+    breaker.record_cancelled(probe_id=lost_probe_id)
+    with pytest.raises(ServiceUnavailableError):
+        breaker.before_call()
+
+    breaker.record_cancelled(probe_id=probe_id)
+    assert breaker.before_call() is not None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_circuit():
+    provider = OpenAI(token="resilience-test-token")
+    model = "resilience-cancel-test-model"
+    breaker = CircuitBreakerRegistry().get(provider=provider.name, model=model)
+    breaker.recovery_timeout = 0
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ErrorClass.TIMEOUT)
+    assert breaker.state == CircuitState.OPEN
+
+    async def cancelled_request() -> str:
+        raise asyncio.CancelledError
+
+    async def request() -> str:
+        return "ok"
+
+    with pytest.raises(asyncio.CancelledError):
+        await provider._call_resilient(cancelled_request, model=model)
+    assert await provider._call_resilient(request, model=model) == "ok"
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_client_errors_do_not_open_circuit():
+    breaker = CircuitBreaker(provider="test", model="m", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure(ErrorClass.FATAL)
+    breaker.record_failure(ErrorClass.RATE_LIMIT)
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_then_circuit_fails_fast():
+    provider = OpenAI(token="resilience-test-token")
+    model = "resilience-test-model"
+    breaker = CircuitBreakerRegistry().get(provider=provider.name, model=model)
+    breaker.failure_threshold = 2
+    calls = 0
+
+    async def request() -> str:
+        nonlocal calls
+        calls += 1
+        raise InternalServerError("boom", response=_response(503), body=None)
+
+    with pytest.raises(ServiceUnavailableError):
+        await provider._call_resilient(request, model=model)
+
+    # The breaker opened before the retry policy was exhausted, the next retry failed fast.
+    assert calls == 2
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.retries_count == 2
+
+    calls_before = calls
+    with pytest.raises(ServiceUnavailableError):
+        await provider._call_resilient(request, model=model)
+    assert calls == calls_before
+    assert breaker.rejected_count >= 1
+
+
+@pytest.mark.asyncio
+async def test_empty_responses_are_retried():
+    provider = OpenAI(token="resilience-test-token")
+    attempts = 0
+
+    async def request() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise NoResponseError()
+        return "answer"
+
+    assert await provider._call_resilient(request, model="empty-response-model") == "answer"
+    assert attempts == 3
+
+
+@pytest.mark.asyncio
+async def test_fatal_errors_are_not_retried():
+    provider = OpenAI(token="resilience-test-token")
+    attempts = 0
+
+    async def request() -> str:
+        nonlocal attempts
+        attempts += 1
+        raise AuthenticationError("401", response=_response(401), body=None)
+
+    with pytest.raises(NotAuthorizedError):
+        await provider._call_resilient(request, model="fatal-error-model")
+    assert attempts == 1
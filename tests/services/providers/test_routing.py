@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from chibi.schemas.app import ModelChangeSchema
+from chibi.services.providers.resilience import CircuitBreakerRegistry, ErrorClass
+from chibi.services.providers.routing import ModelRouter, get_model_tier, get_output_tokens, pick_model
+from chibi.utils.app import SingletonMeta
+
+
+@pytest.fixture(autouse=True)
+def fresh_registries():
+    for registry in (ModelRouter, CircuitBreakerRegistry):
+        SingletonMeta._instances.pop(registry, None)
+    yield
+    for registry in (ModelRouter, CircuitBreakerRegistry):
+        SingletonMeta._instances.pop(registry, None)
+
+
+def _model(provider: str, name: str) -> ModelChangeSchema:
+    return ModelChangeSchema(provider=provider, name=name, image_generation=False)
+
+
+@pytest.mark.parametrize(
+    "model, tier",
+    [
+        ("gpt-5-mini", "light"),
+        ("gemini-2.5-flash", "light"),
+        ("claude-haiku-4-5", "light"),
+        ("o3-mini", "light"),
+        ("claude-opus-4-1", "heavy"),
+        ("gemini-2.5-pro", "heavy"),
+        ("deepseek-reasoner", "heavy"),
+        ("claude-sonnet-4-5", "standard"),
+        ("gpt-4.1", "standard"),
+        ("grok-4-fast-reasoning", "light"),
+    ],
+)
+def test_model_tier(model: str, tier: str):
+    assert get_model_tier(model) == tier
+
+
+def test_output_tokens_are_read_from_any_sdk_response():
+    assert get_output_tokens(SimpleNamespace(usage=SimpleNamespace(completion_tokens=12))) == 12
+    assert get_output_tokens(SimpleNamespace(usage=SimpleNamespace(output_tokens=7))) == 7
+    assert get_output_tokens(SimpleNamespace(usage_metadata=SimpleNamespace(candidates_token_count=5))) == 5
+    assert get_output_tokens(object()) == 0
+
+
+def test_stats_are_recorded():
+    router = ModelRouter()
+    assert router.stats(provider="OpenAI", model="gpt-5-mini") is None
+
+    router.record_success(provider="OpenAI", model="gpt-5-mini", seconds=2.0, output_tokens=100)
+    router.record_success(provider="OpenAI", model="gpt-5-mini", seconds=1.0, output_tokens=100)
+    router.record_failure(provider="OpenAI", model="gpt-5-mini")
+
+    stats = router.stats(provider="OpenAI", model="gpt-5-mini")
+    assert stats == {"calls": 3, "p50_latency": 1.0, "tokens_per_second": 100.0, "error_rate": 0.33}
+
+
+def test_light_tasks_prefer_light_models_and_heavy_tasks_heavy_ones():
+    candidates = [
+        _model("Anthropic", "claude-opus-4-1"),
+        _model("Anthropic", "claude-sonnet-4-5"),
+        _model("Anthropic", "claude-haiku-4-5"),
+    ]
+    router = ModelRouter()
+
+    assert router.rank(candidates, task_class="light")[0].name == "claude-haiku-4-5"
+    assert router.rank(candidates, task_class="standard")[0].name == "claude-sonnet-4-5"
+    assert router.rank(candidates, task_class="heavy")[0].name == "claude-opus-4-1"
+
+    for _ in range(5):
+        router.record_success(provider="Anthropic", model="claude-haiku-4-5", seconds=2.0)
+    assert router.rank(candidates, task_class="standard")[0].name == "claude-haiku-4-5"
+
+
+def test_observed_latency_and_errors_change_the_ranking():
+    router = ModelRouter()
+    candidates = [_model("OpenAI", "gpt-5-mini"), _model("Gemini", "gemini-2.5-flash")]
+    for _ in range(5):
+        router.record_success(provider="OpenAI", model="gpt-5-mini", seconds=20.0)
+        router.record_success(provider="Gemini", model="gemini-2.5-flash", seconds=2.0)
+    assert router.rank(candidates, task_class="light")[0].name == "gemini-2.5-flash"
+
+    for _ in range(10):
+        router.record_failure(provider="Gemini", model="gemini-2.5-flash")
+    assert [model.name for model in router.rank(candidates, task_class="light")] == ["gpt-5-mini"]
+
+
+def test_models_over_the_budget_and_with_open_breaker_are_skipped():
+    router = ModelRouter()
+    candidates = [_model("OpenAI", "gpt-5-mini"), _model("Gemini", "gemini-2.5-flash")]
+    for _ in range(5):
+        router.record_success(provider="OpenAI", model="gpt-5-mini", seconds=50.0)
+    assert [model.name for model in router.rank(candidates, task_class="light", budget=30)] == ["gemini-2.5-flash"]
+
+    breaker = CircuitBreakerRegistry().get(provider="Gemini", model="gemini-2.5-flash")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ErrorClass.SERVER)
+    assert router.rank(candidates, task_class="light", budget=30) == []
+
+
+@pytest.mark.asyncio
+async def test_pick_model():
+    candidates = [_model("OpenAI", "gpt-5"), _model("OpenAI", "gpt-5-nano"), _model("OpenAI", "gpt-3.5-turbo")]
+    router = ModelRouter()
+    with patch("chibi.services.providers.tools.utils.get_models_available_to_user", AsyncMock(return_value=candidates)):
+        # No statistics yet: the caller keeps its model.
+        assert await pick_model(user_id=1, task_class="light") is None
+
+        for _ in range(3):
+            router.record_success(provider="OpenAI", model="gpt-5", seconds=5.0)
+            router.record_success(provider="OpenAI", model="gpt-5-nano", seconds=3.0)
+        picked = await pick_model(user_id=1, task_class="light")
+        assert picked is not None and picked.name == "gpt-5-nano"
+        picked = await pick_model(user_id=1, task_class="heavy")
+        assert picked is not None and picked.name == "gpt-5"
+
+        with patch("chibi.services.providers.routing.gpt_settings.model_routing", False):
+            assert await pick_model(user_id=1, task_class="light") is None
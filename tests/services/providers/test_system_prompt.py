@@ -0,0 +1,82 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from chibi.models import Message, User
+from chibi.services.providers.utils import prepare_system_prompt
+from chibi.services.system_prompt import invalidate_system_prompt_snapshot, system_prompt_snapshot
+from chibi.services.user import drop_tool_call_history, reset_chat_history, summarize_history
+from chibi.utils.app import BuiltinSkillsIndex, SingletonMeta
+
+
+@pytest.fixture(autouse=True)
+def skills_dir(tmp_path: Path):
+    (tmp_path / "web.md").write_text("# Browse the web\nDetails")
+    SingletonMeta._instances.pop(BuiltinSkillsIndex, None)
+    with patch("chibi.utils.app.application_settings.skills_dir", str(tmp_path)):
+        yield tmp_path
+    SingletonMeta._instances.pop(BuiltinSkillsIndex, None)
+
+
+def test_skills_index_is_reread_on_directory_change(skills_dir: Path):
+    index = BuiltinSkillsIndex()
+    assert index.get() == {"web.md": "Browse the web"}
+
+    with patch.object(BuiltinSkillsIndex, "_read_skills", wraps=BuiltinSkillsIndex._read_skills) as read_skills:
+        index.get()
+        read_skills.assert_not_called()
+
+        (skills_dir / "pdf.md").write_text("# Work with PDF")
+        stat = skills_dir.stat()
+        os.utime(skills_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert index.get() == {"web.md": "Browse the web", "pdf.md": "Work with PDF"}
+        read_skills.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_system_prompt_is_prepared_once_per_turn():
+    user = User(id=1, info="Likes cats")
+    fresh_user = User(id=1, info="Likes dogs")
+    interface = MagicMock(thread_id=0)
+
+    with (
+        patch("chibi.services.providers.utils.get_chibi_user", AsyncMock(return_value=fresh_user)) as get_user,
+        patch("chibi.services.providers.utils.get_file_storage") as get_file_storage,
+    ):
+        get_file_storage.return_value.get_available_files = AsyncMock(return_value={})
+        with system_prompt_snapshot(user=user):
+            first = await prepare_system_prompt(base_system_prompt="Be nice", user_id=1, interface=interface)
+            second = await prepare_system_prompt(base_system_prompt="Be nice", user_id=1, interface=interface)
+            get_user.assert_not_awaited()
+            assert get_file_storage.return_value.get_available_files.await_count == 1
+            assert second is first
+            assert json.loads(first)["user_info"] == "Likes cats"
+
+            invalidate_system_prompt_snapshot()
+            third = await prepare_system_prompt(base_system_prompt="Be nice", user_id=1, interface=interface)
+            assert json.loads(third)["user_info"] == "Likes dogs"
+            get_user.assert_awaited_once()
+
+        await prepare_system_prompt(base_system_prompt="Be nice", user_id=1, interface=interface)
+        assert get_user.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_history_changes_invalidate_the_snapshot():
+    user = User(id=1)
+    db = MagicMock(
+        get_or_create_user=AsyncMock(return_value=user),
+        get_conversation_messages=AsyncMock(return_value=[Message(role="user", content="Hi")]),
+        drop_messages=AsyncMock(),
+        add_message=AsyncMock(),
+    )
+    with patch("chibi.storage.database._db_provider") as db_provider:
+        db_provider.get_database = AsyncMock(return_value=db)
+        for change in (reset_chat_history, drop_tool_call_history, summarize_history):
+            with system_prompt_snapshot(user=user) as snapshot:
+                snapshot.prompts[("Be nice", 1, 0)] = "cached"
+                await change(user_id=1, thread_id=0)
+                assert not snapshot.prompts, change.__name__
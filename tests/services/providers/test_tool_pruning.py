@@ -0,0 +1,91 @@
+import json
+from unittest.mock import patch
+
+from chibi.models import FunctionSchema, Message, ToolPruningSettings, ToolSchema, User
+from chibi.services.providers.tool_pruning import ToolPruningPolicy, get_pruning_policy, prune_tool_history
+
+
+def _turn(index: int, result_size: int = 1000, arguments_size: int = 10) -> list[Message]:
+    arguments = json.dumps({"path": "x" * arguments_size})
+    tool_call = ToolSchema(id=f"call_{index}", function=FunctionSchema(name="read_file", arguments=arguments))
+    result = json.dumps({"tool_name": "read_file", "status": "ok", "result": "data" * (result_size // 4)})
+    return [
+        Message(role="user", content=f"question {index}"),
+        Message(role="assistant", content="", tool_calls=[tool_call]),
+        Message(role="tool", content=result, tool_call_id=f"call_{index}", tool_name="read_file"),
+        Message(role="assistant", content=f"answer {index}"),
+    ]
+
+
+def _is_pruned(message: Message) -> bool:
+    return "pruned" in message.content
+
+
+def test_old_turns_are_stubbed_in_steps():
+    policy = ToolPruningPolicy(keep_turns=3, max_bytes=0)
+    messages = [message for index in range(7) for message in _turn(index)]
+
+    pruned = prune_tool_history(messages=messages, policy=policy)
+
+    assert len(pruned) == len(messages)
+    tool_results = [message for message in pruned if message.role == "tool"]
+    assert [_is_pruned(message) for message in tool_results] == [True] * 3 + [False] * 4
+    assert json.loads(tool_results[0].content) == {
+        "tool_name": "read_file",
+        "status": "ok",
+        "pruned": f"the {len(messages[2].content.encode())} bytes result was dropped from the history",
+    }
+    assert tool_results[0].tool_call_id == "call_0"
+    assert tool_results[0].id == -messages[2].id
+    assert messages[2].content.startswith('{"tool_name"') and not _is_pruned(messages[2])
+
+    # One more turn does not move the boundary, so the prompt prefix stays the same.
+    more = prune_tool_history(messages=[*messages, *_turn(7)], policy=policy)
+    assert [message.content for message in more[: len(messages)]] == [message.content for message in pruned]
+
+
+def test_byte_budget_and_large_arguments():
+    policy = ToolPruningPolicy(keep_turns=2, max_bytes=2500)
+    messages = [message for index in range(5) for message in _turn(index, arguments_size=1000 if index == 0 else 10)]
+
+    pruned = prune_tool_history(messages=messages, policy=policy)
+
+    # The turn 2 is beyond the budget, and the boundary is rounded up to the step of the age boundary.
+    tool_results = [message for message in pruned if message.role == "tool"]
+    assert [_is_pruned(message) for message in tool_results] == [True, True, True, True, False]
+    tool_calls = pruned[1].tool_calls
+    assert tool_calls is not None
+    arguments = tool_calls[0].function.arguments
+    assert arguments is not None
+    assert json.loads(arguments) == {"pruned": "the 1012 bytes arguments were dropped from the history"}
+    assert tool_calls[0].id == "call_0"
+    assert pruned[5] is messages[5]
+
+    # One more turn does not move the budget boundary.
+    more = prune_tool_history(messages=[*messages, *_turn(5)], policy=policy)
+    assert [message.content for message in more[: len(messages)]] == [message.content for message in pruned]
+
+
+def test_pinned_and_latest_turn_are_kept():
+    policy = ToolPruningPolicy(keep_turns=1, max_bytes=100)
+    messages = [message for index in range(3) for message in _turn(index)]
+    messages[2].pinned = True
+
+    pruned = prune_tool_history(messages=messages, policy=policy)
+
+    assert pruned[2] is messages[2]
+    assert _is_pruned(pruned[6])
+    assert pruned[-2] is messages[-2]
+
+
+def test_policy_thread_overrides():
+    user = User(id=1, thread_tool_pruning={5: ToolPruningSettings(keep_turns=2), 6: ToolPruningSettings(enabled=False)})
+
+    with patch("chibi.services.providers.tool_pruning.gpt_settings.tool_history_pruning", True):
+        assert get_pruning_policy(user=user, thread_id=0) == ToolPruningPolicy(keep_turns=8, max_bytes=262144)
+        assert get_pruning_policy(user=user, thread_id=5) == ToolPruningPolicy(keep_turns=2, max_bytes=262144)
+        assert get_pruning_policy(user=user, thread_id=6) is None
+
+    with patch("chibi.services.providers.tool_pruning.gpt_settings.tool_history_pruning", False):
+        assert get_pruning_policy(user=user, thread_id=0) is None
+        assert get_pruning_policy(user=user, thread_id=5) is not None
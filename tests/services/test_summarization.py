@@ -0,0 +1,197 @@
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from chibi.models import Message
+from chibi.schemas.app import ChatResponseSchema
+from chibi.services.summarization import (
+    MERGE_SUMMARIES_PROMPT,
+    HistorySummarizer,
+    render_history,
+    split_into_chunks,
+    summarize_conversation,
+    summarize_messages,
+)
+from chibi.services.task_manager import task_manager
+from chibi.storage.local import LocalStorage
+
+USER_ID = 42
+THREAD_ID = 0
+
+
+def _conversation(turns: int) -> list[Message]:
+    messages = []
+    for i in range(turns):
+        messages.append(Message(role="user", content=f"question {i}"))
+        messages.append(Message(role="assistant", content=f"answer {i}"))
+    return messages
+
+
+def _summarizer(delay: float = 0.0) -> MagicMock:
+    async def get_chat_response(messages: list[Message], user, model=None, system_prompt=""):
+        await asyncio.sleep(delay)
+        prefix = "merged" if system_prompt == MERGE_SUMMARIES_PROMPT else "summary"
+        return ChatResponseSchema(
+            answer=f"{prefix} of {len(messages[0].content)} chars", provider="P", model="m", usage=None
+        ), []
+
+    provider = MagicMock()
+    provider.name = "Summarizer"
+    provider.get_chat_response = AsyncMock(side_effect=get_chat_response)
+    return provider
+
+
+@pytest.fixture
+def storage(tmp_path: Path):
+    storage = LocalStorage(storage_path=str(tmp_path))
+    with patch("chibi.storage.database._db_provider") as db_provider:
+        db_provider.get_database = AsyncMock(return_value=storage)
+        yield storage
+
+
+async def _store(storage: LocalStorage, messages: list[Message]) -> None:
+    user = await storage.get_or_create_user(user_id=USER_ID)
+    for message in messages:
+        await storage.add_message(user=user, message=message, ttl=None, thread_id=THREAD_ID)
+
+
+async def _history(storage: LocalStorage) -> list[Message]:
+    user = await storage.get_or_create_user(user_id=USER_ID)
+    return await storage.get_conversation_messages(user=user, thread_id=THREAD_ID)
+
+
+def test_history_rendering_skips_tool_results():
+    messages = [
+        Message(role="user", content="list files"),
+        Message(role="tool", content="a.txt\nb.txt", tool_call_id="call-1"),
+        Message(role="assistant", content="There are two files."),
+    ]
+    assert render_history(messages) == "user: list files\n\nassistant: There are two files."
+
+
+def test_split_into_chunks_keeps_the_order():
+    messages = _conversation(turns=20)
+    chunks = split_into_chunks(messages, chunk_tokens=messages[0].estimate_tokens * 6)
+    assert len(chunks) > 1
+    assert [message for chunk in chunks for message in chunk] == messages
+
+
+@pytest.mark.asyncio
+async def test_long_history_is_summarized_with_map_reduce():
+    provider = _summarizer()
+    messages = [Message(role="user", content="word " * 2000) for _ in range(5)]
+
+    with patch("chibi.services.summarization.gpt_settings.summarization_chunk_tokens", 1000):
+        summary = await summarize_messages(provider=provider, model="cheap", user=MagicMock(), messages=messages)
+
+    assert summary.startswith("merged")
+    prompts = [call.kwargs["system_prompt"] for call in provider.get_chat_response.await_args_list]
+    assert prompts.count(MERGE_SUMMARIES_PROMPT) >= 1
+    assert len(prompts) - prompts.count(MERGE_SUMMARIES_PROMPT) == 5
+    assert all(call.kwargs["model"] == "cheap" for call in provider.get_chat_response.await_args_list)
+
+
+@pytest.mark.asyncio
+async def test_conversation_is_swapped_keeping_the_latest_turns(storage: LocalStorage):
+    await _store(storage, _conversation(turns=5))
+    provider = _summarizer()
+
+    with patch("chibi.services.summarization._get_summarization_model", return_value=(provider, None)):
+        assert await summarize_conversation(user_id=USER_ID, thread_id=THREAD_ID)
+
+    history = await _history(storage)
+    assert [message.pinned for message in history[:2]] == [True, True]
+    assert history[1].content.startswith("summary")
+    assert [message.content for message in history[2:]] == ["question 3", "answer 3", "question 4", "answer 4"]
+    provider.get_chat_response.assert_awaited_once()
+
+
+async def _summarize() -> bool:
+    return await summarize_conversation(user_id=USER_ID, thread_id=THREAD_ID)
+
+
+@pytest.mark.asyncio
+async def test_messages_added_during_summarization_are_kept(storage: LocalStorage):
+    await _store(storage, _conversation(turns=4))
+    provider = _summarizer(delay=0.05)
+
+    with patch("chibi.services.summarization._get_summarization_model", return_value=(provider, None)):
+        task: asyncio.Task[bool] = asyncio.create_task(_summarize())
+        await asyncio.sleep(0.01)
+        await _store(storage, _conversation(turns=1))
+        assert await task
+
+    history = await _history(storage)
+    assert [message.content for message in history[-2:]] == ["question 0", "answer 0"]
+    assert len(history) == 2 + 4 + 2
+
+
+@pytest.mark.asyncio
+async def test_summary_is_discarded_if_the_history_was_reset(storage: LocalStorage):
+    await _store(storage, _conversation(turns=4))
+    provider = _summarizer(delay=0.05)
+
+    with patch("chibi.services.summarization._get_summarization_model", return_value=(provider, None)):
+        task: asyncio.Task[bool] = asyncio.create_task(_summarize())
+        await asyncio.sleep(0.01)
+        await storage.drop_messages(user=await storage.get_or_create_user(user_id=USER_ID), thread_id=THREAD_ID)
+        await _store(storage, [Message(role="user", content="new topic")])
+        assert not await task
+
+    assert [message.content for message in await _history(storage)] == ["new topic"]
+
+
+@pytest.mark.asyncio
+async def test_empty_summary_is_discarded(storage: LocalStorage):
+    await _store(storage, _conversation(turns=5))
+    provider = _summarizer()
+    provider.get_chat_response.side_effect = None
+    provider.get_chat_response.return_value = (
+        ChatResponseSchema(answer=" \n", provider="P", model="m", usage=None),
+        [],
+    )
+
+    with patch("chibi.services.summarization._get_summarization_model", return_value=(provider, None)):
+        assert not await summarize_conversation(user_id=USER_ID, thread_id=THREAD_ID)
+
+    assert [message.content for message in await _history(storage)] == [
+        message.content for message in _conversation(turns=5)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_short_conversation_is_not_summarized(storage: LocalStorage):
+    await _store(storage, _conversation(turns=2))
+    provider = _summarizer()
+
+    with patch("chibi.services.summarization._get_summarization_model", return_value=(provider, None)):
+        assert not await summarize_conversation(user_id=USER_ID, thread_id=THREAD_ID)
+    provider.get_chat_response.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_summarization_is_scheduled_once_per_thread():
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def summarize(user_id: int, thread_id: int) -> bool:
+        started.set()
+        await release.wait()
+        return True
+
+    summarizer = HistorySummarizer()
+    with (
+        patch.object(task_manager, "_shutting_down", False),
+        patch("chibi.services.summarization.summarize_conversation", side_effect=summarize) as summarize_mock,
+    ):
+        assert summarizer.schedule(user_id=USER_ID, thread_id=THREAD_ID)
+        await started.wait()
+        assert not summarizer.schedule(user_id=USER_ID, thread_id=THREAD_ID)
+        release.set()
+        await asyncio.sleep(0.01)
+        assert summarizer.schedule(user_id=USER_ID, thread_id=THREAD_ID)
+        await asyncio.sleep(0.01)
+
+    assert summarize_mock.call_count == 2
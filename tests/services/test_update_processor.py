@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any
+
+import pytest
+from telegram import Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from chibi.services.update_processor import ChatOrderedUpdateProcessor
+from tests.conftest import FakeBotAPI
+
+BOT_API_LATENCY = 0.02
+
+
+def _update(update_id: int, chat_id: int, bot: Any) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+        "text": f"message {update_id}",
+    }
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+async def _process(concurrency: int, chats: int, updates_per_chat: int) -> tuple[float, dict[int, list[int]]]:
+    """Feed the updates of all the chats interleaved, each handled with one Bot API call.
+
+    Returns:
+        Updates processed per second and the processing order of the updates of each chat.
+    """
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=concurrency, max_pending_updates=1024)
+    app = (
+        Application.builder()
+        .token("1:test")
+        .request(FakeBotAPI(latency=BOT_API_LATENCY))
+        .get_updates_request(FakeBotAPI())
+        .updater(None)
+        .concurrent_updates(processor)
+        .build()
+    )
+    processed: dict[int, list[int]] = {}
+    done = asyncio.Event()
+    total = chats * updates_per_chat
+
+    async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        assert update.effective_chat and update.effective_message
+        await update.effective_chat.send_message("ok")
+        processed.setdefault(update.effective_chat.id, []).append(update.effective_message.message_id)
+        if sum(map(len, processed.values())) == total:
+            done.set()
+
+    app.add_handler(MessageHandler(filters.TEXT, reply))
+    async with app:
+        await app.start()
+        started = time.perf_counter()
+        for i in range(updates_per_chat):
+            for chat_id in range(1, chats + 1):
+                await app.update_queue.put(_update(update_id=i * chats + chat_id, chat_id=chat_id, bot=app.bot))
+        await asyncio.wait_for(done.wait(), timeout=30)
+        elapsed = time.perf_counter() - started
+        await app.stop()
+    return total / elapsed, processed
+
+
+@pytest.mark.asyncio
+async def test_updates_per_second_scale_with_concurrency():
+    chats, updates_per_chat = 16, 4
+    throughput = {}
+    for concurrency in (1, 4, 16):
+        throughput[concurrency], processed = await _process(concurrency, chats, updates_per_chat)
+        for chat_id, message_ids in processed.items():
+            assert message_ids == sorted(message_ids), f"chat {chat_id} updates processed out of order"
+
+    rounded = {key: round(value) for key, value in throughput.items()}
+    assert throughput[4] > throughput[1] * 2, f"updates/s by concurrency: {rounded}"
+    assert throughput[16] > throughput[4] * 2, f"updates/s by concurrency: {rounded}"
+
+
+@pytest.mark.asyncio
+async def test_one_chat_is_processed_sequentially():
+    updates_per_second, processed = await _process(concurrency=16, chats=1, updates_per_chat=8)
+
+    assert processed == {1: list(range(1, 9))}
+    # One Bot API call at a time: a busy chat does not run its updates concurrently.
+    assert updates_per_second < 1 / BOT_API_LATENCY
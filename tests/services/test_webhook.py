@@ -0,0 +1,114 @@
+import asyncio
+import socket
+
+import pytest
+from aiohttp import ClientSession
+from telegram import Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from chibi.services.update_processor import ChatOrderedUpdateProcessor
+from chibi.services.webhook import SECRET_TOKEN_HEADER, WebhookServer
+from tests.conftest import FakeBotAPI
+
+SECRET = "s3cr3t"
+
+
+async def _post_update(url: str, update_id: int, secret_token: str = SECRET, chat_id: int = 1) -> int:
+    """Deliver the update to the webhook, as Telegram does."""
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+        "text": f"message {update_id}",
+    }
+    async with ClientSession() as session:
+        response = await session.post(
+            url,
+            json={"update_id": update_id, "message": message},
+            headers={SECRET_TOKEN_HEADER: secret_token},
+        )
+        return response.status
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _build_application(api: FakeBotAPI, queue_size: int = 16, max_pending_updates: int = 16) -> Application:
+    return (
+        Application.builder()
+        .token("1:test")
+        .request(api)
+        .get_updates_request(api)
+        .updater(None)
+        .update_queue(asyncio.Queue(maxsize=queue_size))
+        .concurrent_updates(
+            ChatOrderedUpdateProcessor(max_concurrent_updates=4, max_pending_updates=max_pending_updates)
+        )
+        .build()
+    )
+
+
+@pytest.mark.asyncio
+async def test_updates_are_acknowledged_before_processing():
+    api = FakeBotAPI()
+    app = _build_application(api)
+    processed: list[int] = []
+    release = asyncio.Event()
+
+    async def slow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await release.wait()
+        processed.append(update.update_id)
+
+    app.add_handler(MessageHandler(filters.TEXT, slow_handler))
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/telegram"
+    server = WebhookServer(application=app, url=url, secret_token=SECRET, listen="127.0.0.1", port=port)
+
+    async with app:
+        await app.start()
+        await server.start()
+        try:
+            assert ("setWebhook", {"url": url, "secret_token": SECRET}) in [
+                (method, {key: params.get(key) for key in ("url", "secret_token")}) for method, params in api.calls
+            ]
+
+            assert await _post_update(url, update_id=1) == 200
+            assert await _post_update(url, update_id=2, chat_id=2) == 200
+            assert await _post_update(url, update_id=3, secret_token="wrong") == 403
+            assert processed == []
+
+            release.set()
+            for _ in range(100):
+                if len(processed) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert sorted(processed) == [1, 2]
+        finally:
+            await server.stop()
+            await app.stop()
+
+
+@pytest.mark.asyncio
+async def test_backpressure_and_invalid_updates():
+    api = FakeBotAPI()
+    # Not started: nothing takes the updates out of the intake queue.
+    app = _build_application(api, queue_size=2)
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/telegram"
+    server = WebhookServer(application=app, url=url, secret_token=SECRET, listen="127.0.0.1", port=port)
+
+    async with app:
+        await server.start()
+        try:
+            assert [await _post_update(url, update_id=i) for i in range(1, 4)] == [200, 200, 429]
+            assert app.update_queue.qsize() == 2
+
+            async with ClientSession() as session:
+                response = await session.post(url, data="not json", headers={SECRET_TOKEN_HEADER: SECRET})
+                assert response.status == 400
+        finally:
+            await server.stop()
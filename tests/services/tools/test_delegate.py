@@ -0,0 +1,83 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from chibi.schemas.app import ChatResponseSchema, ModelChangeSchema
+from chibi.services.providers.tools.common import DelegateManyTool, DelegateTool
+
+
+@pytest.fixture
+def sub_agent():
+    response = ChatResponseSchema(answer="done", provider="OpenAI", model="gpt-5-nano", usage=None)
+    with patch(
+        "chibi.services.providers.tools.common.get_sub_agent_response", AsyncMock(return_value=response)
+    ) as mock:
+        yield mock
+
+
+@pytest.mark.asyncio
+async def test_model_is_picked_by_routing_if_not_specified(sub_agent: AsyncMock):
+    picked = ModelChangeSchema(provider="OpenAI", name="gpt-5-nano", image_generation=False)
+    with patch("chibi.services.providers.tools.common.pick_model", AsyncMock(return_value=picked)) as pick_model:
+        result = await DelegateTool.function(
+            prompt="Extract the dates",
+            task_class="light",
+            timeout=60,
+            user_id=1,
+            caller_model="gpt-5",
+            caller_provider="OpenAI",
+        )
+
+    assert result == {"response": "done"}
+    pick_model.assert_awaited_once_with(user_id=1, task_class="light", budget=60)
+    assert sub_agent.call_args.kwargs["model_name"] == "gpt-5-nano"
+
+
+@pytest.mark.asyncio
+async def test_caller_model_is_used_if_routing_picks_nothing(sub_agent: AsyncMock):
+    with patch("chibi.services.providers.tools.common.pick_model", AsyncMock(return_value=None)):
+        await DelegateTool.function(
+            prompt="Do it", user_id=1, caller_model="claude-sonnet-4-5", caller_provider="Anthropic"
+        )
+
+    assert sub_agent.call_args.kwargs["model_name"] == "claude-sonnet-4-5"
+    assert sub_agent.call_args.kwargs["provider_name"] == "Anthropic"
+
+
+@pytest.mark.asyncio
+async def test_delegate_many_runs_bounded_fan_out_and_aggregates_results():
+    running = 0
+    peak = 0
+
+    async def sub_agent(prompt: str, **kwargs) -> ChatResponseSchema:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # The later tasks finish first, the results must keep the order of the prompts anyway.
+        await asyncio.sleep(0.01 * (10 - int(prompt)))
+        running -= 1
+        if prompt == "3":
+            raise ValueError("sub-agent failed")
+        return ChatResponseSchema(answer=f"done {prompt}", provider="OpenAI", model="gpt-5-nano", usage=None)
+
+    with (
+        patch("chibi.services.providers.tools.common.get_sub_agent_response", sub_agent),
+        patch("chibi.services.providers.tools.common.pick_model", AsyncMock(return_value=None)) as pick_model,
+        patch("chibi.services.providers.tools.common.gpt_settings.delegate_many_max_concurrency", 2),
+    ):
+        result = await DelegateManyTool.function(
+            prompts=[str(index) for index in range(1, 7)],
+            task_class="light",
+            user_id=1,
+            caller_model="gpt-5",
+            caller_provider="OpenAI",
+        )
+
+    assert peak == 2
+    pick_model.assert_awaited_once()
+    assert result["succeeded"] == 5
+    assert result["failed"] == 1
+    assert [item["task"] for item in result["results"]] == [1, 2, 3, 4, 5, 6]
+    assert result["results"][0] == {"task": 1, "status": "ok", "response": "done 1"}
+    assert result["results"][2] == {"task": 3, "status": "error", "error": "sub-agent failed"}
@@ -0,0 +1,150 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from chibi.services.providers.tools.scheduler import ToolCallBatch, ToolScheduler, current_tool_call_batch
+from chibi.services.providers.tools.tool import ChibiTool
+from chibi.utils.app import SingletonMeta
+
+
+@pytest.fixture(autouse=True)
+def scheduler():
+    SingletonMeta._instances.pop(ToolScheduler, None)
+    yield ToolScheduler()
+    SingletonMeta._instances.pop(ToolScheduler, None)
+
+
+class LimitedTool(ChibiTool):
+    register = False
+    name = "limited_tool"
+    max_concurrency_per_user = 2
+    running = 0
+    peak = 0
+
+    @classmethod
+    async def function(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        cls.running += 1
+        cls.peak = max(cls.peak, cls.running)
+        await asyncio.sleep(0.01)
+        cls.running -= 1
+        return {"user_id": kwargs["user_id"]}
+
+
+class SlowTool(ChibiTool):
+    register = False
+    name = "slow_tool"
+    default_timeout = 0.01
+    cancellation_group = "test"
+
+    @classmethod
+    async def function(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        await asyncio.Event().wait()
+        return {}
+
+
+class FailingTool(ChibiTool):
+    register = False
+    name = "failing_tool"
+    cancellation_group = "test"
+
+    @classmethod
+    async def function(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        await asyncio.sleep(0)
+        raise ValueError("broken")
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_limited_per_user(scheduler: ToolScheduler):
+    results = await asyncio.gather(*(LimitedTool._get_tool_call_result(user_id=1) for _ in range(6)))
+
+    assert all(result.status == "ok" for result in results)
+    assert LimitedTool.peak == 2
+    stats = scheduler.stats()["limited_tool"]
+    assert stats["calls"] == 6
+    assert stats["wait_p95"] > 0
+
+    LimitedTool.peak = 0
+    await asyncio.gather(*(LimitedTool._get_tool_call_result(user_id=user_id) for user_id in (1, 2, 3)))
+    assert LimitedTool.peak == 3
+
+
+class NestingTool(ChibiTool):
+    register = False
+    name = "nesting_tool"
+    max_concurrency_per_user = 1
+    cancellation_group = "delegation"
+
+    @classmethod
+    async def function(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        depth = kwargs["depth"]
+        if depth:
+            response = await cls._get_tool_call_result(user_id=kwargs["user_id"], depth=depth - 1)
+            assert isinstance(response.result, dict)
+            return {"depth": response.result["depth"] + 1}
+        return {"depth": 0}
+
+
+@pytest.mark.asyncio
+async def test_nested_calls_do_not_wait_for_the_user_slots():
+    # Like delegate_task called by a sub-agent: the outer call holds the only user slot.
+    result = await asyncio.wait_for(NestingTool._get_tool_call_result(user_id=1, depth=3), timeout=1)
+
+    assert result.status == "ok"
+    assert result.result == {"depth": 3}
+
+
+class FanOutTool(ChibiTool):
+    register = False
+    name = "fan_out_tool"
+    cancellation_group = "delegation"
+
+    @classmethod
+    async def function(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        await asyncio.gather(*(LimitedTool._get_tool_call_result(user_id=kwargs["user_id"]) for _ in range(6)))
+        return {}
+
+
+@pytest.mark.asyncio
+async def test_nested_leaf_tools_are_limited_per_user():
+    LimitedTool.peak = 0
+    # Like the sub-agents of delegate_many calling the same tool.
+    await asyncio.gather(FanOutTool._get_tool_call_result(user_id=1), FanOutTool._get_tool_call_result(user_id=1))
+
+    assert LimitedTool.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_tool_times_out():
+    result = await SlowTool._get_tool_call_result(user_id=1)
+
+    assert result.status == "error"
+    assert "timed out" in str(result.result)
+
+
+@pytest.mark.asyncio
+async def test_failed_call_cancels_its_group(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(SlowTool, "default_timeout", None)
+    token = current_tool_call_batch.set(ToolCallBatch())
+    try:
+        slow, failed = await asyncio.wait_for(
+            asyncio.gather(SlowTool._get_tool_call_result(user_id=1), FailingTool._get_tool_call_result(user_id=1)),
+            timeout=1,
+        )
+        late = await SlowTool._get_tool_call_result(user_id=1)
+    finally:
+        current_tool_call_batch.reset(token)
+
+    assert failed.status == "error"
+    assert slow.status == late.status == "cancelled"
+    assert "failing_tool" in str(slow.result)
+
+
+@pytest.mark.asyncio
+async def test_failures_do_not_cancel_calls_outside_the_batch():
+    results = await asyncio.gather(
+        SlowTool._get_tool_call_result(user_id=1), FailingTool._get_tool_call_result(user_id=1)
+    )
+
+    assert [result.status for result in results] == ["error", "error"]
+    assert "timed out" in str(results[0].result)
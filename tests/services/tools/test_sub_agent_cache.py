@@ -0,0 +1,90 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from chibi.models import FunctionSchema, Message, ToolSchema
+from chibi.schemas.app import ChatResponseSchema, UsageSchema
+from chibi.services.providers.tools.utils import SubAgentCache, get_side_effecting_tools, get_sub_agent_response
+from chibi.utils.app import SingletonMeta
+
+
+def _tool_call_message(*tool_names: str) -> Message:
+    return Message(
+        role="assistant",
+        content="",
+        tool_calls=[
+            ToolSchema(id=f"call_{index}", function=FunctionSchema(name=name, arguments="{}"))
+            for index, name in enumerate(tool_names)
+        ],
+    )
+
+
+@pytest.fixture
+def provider():
+    provider = MagicMock()
+    provider.get_chat_response = AsyncMock()
+    user = MagicMock(working_dir="/home/chibi")
+    user.providers.get.return_value = provider
+    db = MagicMock()
+    db.get_or_create_user = AsyncMock(return_value=user)
+
+    SingletonMeta._instances.pop(SubAgentCache, None)
+    with (
+        patch("chibi.storage.database._db_provider") as db_provider,
+        patch("chibi.services.providers.tools.utils.gpt_settings.sub_agent_cache", True),
+    ):
+        db_provider.get_database = AsyncMock(return_value=db)
+        yield provider
+    SingletonMeta._instances.pop(SubAgentCache, None)
+
+
+def _respond(provider: MagicMock, answer: str, messages: list[Message]) -> None:
+    response = ChatResponseSchema(answer=answer, provider="OpenAI", model="gpt-5-nano", usage=UsageSchema())
+    provider.get_chat_response.return_value = (response, messages)
+
+
+def test_side_effecting_tools():
+    messages = [_tool_call_message("read_web_page", "create_file"), _tool_call_message("unknown_mcp_tool")]
+    assert get_side_effecting_tools(messages) == ["create_file", "unknown_mcp_tool"]
+    assert get_side_effecting_tools([_tool_call_message("read_web_page", "get_current_datetime")]) == []
+
+
+@pytest.mark.asyncio
+async def test_read_only_results_are_memoized(provider: MagicMock):
+    _respond(provider, "42", [_tool_call_message("read_web_page")])
+
+    first = await get_sub_agent_response(
+        prompt="Find  the answer\n", user_id=1, provider_name="OpenAI", model_name="gpt-5-nano"
+    )
+    second = await get_sub_agent_response(
+        prompt="Find the answer", user_id=1, provider_name="OpenAI", model_name="gpt-5-nano"
+    )
+
+    assert first.answer == second.answer == "42"
+    assert second.usage is None
+    assert provider.get_chat_response.await_count == 1
+    assert SubAgentCache().hits == 1
+
+    await get_sub_agent_response(prompt="Find the answer", user_id=1, provider_name="OpenAI", model_name="gpt-5")
+    assert provider.get_chat_response.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_side_effecting_results_are_not_memoized(provider: MagicMock):
+    _respond(provider, "Done", [_tool_call_message("read_file", "replace_in_file")])
+
+    for _ in range(2):
+        await get_sub_agent_response(prompt="Fix the typo", user_id=1, provider_name="OpenAI", model_name="gpt-5-nano")
+
+    assert provider.get_chat_response.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_is_opt_in(provider: MagicMock):
+    _respond(provider, "42", [])
+
+    with patch("chibi.services.providers.tools.utils.gpt_settings.sub_agent_cache", False):
+        for _ in range(2):
+            await get_sub_agent_response(prompt="Answer", user_id=1, provider_name="OpenAI", model_name="gpt-5-nano")
+
+    assert provider.get_chat_response.await_count == 2
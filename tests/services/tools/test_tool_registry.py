@@ -0,0 +1,74 @@
+from openai.types.chat import ChatCompletionToolParam
+from openai.types.shared_params import FunctionDefinition
+
+from chibi.services.providers.anthropic import Anthropic
+from chibi.services.providers.gemini_native import Gemini
+from chibi.services.providers.tools.tool import ChibiTool, RegisteredChibiTools
+
+
+def _make_tool(tool_name: str) -> type[ChibiTool]:
+    return type(
+        "DynamicTestTool",
+        (ChibiTool,),
+        {
+            "register": True,
+            "name": tool_name,
+            "definition": ChatCompletionToolParam(
+                type="function",
+                function=FunctionDefinition(
+                    name=tool_name,
+                    description="Test tool",
+                    parameters={"type": "object", "properties": {}, "required": []},
+                ),
+            ),
+        },
+    )
+
+
+def test_tool_definitions_are_memoized_until_registry_changes():
+    first = RegisteredChibiTools.get_tool_definitions()
+    assert RegisteredChibiTools.get_tool_definitions() is first
+
+    version = RegisteredChibiTools.version
+    _make_tool("registry_test_tool")
+    try:
+        assert RegisteredChibiTools.version == version + 1
+        updated = RegisteredChibiTools.get_tool_definitions()
+        assert updated is not first
+        assert "registry_test_tool" in [definition["function"]["name"] for definition in updated]
+    finally:
+        RegisteredChibiTools.deregister_tools(["registry_test_tool"])
+
+    assert RegisteredChibiTools.version == version + 2
+    assert "registry_test_tool" not in [
+        definition["function"]["name"] for definition in RegisteredChibiTools.get_tool_definitions()
+    ]
+
+
+def test_deregistering_unknown_tool_keeps_version():
+    version = RegisteredChibiTools.version
+    RegisteredChibiTools.deregister_tools(["no_such_tool"])
+    assert RegisteredChibiTools.version == version
+
+
+def test_provider_tool_lists_are_translated_once_per_version():
+    anthropic = Anthropic(token="test")
+    gemini = Gemini(token="test")
+
+    anthropic_tools = anthropic.tools_list
+    gemini_tools = gemini.tools_list
+    assert Anthropic(token="other").tools_list is anthropic_tools
+    assert gemini.tools_list is gemini_tools
+    assert len(anthropic_tools) == len(gemini_tools) == len(RegisteredChibiTools.tools_map)
+
+    snapshot = anthropic.tools_snapshot
+    assert snapshot.version == RegisteredChibiTools.version
+    assert snapshot.serialized.startswith("[")
+
+    _make_tool("registry_translation_test_tool")
+    try:
+        assert anthropic.tools_list is not anthropic_tools
+        assert anthropic.tools_list[-1]["name"] == "registry_translation_test_tool"
+        assert gemini.tools_list is not gemini_tools
+    finally:
+        RegisteredChibiTools.deregister_tools(["registry_translation_test_tool"])
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from chibi.models import Message
+from chibi.services.providers.tools.exceptions import ToolException
+from chibi.services.providers.tools.memory import FetchToolResultTool
+from chibi.services.providers.tools.schemas import ToolResponseSchema
+from chibi.services.providers.tools.utils import spill_large_tool_results
+from chibi.storage.blobs import BlobStore
+from chibi.utils.app import SingletonMeta
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path: Path):
+    SingletonMeta._instances.pop(BlobStore, None)
+    with (
+        patch("chibi.storage.blobs.application_settings.local_data_path", str(tmp_path)),
+        patch("chibi.storage.blobs.application_settings.redis", None),
+        patch("chibi.services.providers.tools.utils.gpt_settings.tool_result_spill_threshold", 1000),
+        patch("chibi.services.providers.tools.utils.gpt_settings.tool_result_preview_chars", 100),
+    ):
+        yield BlobStore()
+    SingletonMeta._instances.pop(BlobStore, None)
+
+
+def _tool_message(result: str) -> Message:
+    response = ToolResponseSchema(tool_name="read_web_page", status="ok", result={"data": result})
+    return Message(role="tool", content=response.model_dump_json(), tool_call_id="call_1", tool_name="read_web_page")
+
+
+@pytest.mark.asyncio
+async def test_large_tool_result_is_replaced_with_reference():
+    page = "".join(f"line {index}\n" for index in range(1000))
+    small = _tool_message("short page")
+    large = _tool_message(page)
+    large_tokens = large.estimate_tokens  # Counted during the turn, before the history is saved.
+
+    prepared = await spill_large_tool_results(user_id=1, messages=[small, large])
+
+    assert prepared[0] is small
+    assert prepared[1].id == large.id
+    assert prepared[1].estimate_tokens < large_tokens / 10
+    assert prepared[1].tool_call_id == "call_1"
+    assert len(prepared[1].content) < 1000
+    reference = json.loads(prepared[1].content)
+    assert reference["tool_name"] == "read_web_page"
+    assert reference["result"]["preview"] == json.dumps({"data": page})[:100]
+    handle = reference["result"]["handle"]
+    assert handle in reference["additional_details"]
+
+    first = await FetchToolResultTool.function(handle=handle, length=500, user_id=1)
+    second = await FetchToolResultTool.function(handle=handle, offset=first["next_offset"], length=100000, user_id=1)
+    assert json.loads(first["content"] + second["content"]) == {"data": page}
+    assert "next_offset" not in second
+
+    with pytest.raises(ToolException):
+        await FetchToolResultTool.function(handle=handle, user_id=2)
+
+
+@pytest.mark.asyncio
+async def test_background_tool_response_is_spilled():
+    tool_response = ToolResponseSchema(tool_name="delegate_task", status="ok", result={"response": "x" * 5000})
+    message = Message(
+        role="user", content=json.dumps({"type": "tool response", "tool_response": tool_response.model_dump()})
+    )
+
+    [prepared] = await spill_large_tool_results(user_id=1, messages=[message])
+
+    payload = json.loads(prepared.content)
+    assert payload["type"] == "tool response"
+    assert payload["tool_response"]["result"]["size_bytes"] == len(json.dumps({"response": "x" * 5000}))
+
+
+@pytest.mark.asyncio
+async def test_spilling_can_be_disabled():
+    message = _tool_message("x" * 5000)
+    with patch("chibi.services.providers.tools.utils.gpt_settings.tool_result_spill_threshold", 0):
+        assert await spill_large_tool_results(user_id=1, messages=[message]) == [message]
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_dropped_with_the_thread_history(blob_store: BlobStore):
+    handle = await blob_store.put(user_id=1, data=b"result", thread_id=5)
+    await blob_store.put(user_id=1, data=b"result", thread_id=6)
+    assert await blob_store.get(user_id=1, handle=handle, thread_id=5) == b"result"
+    assert await blob_store.get(user_id=1, handle=handle) is None
+
+    await blob_store.drop(user_id=1, thread_id=5)
+
+    assert await blob_store.get(user_id=1, handle=handle, thread_id=5) is None
+    assert await blob_store.get(user_id=1, handle=handle, thread_id=6) == b"result"
+
+
+@pytest.mark.asyncio
+async def test_expired_local_blobs_are_swept(blob_store: BlobStore, tmp_path: Path):
+    old = await blob_store.put(user_id=1, data=b"old")
+    reused = await blob_store.put(user_id=1, data=b"reused")
+    an_hour_ago = time.time() - 3600
+    for path in (tmp_path / "blobs").rglob("*"):
+        if path.is_file():
+            os.utime(path, (an_hour_ago, an_hour_ago))
+
+    with patch("chibi.storage.blobs.gpt_settings.max_conversation_age_minutes", 30):
+        # Stored again: expires with the new message.
+        assert await blob_store.put(user_id=1, data=b"reused") == reused
+        blob_store._swept_at = 0.0
+        await blob_store.put(user_id=1, data=b"new")
+
+    assert await blob_store.get(user_id=1, handle=old) is None
+    assert await blob_store.get(user_id=1, handle=reused) == b"reused"
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_copied_with_the_thread(blob_store: BlobStore):
+    handle = await blob_store.put(user_id=1, data=b"result", thread_id=5)
+
+    await blob_store.copy(user_id=1, from_thread_id=5, to_thread_id=7)
+    await blob_store.drop(user_id=1, thread_id=5)
+
+    assert await blob_store.get(user_id=1, handle=handle, thread_id=7) == b"result"
+    # Sub-agents look in all the threads of the user.
+    assert await blob_store.get(user_id=1, handle=handle, thread_id=None) == b"result"
+    assert await blob_store.get(user_id=2, handle=handle, thread_id=None) is None
@@ -0,0 +1,166 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from chibi.models import FunctionSchema, Message, ToolSchema
+from chibi.services.providers.anthropic import Anthropic
+from chibi.services.providers.tools.common import SearchToolsTool
+from chibi.services.providers.tools.selection import BM25Index, ToolSelector, current_tool_selection, select_tools
+from chibi.services.providers.tools.tool import RegisteredChibiTools
+from chibi.utils.app import SingletonMeta
+
+
+@pytest.fixture(autouse=True)
+def selector():
+    SingletonMeta._instances.pop(ToolSelector, None)
+    with (
+        patch("chibi.services.providers.tools.selection.gpt_settings.tool_selection", True),
+        patch("chibi.services.providers.tools.selection.gpt_settings.tool_selection_max_tools", 3),
+    ):
+        yield ToolSelector()
+    SingletonMeta._instances.pop(ToolSelector, None)
+
+
+def _user(skills: dict[str, str] | None = None) -> MagicMock:
+    return MagicMock(llm_skills=skills or {})
+
+
+def _tool_call(name: str, arguments: str = "{}") -> Message:
+    return Message(
+        role="assistant",
+        content="",
+        tool_calls=[ToolSchema(id="call_1", function=FunctionSchema(name=name, arguments=arguments))],
+    )
+
+
+def test_bm25_ranks_relevant_documents_first():
+    index = BM25Index(
+        {
+            "send_image": "send image to the user by url",
+            "send_audio": "send audio file to the user",
+            "read_web_page": "read the content of the web page",
+        }
+    )
+    assert index.search("please send this picture image", limit=2) == ["send_image", "send_audio"]
+    assert index.search("unrelated words", limit=2) == []
+
+
+def test_selection_consists_of_core_called_and_relevant_tools(selector: ToolSelector):
+    messages = [
+        Message(role="user", content="Generate a picture of a cat and send the image to me"),
+        _tool_call("rename_thread"),
+        _tool_call("search_tools", '{"query": "transcribe pdf document ocr"}'),
+    ]
+    with select_tools(messages=messages, user=_user()) as selection:
+        assert selection is not None
+        assert current_tool_selection.get() is selection
+
+    assert {"get_current_datetime", "search_tools", "delegate_task"} <= selection.names
+    assert {"generate_image", "send_image", "rename_thread", "ocr_pdf"} <= selection.names
+    assert "send_video" not in selection.names
+    assert current_tool_selection.get() is None
+
+
+def test_selected_definitions_are_sent_and_memoized():
+    anthropic = Anthropic(token="test")
+    all_tools = anthropic.tools_list
+
+    with select_tools(messages=[Message(role="user", content="Send me the audio")], user=_user()) as selection:
+        assert selection is not None
+        openai_names = [definition["function"]["name"] for definition in RegisteredChibiTools.get_tool_definitions()]
+        anthropic_tools = anthropic.tools_list
+
+    assert set(openai_names) == selection.names
+    assert "send_audio" in openai_names
+    assert [tool["name"] for tool in anthropic_tools] == openai_names
+    assert len(anthropic_tools) < len(all_tools)
+
+    with select_tools(messages=[Message(role="user", content="Send me the audio")], user=_user()):
+        assert anthropic.tools_list is anthropic_tools
+
+
+def test_selection_is_sticky_per_conversation(selector: ToolSelector):
+    user = _user()
+    user.id = 1
+    interface = MagicMock(thread_id=0)
+
+    with select_tools(
+        messages=[Message(role="user", content="Send me the audio")], user=user, interface=interface
+    ) as first:
+        assert first is not None
+        first_definitions = RegisteredChibiTools.get_tool_definitions()
+    with select_tools(
+        messages=[Message(role="user", content="Show me a video")], user=user, interface=interface
+    ) as second:
+        assert second is not None
+        second_definitions = RegisteredChibiTools.get_tool_definitions()
+
+    # The tools of the previous turn stay, the new ones are appended: the definitions sent before are the prefix.
+    assert "send_audio" in second.names and "send_video" in second.names
+    assert second.order[: len(first.order)] == first.order
+    assert second_definitions[: len(first_definitions)] == first_definitions
+
+    # Other threads select from scratch, and a reset conversation starts over.
+    with select_tools(
+        messages=[Message(role="user", content="Show me a video")], user=user, interface=MagicMock(thread_id=1)
+    ) as other:
+        assert other is not None and "send_audio" not in other.names
+    selector.forget(user_id=1, thread_id=0)
+    with select_tools(
+        messages=[Message(role="user", content="Show me a video")], user=user, interface=interface
+    ) as reset:
+        assert reset is not None and "send_audio" not in reset.names
+
+
+def test_idle_tools_are_dropped_every_idle_turns(selector: ToolSelector):
+    user = _user()
+    user.id = 1
+    interface = MagicMock(thread_id=0)
+    orders = []
+    with patch("chibi.services.providers.tools.selection.gpt_settings.tool_selection_idle_turns", 2):
+        for text in ("Send me the audio", "Show me a video", "Show me a video"):
+            with select_tools(
+                messages=[Message(role="user", content=text)], user=user, interface=interface
+            ) as selection:
+                assert selection is not None
+                orders.append(selection.order)
+
+    # The unused tool stays until the next multiple of the idle turns, then the whole prefix is rewritten once.
+    assert "send_audio" in orders[1] and orders[1][: len(orders[0])] == orders[0]
+    assert "send_audio" not in orders[2] and "send_video" in orders[2]
+    assert {"get_current_datetime", "search_tools"} <= set(orders[2])
+
+
+def test_selections_of_least_recent_conversations_are_evicted(selector: ToolSelector):
+    user = _user()
+    user.id = 1
+    with patch("chibi.services.providers.tools.selection.SELECTIONS_MAXSIZE", 2):
+        for thread_id in range(3):
+            with select_tools(
+                messages=[Message(role="user", content="Hi")], user=user, interface=MagicMock(thread_id=thread_id)
+            ):
+                pass
+    assert list(selector._selections) == [(1, 1), (1, 2)]
+
+
+@pytest.mark.asyncio
+async def test_search_tools_loads_tools_into_the_current_selection():
+    with select_tools(messages=[Message(role="user", content="Hi")], user=_user()) as selection:
+        assert selection is not None
+        assert "send_video" not in selection.names
+
+        result = await SearchToolsTool.function(query="send video to user")
+
+        assert "send_video" in [tool["name"] for tool in result["tools_found"]]
+        assert "send_video" in [
+            definition["function"]["name"] for definition in RegisteredChibiTools.get_tool_definitions()
+        ]
+
+
+def test_all_tools_are_sent_if_selection_disabled():
+    with (
+        patch("chibi.services.providers.tools.selection.gpt_settings.tool_selection", False),
+        select_tools(messages=[Message(role="user", content="Hi")], user=_user()) as selection,
+    ):
+        assert selection is None
+        assert len(RegisteredChibiTools.get_tool_definitions()) == len(RegisteredChibiTools.tools_map)
@@ -9,6 +9,7 @@ from chibi.storage.database import Database
 from chibi.storage.dynamodb import DynamoDBStorage
 from chibi.storage.local import LocalStorage
 from chibi.storage.redis import RedisStorage
+from chibi.utils.conversion import message_conversion_cache
 
 TABLE_USERS = "TestUsers"
 TABLE_MESSAGES = "TestMessages"
@@ -124,6 +125,24 @@ async def test_add_and_get_messages(storage: Database) -> None:
     assert messages[1]["content"] == message2.content
 
 
+async def test_message_ids_survive_round_trip(storage: Database) -> None:
+    user = await storage.get_or_create_user(123)
+    message = Message(role="assistant", content="Hi there!")
+    await storage.add_message(user=user, message=message, thread_id=0)
+
+    first = await storage.get_conversation_messages(user=user, thread_id=0)
+    second = await storage.get_conversation_messages(user=user, thread_id=0)
+
+    assert first[0].id == second[0].id == message.id
+    # Counted when saved, so never recounted after loading.
+    assert first[0].token_count is not None and first[0].token_count == message.estimate_tokens
+    # The converted messages are memoized across the history loads (turns).
+    message_conversion_cache.clear()
+    first[0].to_openai()
+    second[0].to_openai()
+    assert (message_conversion_cache.hits, message_conversion_cache.misses) == (1, 1)
+
+
 async def test_drop_messages(storage: Database) -> None:
     user_id = 123
     user = await storage.get_or_create_user(user_id)
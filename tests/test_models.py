@@ -1,11 +1,15 @@
 """Tests for chibi.models module."""
 
 import json
+from typing import cast
+from unittest.mock import patch
 
 from anthropic.types import MessageParam, ToolResultBlockParam, ToolUseBlockParam
 from google.genai.types import ContentDict, FunctionCallDict, FunctionResponseDict, PartDict
+from openai.types.chat import ChatCompletionAssistantMessageParam
 
-from chibi.models import FunctionSchema, Message, ToolSchema
+from chibi.models import FunctionSchema, Message, ToolSchema, User
+from chibi.utils.conversion import message_conversion_cache
 
 
 class TestMessageGoogleConversion:
@@ -358,3 +362,95 @@ class TestMessageAnthropicConversion:
         assert result.tool_call_id == "call_function_npanp5e9uv0s_1"
         assert result.tool_name == "ddgs_web_search"
         assert result.content == json.dumps(tool_result)
+
+
+class TestMessageConversionCache:
+    """Test memoization of the provider format conversions."""
+
+    def test_conversion_is_memoized_per_format(self):
+        """Test that a message is converted once per target format."""
+        message = Message(
+            role="assistant",
+            content="Let me check.",
+            tool_calls=[ToolSchema(id="call-1", function=FunctionSchema(name="ls", arguments='{"path": "."}'))],
+        )
+        with patch.object(Message, "_to_anthropic", autospec=True, side_effect=Message._to_anthropic) as convert:
+            first = message.to_anthropic()
+            second = message.to_anthropic()
+
+        assert first == second
+        assert convert.call_count == 1
+        payload = cast(ChatCompletionAssistantMessageParam, message.to_openai())
+        tool_calls = list(payload.get("tool_calls") or [])
+        assert tool_calls[0]["function"]["name"] == "ls"  # type: ignore[typeddict-item]
+
+    def test_changed_message_is_converted_again(self):
+        """Test that the cache is invalidated when the message changes."""
+        message = Message(role="user", content="Hello")
+        assert message.to_google() == {"role": "user", "parts": [{"text": "Hello"}]}
+
+        message.content = "Bye"
+        assert message.to_google() == {"role": "user", "parts": [{"text": "Bye"}]}
+
+    def test_cached_payload_is_not_modified_by_callers(self):
+        """Test that marking the messages with cache_control does not leak into the cache."""
+        from chibi.services.providers.prompt_cache import AnthropicCacheBreakpointPlanner
+
+        message = Message(role="assistant", content="Hello " * 2000)
+        messages = [Message(role="user", content="Hi").to_anthropic(), message.to_anthropic()]
+        messages.append(Message(role="user", content="Next question").to_anthropic())
+        _, _, plan = AnthropicCacheBreakpointPlanner(min_cacheable_tokens=100).apply(
+            tools=[], system=[], messages=messages
+        )
+
+        assert plan.message_indexes == [1]
+        assert "cache_control" in messages[1]["content"][-1]  # type: ignore[index]
+        assert "cache_control" not in message.to_anthropic()["content"][-1]  # type: ignore[index]
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used conversions are evicted."""
+        with patch.object(message_conversion_cache, "_maxsize", 2):
+            messages = [Message(role="user", content=str(i)) for i in range(3)]
+            for message in messages:
+                message.to_mistral()
+
+            assert (messages[0].id, "mistral") not in message_conversion_cache._payloads
+            assert (messages[2].id, "mistral") in message_conversion_cache._payloads
+
+
+class TestUserProvidersCache:
+    """Test reuse of the provider registries and instances."""
+
+    def test_providers_are_reused_between_users_and_turns(self):
+        """Test that users share the registry and the provider instances (with their SDK clients)."""
+        from chibi.services.providers import RegisteredProviders
+        from chibi.services.providers.openai import OpenAI
+
+        with patch.object(OpenAI, "api_key", "sk-shared"):
+            first, second = User(id=1), User(id=2)
+
+            assert first.providers is second.providers
+            provider = first.providers.get_instance(OpenAI)
+            assert isinstance(provider, OpenAI)
+            assert provider is second.providers.get_instance(OpenAI)
+            assert provider.client is provider.client
+
+            RegisteredProviders.invalidate(user_api_keys=first.tokens, stale_api_key="sk-shared")
+            new_provider = first.providers.get_instance(OpenAI)
+            assert new_provider is not None and new_provider is not provider
+
+    def test_registry_depends_on_user_keys_in_public_mode(self):
+        """Test that the registry is keyed by the user key set in public mode."""
+        from chibi.services.providers import RegisteredProviders
+
+        with patch("chibi.services.providers.provider.gpt_settings.public_mode", True):
+            first = User(id=1, tokens={"openai": "sk-1"})
+            second = User(id=2, tokens={"openai": "sk-1"})
+            third = User(id=3, tokens={"openai": "sk-2"})
+
+            assert first.providers is second.providers
+            assert first.providers is not third.providers
+
+            registry = first.providers
+            RegisteredProviders.invalidate(user_api_keys=registry.tokens)
+            assert first.providers is not registry
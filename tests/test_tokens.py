@@ -0,0 +1,75 @@
+"""Tests for chibi.utils.tokens module."""
+
+import base64
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from chibi.models import Message
+from chibi.utils.tokens import BPETokenCounter, HeuristicTokenCounter, get_token_counter
+
+
+@pytest.fixture
+def ranks_file(tmp_path: Path) -> Path:
+    merges = [b"he", b"ll", b"hell", b"hello", b" w", b"or"]
+    tokens = [bytes([i]) for i in range(256)] + merges
+    path = tmp_path / "tiny.tiktoken"
+    path.write_bytes(
+        b"\n".join(base64.b64encode(token) + b" " + str(rank).encode() for rank, token in enumerate(tokens))
+    )
+    return path
+
+
+def test_bpe_counter_merges_by_rank(ranks_file: Path):
+    counter = BPETokenCounter(ranks_file=str(ranks_file))
+
+    assert counter.name == "bpe:tiny"
+    assert counter.count("hello") == 1
+    # " world" -> " w" + "or" + "l" + "d"
+    assert counter.count("hello world") == 5
+    assert counter.count("") == 0
+
+
+def test_heuristic_counter_handles_code_cjk_and_json():
+    counter = HeuristicTokenCounter()
+
+    assert counter.count("Hello, world! This is a test.") == 9
+    assert counter.count("你好世界") == 4
+    assert counter.count('{"a": 1}') == 7
+    assert counter.count("1234567") == 3
+
+
+def test_invalid_tokenizer_file_falls_back_to_heuristics():
+    get_token_counter.cache_clear()
+    try:
+        with patch("chibi.utils.tokens.gpt_settings.tokenizer_file", "/nonexistent/cl100k_base.tiktoken"):
+            assert isinstance(get_token_counter(), HeuristicTokenCounter)
+    finally:
+        get_token_counter.cache_clear()
+
+
+def test_message_tokens_are_persisted_and_never_recounted():
+    message = Message(role="tool", content='{"result": [1, 2, 3]}', tool_call_id="call_1")
+    message.fill_token_count()
+    stored = message.model_dump_json()
+    tokens = message.estimate_tokens
+    assert tokens > 0
+
+    with patch.object(HeuristicTokenCounter, "count", side_effect=AssertionError("recounted")):
+        restored = Message.model_validate_json(stored)
+        restored.id += 1  # not in the memo
+        assert restored.token_count == tokens
+        assert restored.estimate_tokens == tokens
+        assert message.estimate_tokens == tokens
+
+
+def test_serialization_does_not_count_tokens():
+    message = Message(role="user", content="Hi!")
+    with patch.object(HeuristicTokenCounter, "count", side_effect=AssertionError("counted")):
+        assert message.model_dump()["token_count"] is None
+
+
+def test_token_count_is_not_sent_to_the_llm():
+    message = Message(role="user", content="Hi!")
+    assert "token_count" not in message.to_openai()